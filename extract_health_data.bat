@@ -25,7 +25,7 @@ echo ✅ 前提条件チェック完了
 echo.
 
 REM Pythonスクリプト実行
-python health_connect_data_extractor.py
+python health_connect_data_extractor.py %*
 
 echo.
 echo 処理が完了しました。何かキーを押してください...
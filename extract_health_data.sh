@@ -22,7 +22,7 @@ echo "✅ 前提条件チェック完了"
 echo ""
 
 # Pythonスクリプト実行
-python3 health_connect_data_extractor.py
+python3 health_connect_data_extractor.py "$@"
 
 echo ""
 echo "処理が完了しました。"
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Health Connect エクスポート 期間指定検索
+
+過去のエクスポート (JSON / NDJSON) ごとに、レコードのバイト位置を
+端末ID・データタイプ・時刻順に並べた索引ファイル (<エクスポート>.idx) を作成し、
+条件に合うレコードだけをファイルから読み込みます。ファイル全体を json.load しないため、
+数百MBのエクスポートでも検索は数ミリ秒で済みます。
+
+- 索引は初回の検索時に自動で作成する (エクスポートが更新された場合は作り直す)
+- エクスポートと索引はメモリマップで開き、索引は二分探索で検索範囲を求める
+- 日ごとの件数を索引に持つため、件数の集計はレコードを読まずに行える
+- save_data_to_file / stream_all_data_to_file が出力する1行1レコードの形式に対応
+  (旧形式の整形済みJSONは索引を作成できない)
+- 圧縮チャンク出力 (--format ndjson.gz / ndjson.zst) はマニフェスト (*_manifest.json) を指定する。
+  索引は作らず、マニフェストの期間で該当するチャンクだけを展開して走査する
+
+使用方法:
+python health_connect_archive_index.py query "health_connect_raw_data_*.json" "health_connect_raw_data_*_manifest.json" --type HeartRate [--device ID] [--start 2025-07-01] [--end 2025-07-08] [--count] [--output FILE]
+python health_connect_archive_index.py build health_connect_raw_data_*.json
+"""
+
+import argparse
+import bisect
+import contextlib
+import datetime
+import glob
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from typing import Dict, List, Any, Optional, Iterator
+
+from health_connect_data_extractor import (
+    to_epoch_millis, MANIFEST_SUFFIX, ChunkedReportWriter, open_chunk, select_chunks
+)
+
+INDEX_MAGIC = b'HCIDX1\n'
+INDEX_SUFFIX = '.idx'
+# 索引の1件: (timestamp, オフセット, 長さ)
+ENTRY = struct.Struct('<qqi')
+DAY_MS = 24 * 60 * 60 * 1000
+# StreamingReportWriter の出力はキーの順序が固定のため、先頭だけで判定できる
+RECORD_PREFIX = re.compile(rb'\{"dataType":("(?:[^"\\]|\\.)*"),"timestamp":(-?\d+|null)[,}]')
+JSON_INFO_PREFIX = b'"extractionInfo":'
+
+class ArchiveIndexError(Exception):
+    """索引を作成できないエクスポート"""
+
+class _TimestampView:
+    """索引の1系列を timestamp の配列として二分探索するためのビュー"""
+    
+    def __init__(self, buffer: Any, base: int, count: int):
+        self.buffer = buffer
+        self.base = base
+        self.count = count
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def __getitem__(self, position: int) -> int:
+        return ENTRY.unpack_from(self.buffer, self.base + position * ENTRY.size)[0]
+
+class ArchiveIndex:
+    """1つのエクスポートの索引 (作成・読み込み・検索)"""
+    
+    def __init__(self, export_file: str, rebuild: bool = False):
+        if export_file.endswith(tuple('.' + fmt for fmt in ChunkedReportWriter.FORMATS)):
+            raise ArchiveIndexError(f"圧縮チャンクは索引を作成できません (マニフェストを指定してください): {export_file}")
+        self.export_file = export_file
+        self.index_file = export_file + INDEX_SUFFIX
+        self.header: Dict[str, Any] = {}
+        self._data = None
+        self._data_file = None
+        self._index = None
+        self._index_file = None
+        if rebuild or not self._load():
+            self.build()
+            if not self._load():
+                raise ArchiveIndexError(f"索引を読み込めません: {self.index_file}")
+    
+    def __enter__(self) -> 'ArchiveIndex':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        for handle in (self._data, self._data_file, self._index, self._index_file):
+            if handle is not None:
+                handle.close()
+        self._data = self._data_file = self._index = self._index_file = None
+    
+    def _source_stat(self) -> Dict[str, int]:
+        stat = os.stat(self.export_file)
+        return {'size': stat.st_size, 'mtimeNs': stat.st_mtime_ns}
+    
+    def _load(self) -> bool:
+        """索引を開く (無い・エクスポートより古い場合は False)"""
+        self.close()
+        if not os.path.exists(self.index_file):
+            return False
+        index_file = open(self.index_file, 'rb')
+        try:
+            index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            index_file.close()
+            return False
+        if index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            index.close()
+            index_file.close()
+            return False
+        header_length = struct.unpack_from('<I', index, len(INDEX_MAGIC))[0]
+        start = len(INDEX_MAGIC) + 4
+        header = json.loads(index[start:start + header_length])
+        if header.get('source') != self._source_stat():
+            index.close()
+            index_file.close()
+            return False
+        
+        self.header = header
+        self._index_file = index_file
+        self._index = index
+        self._data_file = open(self.export_file, 'rb')
+        if header['source']['size']:
+            self._data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return True
+    
+    @staticmethod
+    def _scan_line(line: bytes) -> Optional[tuple]:
+        """1行から (データタイプ, timestamp, 端末ID, レコードの長さ) を取り出す (レコード以外は None)"""
+        body = line.rstrip(b'\r\n')
+        if body.endswith(b','):
+            body = body[:-1]
+        if not body.startswith(b'{'):
+            return None
+        match = RECORD_PREFIX.match(body)
+        if match and b'"deviceId"' not in body:
+            timestamp = match.group(2)
+            return (json.loads(match.group(1)), -1 if timestamp == b'null' else int(timestamp),
+                    None, len(body))
+        try:
+            record = json.loads(body)
+        except ValueError:
+            return None
+        if not isinstance(record, dict) or 'dataType' not in record:
+            return None
+        timestamp = to_epoch_millis(record.get('timestamp'))
+        return (record['dataType'], -1 if timestamp is None else timestamp,
+                record.get('deviceId'), len(body))
+    
+    def build(self) -> str:
+        """エクスポートを1回読み、索引ファイルを作成する"""
+        source = self._source_stat()
+        series: Dict[tuple, List[tuple]] = {}
+        default_device = None
+        fmt = 'ndjson'
+        offset = 0
+        record_lines = 0
+        other_lines = 0
+        with open(self.export_file, 'rb') as f:
+            for line in f:
+                if offset == 0 and line.startswith(b'{"rawData":'):
+                    fmt = 'json'
+                if line.startswith(JSON_INFO_PREFIX):
+                    info, _ = json.JSONDecoder().raw_decode(line[len(JSON_INFO_PREFIX):].decode('utf-8'))
+                    default_device = info.get('deviceId')
+                elif line.startswith(b'{"extractionInfo":'):
+                    default_device = json.loads(line).get('extractionInfo', {}).get('deviceId')
+                else:
+                    scanned = self._scan_line(line)
+                    if scanned is None:
+                        other_lines += 1
+                    else:
+                        data_type, timestamp, device_id, length = scanned
+                        series.setdefault((device_id, data_type), []).append((timestamp, offset, length))
+                        record_lines += 1
+                offset += len(line)
+        
+        if not record_lines and other_lines > 10:
+            raise ArchiveIndexError(f"1行1レコードの形式ではないため索引を作成できません: {self.export_file}")
+        
+        # 端末IDを持たないレコード (extractionInfo の端末) を同じ系列にまとめる
+        merged: Dict[tuple, List[tuple]] = {}
+        for (device_id, data_type), entries in series.items():
+            merged.setdefault((device_id or default_device or '', data_type), []).extend(entries)
+        
+        header = {
+            'version': 1,
+            'source': source,
+            'format': fmt,
+            'createdAt': datetime.datetime.now().isoformat(),
+            'series': []
+        }
+        chunks = []
+        position = 0
+        for (device_id, data_type) in sorted(merged):
+            entries = merged[(device_id, data_type)]
+            entries.sort()
+            buckets: Dict[str, int] = {}
+            for timestamp, _, _ in entries:
+                day = str(timestamp - timestamp % DAY_MS) if timestamp >= 0 else '-1'
+                buckets[day] = buckets.get(day, 0) + 1
+            header['series'].append({
+                'deviceId': device_id,
+                'dataType': data_type,
+                'position': position,
+                'count': len(entries),
+                'earliest': entries[0][0],
+                'latest': entries[-1][0],
+                # UTC の日ごとの件数 (キーは日の開始時刻)
+                'dailyCounts': buckets
+            })
+            chunks.append(b''.join(ENTRY.pack(*entry) for entry in entries))
+            position += len(entries)
+        
+        header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        # 索引本体を8バイト境界に揃える
+        header_bytes += b' ' * (-(len(INDEX_MAGIC) + 4 + len(header_bytes)) % 8)
+        tmp_path = f"{self.index_file}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_MAGIC)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, self.index_file)
+        print(f"✅ 索引を作成しました: {self.index_file} ({record_lines}件)")
+        return self.index_file
+    
+    @property
+    def _entries_base(self) -> int:
+        return len(INDEX_MAGIC) + 4 + struct.unpack_from('<I', self._index, len(INDEX_MAGIC))[0]
+    
+    def series(self, data_type: Optional[str] = None, device_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [
+            item for item in self.header.get('series', [])
+            if (data_type is None or item['dataType'] == data_type)
+            and (device_id is None or item['deviceId'] == device_id)
+        ]
+    
+    def _range(self, item: Dict[str, Any], start: Optional[int], end: Optional[int]) -> tuple:
+        """系列内で timestamp が [start, end) の索引の範囲"""
+        view = _TimestampView(self._index, self._entries_base + item['position'] * ENTRY.size, item['count'])
+        low = 0 if start is None else bisect.bisect_left(view, start)
+        high = item['count'] if end is None else bisect.bisect_left(view, end)
+        return view, low, high
+    
+    def count(self, data_type: Optional[str] = None, device_id: Optional[str] = None,
+              start: Optional[int] = None, end: Optional[int] = None) -> int:
+        """条件に合うレコード数 (レコードは読み込まない)"""
+        total = 0
+        for item in self.series(data_type, device_id):
+            _, low, high = self._range(item, start, end)
+            total += max(high - low, 0)
+        return total
+    
+    def iter_entries(self, data_type: Optional[str] = None, device_id: Optional[str] = None,
+                     start: Optional[int] = None, end: Optional[int] = None) -> Iterator[tuple]:
+        """条件に合う (timestamp, オフセット, 長さ) を系列ごとの時刻順に返す"""
+        for item in self.series(data_type, device_id):
+            view, low, high = self._range(item, start, end)
+            for position in range(low, high):
+                yield ENTRY.unpack_from(view.buffer, view.base + position * ENTRY.size)
+    
+    def query(self, data_type: Optional[str] = None, device_id: Optional[str] = None,
+              start: Optional[int] = None, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """条件に合うレコードを時刻順に返す (該当するレコードだけを JSON デコード)"""
+        data = self._data
+        streams = [
+            self.iter_entries(item['dataType'], item['deviceId'], start, end)
+            for item in self.series(data_type, device_id)
+        ]
+        for _, offset, length in heapq.merge(*streams):
+            yield json.loads(data[offset:offset + length])
+
+class ChunkedArchive:
+    """圧縮チャンク出力 (マニフェスト) の検索
+    
+    チャンクは圧縮されていて位置を指定して読めないため索引は作らない。マニフェストに記録された
+    チャンクごとのデータタイプ・期間で該当しないチャンクを飛ばし、残りを展開して走査する。
+    """
+    
+    def __init__(self, manifest_file: str):
+        self.manifest_file = manifest_file
+        self.directory = os.path.dirname(manifest_file)
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if 'chunks' not in self.manifest:
+            raise ArchiveIndexError(f"チャンク出力のマニフェストではありません: {manifest_file}")
+        self.device_id = self.manifest.get('extractionInfo', {}).get('deviceId') or ''
+    
+    def __enter__(self) -> 'ChunkedArchive':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        pass
+    
+    @property
+    def chunk_files(self) -> List[str]:
+        return [os.path.join(self.directory, chunk['file']) for chunk in self.manifest['chunks']]
+    
+    def _chunks(self, data_type: Optional[str], start: Optional[int], end: Optional[int]) -> List[Dict[str, Any]]:
+        return select_chunks(self.manifest, None if data_type is None else [data_type], start, end)
+    
+    def _iter_chunk(self, chunk: Dict[str, Any], data_type: Optional[str], device_id: Optional[str],
+                    start: Optional[int], end: Optional[int]) -> Iterator[tuple]:
+        """1チャンクを展開し、条件に合う (timestamp, レコード) を返す"""
+        with open_chunk(os.path.join(self.directory, chunk['file'])) as lines:
+            for line in lines:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if data_type is not None and record.get('dataType') != data_type:
+                    continue
+                if device_id is not None and (record.get('deviceId') or self.device_id) != device_id:
+                    continue
+                timestamp = to_epoch_millis(record.get('timestamp'))
+                timestamp = -1 if timestamp is None else timestamp
+                if (start is not None and timestamp < start) or (end is not None and timestamp >= end):
+                    continue
+                yield timestamp, record
+    
+    def count(self, data_type: Optional[str] = None, device_id: Optional[str] = None,
+              start: Optional[int] = None, end: Optional[int] = None) -> int:
+        """条件に合うレコード数 (期間に全て含まれるチャンクはマニフェストの件数を使う)"""
+        if device_id is not None and device_id != self.device_id:
+            # 端末ID付きのレコードが混在する場合に備えて展開して数える
+            return sum(1 for chunk in self._chunks(data_type, start, end)
+                       for _ in self._iter_chunk(chunk, data_type, device_id, start, end))
+        total = 0
+        for chunk in self._chunks(data_type, start, end):
+            ranges = chunk.get('dataTypes', {})
+            if data_type is not None:
+                ranges = {data_type: ranges[data_type]} if data_type in ranges else {}
+            inside = all(
+                stats.get('earliest') is not None
+                and (start is None or stats['earliest'] >= start) and (end is None or stats['latest'] < end)
+                for stats in ranges.values()
+            )
+            if inside:
+                total += sum(stats['count'] for stats in ranges.values())
+            else:
+                total += sum(1 for _ in self._iter_chunk(chunk, data_type, device_id, start, end))
+        return total
+    
+    def query(self, data_type: Optional[str] = None, device_id: Optional[str] = None,
+              start: Optional[int] = None, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """条件に合うレコードを時刻順に返す (チャンクごとに該当レコードを並べ替えてまとめる)"""
+        def sorted_chunk(chunk):
+            matched = list(self._iter_chunk(chunk, data_type, device_id, start, end))
+            matched.sort(key=lambda item: item[0])
+            for _, record in matched:
+                yield record
+        
+        streams = [sorted_chunk(chunk) for chunk in self._chunks(data_type, start, end)]
+        return heapq.merge(*streams, key=lambda record: to_epoch_millis(record.get('timestamp')) or -1)
+
+class ArchiveQuery:
+    """複数のエクスポートにまたがる検索"""
+    
+    def __init__(self, patterns: List[str], rebuild: bool = False):
+        files = []
+        for pattern in patterns:
+            matches = sorted(glob.glob(pattern))
+            files += [name for name in matches if not name.endswith((INDEX_SUFFIX, '.tmp'))]
+        self.indexes: List[Any] = []
+        # マニフェストから読むチャンクは単独のファイルとして扱わない
+        chunk_files = set()
+        for filename in dict.fromkeys(name for name in files if name.endswith(MANIFEST_SUFFIX)):
+            try:
+                archive = ChunkedArchive(filename)
+            except (ArchiveIndexError, OSError, ValueError) as e:
+                print(f"⚠️ {e}")
+                continue
+            self.indexes.append(archive)
+            chunk_files.update(os.path.normpath(path) for path in archive.chunk_files)
+        for filename in dict.fromkeys(files):
+            if filename.endswith(MANIFEST_SUFFIX) or os.path.normpath(filename) in chunk_files:
+                continue
+            try:
+                self.indexes.append(ArchiveIndex(filename, rebuild))
+            except (ArchiveIndexError, OSError, ValueError) as e:
+                print(f"⚠️ {e}")
+    
+    def __enter__(self) -> 'ArchiveQuery':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        for index in self.indexes:
+            index.close()
+    
+    def count(self, data_type: Optional[str] = None, device_id: Optional[str] = None,
+              start: Optional[int] = None, end: Optional[int] = None) -> int:
+        return sum(index.count(data_type, device_id, start, end) for index in self.indexes)
+    
+    def query(self, data_type: Optional[str] = None, device_id: Optional[str] = None,
+              start: Optional[int] = None, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """全ファイルの該当レコードを時刻順にまとめて返す"""
+        streams = [index.query(data_type, device_id, start, end) for index in self.indexes]
+        return heapq.merge(*streams, key=lambda record: to_epoch_millis(record.get('timestamp')) or -1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Health Connect エクスポートの期間指定検索')
+    parser.add_argument('command', choices=['query', 'build'], help='query: 検索 / build: 索引の作成')
+    parser.add_argument('files', nargs='+', help='エクスポートファイル (ワイルドカード可)')
+    parser.add_argument('--type', default=None, help='データタイプ')
+    parser.add_argument('--device', default=None, help='端末ID')
+    parser.add_argument('--start', default=None, help='開始日時 (ISO 8601 またはエポックミリ秒、以上)')
+    parser.add_argument('--end', default=None, help='終了日時 (ISO 8601 またはエポックミリ秒、未満)')
+    parser.add_argument('--count', action='store_true', help='件数のみ表示')
+    parser.add_argument('--output', default=None, help='結果の保存先 (NDJSON、デフォルト: 標準出力)')
+    args = parser.parse_args()
+    
+    if args.command == 'build':
+        for pattern in args.files:
+            for filename in sorted(glob.glob(pattern)):
+                if filename.endswith(INDEX_SUFFIX):
+                    continue
+                if filename.endswith(MANIFEST_SUFFIX):
+                    print(f"ℹ️ チャンク出力は索引を作成せずに検索します: {filename}")
+                    continue
+                try:
+                    ArchiveIndex(filename, rebuild=True).close()
+                except (ArchiveIndexError, OSError, ValueError) as e:
+                    print(f"⚠️ {e}")
+        return
+    
+    start = to_epoch_millis(args.start)
+    end = to_epoch_millis(args.end)
+    # 索引作成時のメッセージが検索結果 (標準出力) に混ざらないようにする
+    with contextlib.redirect_stdout(sys.stderr):
+        archive = ArchiveQuery(args.files)
+    with archive:
+        if args.count:
+            print(archive.count(args.type, args.device, start, end))
+            return
+        output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for record in archive.query(args.type, args.device, start, end):
+                output.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+                output.write('\n')
+        finally:
+            if args.output:
+                output.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Health Connect 取得処理ベンチマーク
+
+実機を接続せずに、Content Provider出力のパース性能を計測します。
+--suite を指定すると health_connect_fake_adb.py を adb として使い、
+取得・パース・保存の各段階の records/s、ピークRSS、経過時間を件数ごとに計測します。
+各段階は別プロセスで実行するため、ピークRSSは段階ごとの値になります。
+
+使用方法:
+python health_connect_benchmark.py [--rows 100000] [--repeat 3]
+python health_connect_benchmark.py --suite [--sizes 1000,100000,10000000] [--output result.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from health_connect_data_extractor import ContentRowParser, HealthConnectExtractor
+
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'health_connect_fake_adb.py')
+FAKE_DEVICE = 'emulator-5554'
+SUITE_DATA_TYPE = 'HeartRate'
+# 偽の端末は今日までの30日分のデータを持つため、全件が取得範囲に入るよう1日広げる
+SUITE_DAYS_BACK = 31
+SUITE_STAGES = (
+    'get_health_connect_data',
+    'iter_health_connect_data',
+    'parse_content_provider_output',
+    'save_data_to_file',
+    'stream_all_data_to_file'
+)
+# 全件をリストとして保持する段階 (大きい件数ではメモリ不足になるため省略できる)
+LIST_STAGES = ('get_health_connect_data', 'parse_content_provider_output', 'save_data_to_file')
+
+def generate_content_rows(rows: int, data_type: str = 'Steps') -> List[str]:
+    """`adb shell content query` 形式のダミー出力を生成"""
+    base_time = 1721203200000
+    lines = []
+    for i in range(rows):
+        start_time = base_time + i * 60000
+        if data_type == 'HeartRate':
+            values = f"bpm={60 + i % 40}, measurement_method=MEASUREMENT_METHOD_AUTOMATIC"
+        else:
+            values = f"count={i % 500}"
+        # 値にカンマを含む列 (端末モデル・メタデータ) も混ぜる
+        lines.append(
+            f"Row: {i} _id={i}, {values}, start_time={start_time}, end_time={start_time + 60000}, "
+            f"device_model=Galaxy Watch 5, 44mm, data_origin=com.samsung.health, "
+            f"metadata={{\"clientRecordId\": \"client_{i}\", \"tags\": \"a, b\"}}"
+        )
+    return lines
+
+def measure(label: str, rows: int, repeat: int, func: Callable[[], int]) -> Dict[str, float]:
+    """func を repeat 回実行し、最速の結果を返す"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = func()
+        elapsed = time.perf_counter() - started
+        if count != rows:
+            raise RuntimeError(f"{label}: {rows}件中{count}件しか処理されませんでした")
+        best = elapsed if best is None else min(best, elapsed)
+    result = {'seconds': best, 'recordsPerSecond': rows / best if best else 0.0}
+    print(f"⏱️ {label}: {best:.3f}秒 ({result['recordsPerSecond']:,.0f} records/s)")
+    return result
+
+def benchmark_parser(rows: int = 100000, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """行パース単体と、パース+フォーマットのスループットを計測"""
+    lines = generate_content_rows(rows)
+    parser = ContentRowParser()
+    projected_parser = ContentRowParser(
+        ['_id', 'count', 'start_time', 'end_time', 'device_model', 'data_origin', 'metadata'])
+    extractor = HealthConnectExtractor()
+    # 生成した行は全列 (projectionなし) の出力のため、全列取得時のパースを計測する
+    extractor.use_projection = False
+    raw_rows = list(parser.parse_rows(lines))
+    extracted_at = '2024-07-17T00:00:00'
+    
+    print(f"📊 Content Providerパーサー ベンチマーク ({rows:,}行)")
+    print("=" * 50)
+    return {
+        'parseRows': measure('行パース', rows, repeat,
+                             lambda: sum(1 for _ in parser.parse_rows(lines))),
+        'parseRowsKnownColumns': measure('行パース (列名指定)', rows, repeat,
+                                         lambda: sum(1 for _ in projected_parser.parse_rows(lines))),
+        'parseAndFormat': measure('パース + フォーマット', rows, repeat,
+                                  lambda: sum(1 for _ in extractor.iter_parse_content_provider_lines(lines, 'Steps'))),
+        'convertRecords': measure('型変換 (1件ずつ)', rows, repeat,
+                                  lambda: len([extractor.make_record(r, 'Steps', extracted_at) for r in raw_rows])),
+        'convertRecordsBatch': measure('型変換 (一括)', rows, repeat,
+                                       lambda: len(extractor.make_records(raw_rows, 'Steps', extracted_at))),
+    }
+
+def peak_rss_mb() -> Optional[float]:
+    """このプロセスのピークRSS (MB)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS は bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def fake_adb_env(rows: int) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        'HEALTH_CONNECT_ADB': FAKE_ADB,
+        'FAKE_ADB_DEVICES': FAKE_DEVICE,
+        'FAKE_ADB_TYPES': SUITE_DATA_TYPE,
+        'FAKE_ADB_DAYS': '30',
+        'FAKE_ADB_ROWS': str(rows)
+    })
+    return env
+
+def write_content_query_output(rows: int, filename: str):
+    """偽の端末から1データタイプ分の content query 出力を取得してファイルに保存"""
+    uri = f"content://com.google.android.apps.healthdata.provider/records/{SUITE_DATA_TYPE}"
+    with open(filename, 'w', encoding='utf-8') as f:
+        subprocess.run([sys.executable, FAKE_ADB, '-s', FAKE_DEVICE, 'shell', 'content', 'query', '--uri', uri],
+                       stdout=f, env=fake_adb_env(rows), check=True)
+
+def run_stage(stage: str, rows: int, workdir: str) -> Dict[str, Any]:
+    """1段階を実行して計測する (--suite から別プロセスで呼ばれる)"""
+    extractor = HealthConnectExtractor(FAKE_DEVICE)
+    extractor.supported_data_types = [SUITE_DATA_TYPE]
+    # 計測中にタイムアウトで時間窓が分割されないようにする
+    extractor.query_timeout = 24 * 60 * 60
+    raw_file = os.path.join(workdir, f"content_query_{rows}.txt")
+    output_file = os.path.join(workdir, f"{stage}_{rows}.json")
+    
+    def read_raw() -> str:
+        with open(raw_file, 'r', encoding='utf-8') as f:
+            return f.read()
+    
+    # 抽出ツールの進捗表示は計測結果 (標準出力) と分ける
+    with contextlib.redirect_stdout(sys.stderr):
+        if stage == 'get_health_connect_data':
+            started = time.perf_counter()
+            count = len(extractor.get_health_connect_data(SUITE_DATA_TYPE, SUITE_DAYS_BACK))
+        elif stage == 'iter_health_connect_data':
+            started = time.perf_counter()
+            count = sum(1 for _ in extractor.iter_health_connect_data(SUITE_DATA_TYPE, SUITE_DAYS_BACK))
+        elif stage == 'parse_content_provider_output':
+            output = read_raw()
+            started = time.perf_counter()
+            count = len(extractor.parse_content_provider_output(output, SUITE_DATA_TYPE))
+        elif stage == 'save_data_to_file':
+            data = {SUITE_DATA_TYPE: extractor.parse_content_provider_output(read_raw(), SUITE_DATA_TYPE)}
+            started = time.perf_counter()
+            extractor.save_data_to_file(data, output_file)
+            count = len(data[SUITE_DATA_TYPE])
+        elif stage == 'stream_all_data_to_file':
+            output_file = output_file[:-len('.json')] + '.ndjson'
+            started = time.perf_counter()
+            extractor.stream_all_data_to_file(SUITE_DAYS_BACK, output_file, 'ndjson')
+            elapsed = time.perf_counter() - started
+            with open(output_file, 'r', encoding='utf-8') as f:
+                # 最終行は統計情報
+                count = sum(1 for _ in f) - 1
+        else:
+            raise ValueError(f"未対応の段階です: {stage}")
+        if stage != 'stream_all_data_to_file':
+            elapsed = time.perf_counter() - started
+        extractor.close()
+    
+    return {
+        'stage': stage,
+        'records': count,
+        'seconds': round(elapsed, 3),
+        'recordsPerSecond': round(count / elapsed) if elapsed else None,
+        'peakRssMb': peak_rss_mb()
+    }
+
+def benchmark_suite(sizes: List[int], stages: List[str], max_list_rows: int,
+                    workdir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """件数 × 段階ごとに別プロセスで計測し、結果の一覧を返す"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix='health_connect_benchmark_') as tmpdir:
+        workdir = workdir or tmpdir
+        os.makedirs(workdir, exist_ok=True)
+        for rows in sizes:
+            print(f"📊 {rows:,}行")
+            print("=" * 50)
+            write_content_query_output(rows, os.path.join(workdir, f"content_query_{rows}.txt"))
+            for stage in stages:
+                if stage in LIST_STAGES and rows > max_list_rows:
+                    print(f"⏭️ {stage}: 全件をメモリに保持するため省略 (--max-list-rows {max_list_rows:,})")
+                    results.append({'size': rows, 'stage': stage, 'skipped': True})
+                    continue
+                started = time.perf_counter()
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--run-stage', stage,
+                     '--rows', str(rows), '--workdir', workdir],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=fake_adb_env(rows), text=True
+                )
+                wall = time.perf_counter() - started
+                if completed.returncode != 0:
+                    print(f"❌ {stage}: 失敗 (終了コード {completed.returncode})")
+                    results.append({'size': rows, 'stage': stage, 'error': completed.returncode})
+                    continue
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+                result.update({'size': rows, 'wallSeconds': round(wall, 3)})
+                results.append(result)
+                print(f"⏱️ {stage}: {result['seconds']:.3f}秒 ({result['recordsPerSecond'] or 0:,} records/s), "
+                      f"ピークRSS {result['peakRssMb']}MB, プロセス全体 {wall:.3f}秒")
+            print()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Health Connect 取得処理ベンチマーク')
+    parser.add_argument('--rows', type=int, default=100000, help='生成する行数')
+    parser.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数')
+    parser.add_argument('--suite', action='store_true', help='偽の adb を使って取得・パース・保存の各段階を計測')
+    parser.add_argument('--sizes', default='1000,100000,10000000', help='--suite の件数 (カンマ区切り)')
+    parser.add_argument('--stages', default=','.join(SUITE_STAGES), help='--suite で計測する段階 (カンマ区切り)')
+    parser.add_argument('--max-list-rows', type=int, default=1000000,
+                        help='全件をリストで保持する段階を実行する最大件数')
+    parser.add_argument('--workdir', default=None, help='作業ディレクトリ (デフォルト: 一時ディレクトリ)')
+    parser.add_argument('--output', default=None, help='--suite の結果を保存するJSONファイル')
+    parser.add_argument('--run-stage', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.run_stage:
+        print(json.dumps(run_stage(args.run_stage, args.rows, args.workdir)))
+        return
+    
+    if args.suite:
+        sizes = [int(size) for size in args.sizes.split(',')]
+        stages = [stage for stage in args.stages.split(',') if stage]
+        results = benchmark_suite(sizes, stages, args.max_list_rows, args.workdir)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'createdAt': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=2)
+            print(f"💾 結果を保存しました: {args.output}")
+        return
+    
+    benchmark_parser(args.rows, args.repeat)
+
+if __name__ == "__main__":
+    main()
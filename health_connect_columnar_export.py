@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Health Connect データ 列指向エクスポート
+
+抽出結果をデータタイプごとに1つの列指向テーブル (NumPy .npz 形式) として保存します。
+時刻はエポックミリ秒の int64、数値は int64 / float64、文字列 (データ提供元など) は
+辞書エンコード (int32 コード + 辞書配列) で格納します。
+NumPy を使わずに標準ライブラリのみで .npz を書き出すため、抽出環境に追加の
+依存関係は不要です。分析側では numpy.load() でそのまま読み込めます。
+
+抽出時に直接保存する場合は health_connect_data_extractor.py --format npz を指定します
+(<出力ファイル名>_columnar/ にデータタイプごとの .npz とマニフェストを保存)。
+
+使用方法:
+python health_connect_columnar_export.py health_connect_raw_data_YYYYMMDD_HHMMSS.json [--output-dir DIR] [--no-compress]
+"""
+
+import argparse
+import ast
+import datetime
+import json
+import os
+import struct
+import sys
+import zipfile
+from array import array
+from typing import Dict, List, Any, Optional, Iterable
+
+from health_connect_data_extractor import StreamingReportWriter, load_export, to_epoch_millis, to_record_dict
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+DICTIONARY_SUFFIX = '__dictionary'
+COLUMNAR_MANIFEST = 'columnar_manifest.json'
+# (array typecode, numpy descr)
+INT64 = ('q', '<i8')
+INT32 = ('i', '<i4')
+FLOAT64 = ('d', '<f8')
+
+class ColumnarExporter:
+    """抽出データをデータタイプごとの列指向テーブルに変換して保存する"""
+    
+    def __init__(self, output_dir: str = '.', compress: bool = True):
+        self.output_dir = output_dir
+        self.compress = compress
+    
+    @staticmethod
+    def flatten_value(value: Any, prefix: str = 'value') -> Dict[str, Any]:
+        """record['value'] を列名 -> 値 のフラットな辞書に変換"""
+        if not isinstance(value, dict):
+            return {prefix: value}
+        flat = {}
+        for key, item in value.items():
+            name = f"{prefix}_{key}"
+            if isinstance(item, dict):
+                flat.update(ColumnarExporter.flatten_value(item, name))
+            elif isinstance(item, list):
+                flat[name] = json.dumps(item, ensure_ascii=False, separators=(',', ':'))
+            else:
+                flat[name] = item
+        return flat
+    
+    def build_columns(self, records: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+        """レコードの一覧を列 (列名 -> 値のリスト) に変換"""
+        columns: Dict[str, List[Any]] = {
+            'timestamp': [],
+            'start_time': [],
+            'end_time': [],
+            'origin': []
+        }
+        for index, record in enumerate(records):
+            raw = record.get('rawData') or {}
+            columns['timestamp'].append(to_epoch_millis(record.get('timestamp')))
+            columns['start_time'].append(to_epoch_millis(raw.get('start_time') or raw.get('time')))
+            columns['end_time'].append(to_epoch_millis(raw.get('end_time') or raw.get('time')))
+            columns['origin'].append(raw.get('data_origin'))
+            
+            for name, item in self.flatten_value(record.get('value')).items():
+                if name not in columns:
+                    # 途中から現れた列は欠損値で埋める
+                    columns[name] = [None] * index
+                columns[name].append(item)
+            for values in columns.values():
+                if len(values) < index + 1:
+                    values.append(None)
+        return columns
+    
+    def encode_column(self, name: str, values: List[Any]) -> Dict[str, tuple]:
+        """列を型推論して {メンバー名: (dtype, .npyバイト列)} に変換 (文字列は辞書エンコード)"""
+        present = [v for v in values if v is not None and v != '']
+        
+        if name == 'timestamp' or name.lower().endswith('time'):
+            millis = [to_epoch_millis(v) for v in values]
+            if all(to_epoch_millis(v) is not None for v in present):
+                # 時刻列はエポックミリ秒 (欠損は -1)
+                return {name: self.npy_bytes(INT64, [-1 if m is None else m for m in millis])}
+        
+        if present and all(isinstance(v, bool) for v in present):
+            return {name: self.npy_bytes(('b', '|b1'), [1 if v else 0 for v in values])}
+        
+        numbers = [self.to_number(v) for v in values]
+        if all(numbers[i] is not None for i, v in enumerate(values) if v is not None and v != ''):
+            present_numbers = [n for n in numbers if n is not None]
+            if len(present_numbers) == len(values) and all(isinstance(n, int) for n in present_numbers):
+                return {name: self.npy_bytes(INT64, present_numbers)}
+            if present_numbers:
+                # 欠損を含む数値列は NaN を使うため float64
+                return {name: self.npy_bytes(FLOAT64, [float('nan') if n is None else float(n) for n in numbers])}
+        
+        # 文字列は辞書エンコード (欠損は -1)
+        dictionary: Dict[str, int] = {}
+        codes = []
+        for value in values:
+            if value is None:
+                codes.append(-1)
+                continue
+            text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+            codes.append(dictionary.setdefault(text, len(dictionary)))
+        return {
+            name: self.npy_bytes(INT32, codes),
+            name + DICTIONARY_SUFFIX: self.npy_unicode_bytes(list(dictionary))
+        }
+    
+    @staticmethod
+    def to_number(value: Any) -> Optional[Any]:
+        if value is None or value == '' or isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return value
+        text = str(value)
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        try:
+            return float(text)
+        except ValueError:
+            return None
+    
+    @staticmethod
+    def _npy_header(descr: str, length: int) -> bytes:
+        header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, length)
+        # マジック + ヘッダー長 + ヘッダーの合計を64バイト境界に揃える
+        padding = (64 - (len(NPY_MAGIC) + 2 + len(header) + 1) % 64) % 64
+        header = header + ' ' * padding + '\n'
+        return NPY_MAGIC + struct.pack('<H', len(header)) + header.encode('latin1')
+    
+    @classmethod
+    def npy_bytes(cls, dtype: tuple, values: List[Any]) -> tuple:
+        """数値列を .npy (リトルエンディアン) 形式に変換"""
+        typecode, descr = dtype
+        data = array(typecode, values)
+        if sys.byteorder == 'big':
+            data.byteswap()
+        return descr, cls._npy_header(descr, len(values)) + data.tobytes()
+    
+    @classmethod
+    def npy_unicode_bytes(cls, values: List[str]) -> tuple:
+        """文字列の一覧を固定長ユニコード配列 (<U) の .npy に変換"""
+        width = max([len(v) for v in values] + [1])
+        data = b''.join(v.encode('utf-32-le').ljust(width * 4, b'\x00') for v in values)
+        descr = f'<U{width}'
+        return descr, cls._npy_header(descr, len(values)) + data
+    
+    def export_data_type(self, data_type: str, records: List[Dict[str, Any]], filename: str) -> Dict[str, Any]:
+        """1データタイプ分を .npz に保存し、スキーマ情報を返す"""
+        columns = self.build_columns(records)
+        compression = zipfile.ZIP_DEFLATED if self.compress else zipfile.ZIP_STORED
+        schema = {}
+        
+        with zipfile.ZipFile(filename, 'w', compression=compression) as archive:
+            for name, values in columns.items():
+                for member, (descr, payload) in self.encode_column(name, values).items():
+                    archive.writestr(f"{member}.npy", payload)
+                    schema[member] = descr
+        
+        return {
+            'file': os.path.basename(filename),
+            'rows': len(records),
+            'columns': schema
+        }
+    
+    def export(self, data: Dict[str, List[Dict[str, Any]]], device_id: Optional[str] = None) -> Optional[str]:
+        """全データタイプを列指向形式で保存し、マニフェストのパスを返す"""
+        try:
+            with ColumnarReportWriter(self.output_dir, device_id, compress=self.compress) as writer:
+                for data_type, records in data.items():
+                    if not records:
+                        continue
+                    writer.write_records(data_type, records)
+                    print(f"✅ {data_type}: {len(records)}件 → {writer.table_path(data_type)}")
+            print(f"💾 列指向エクスポートを保存しました: {writer.filename}")
+            return writer.filename
+        
+        except Exception as e:
+            print(f"❌ 列指向エクスポートエラー: {e}")
+            return None
+
+class ColumnarReportWriter(StreamingReportWriter):
+    """列指向形式 (--format npz) の書き込み (open_report_writer から使う)
+    
+    データタイプごとに全レコードを受け取ってから .npz に変換するため、
+    メモリには1データタイプ分のレコードを保持する。filename が .npz で終わる場合は
+    <filename から .npz を除いたもの>_columnar/ に保存し、filename はマニフェストのパスになる。
+    """
+    
+    FORMATS = ('npz',)
+    
+    def __init__(self, filename: str, device_id: Optional[str] = None, fmt: str = 'npz',
+                 timestamp: Optional[str] = None, compress: bool = True):
+        super().__init__(filename, device_id, fmt, timestamp)
+        self.output_dir = filename[:-len('.npz')] + '_columnar' if filename.endswith('.npz') else filename
+        self.filename = os.path.join(self.output_dir, COLUMNAR_MANIFEST)
+        self.exporter = ColumnarExporter(self.output_dir, compress)
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self._opened = False
+    
+    def open(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._opened = True
+    
+    def table_path(self, data_type: str) -> str:
+        return os.path.join(self.output_dir, f"{data_type}.npz")
+    
+    def write_records(self, data_type: str, records: Iterable[Dict[str, Any]], ordered: bool = False) -> int:
+        """1データタイプ分のレコードを .npz に保存し、件数を返す (0件の場合はファイルを作らない)"""
+        if data_type in self.statistics:
+            raise ValueError(f"{data_type} は既に書き込み済みです")
+        records = [to_record_dict(record) for record in records]
+        timestamps = [t for t in (to_epoch_millis(record.get('timestamp')) for record in records) if t is not None]
+        if records:
+            self.tables[data_type] = self.exporter.export_data_type(data_type, records, self.table_path(data_type))
+        self.statistics[data_type] = {
+            'count': len(records),
+            'hasData': bool(records),
+            'dateRange': {
+                'earliest': min(timestamps, default=None),
+                'latest': max(timestamps, default=None)
+            }
+        }
+        return len(records)
+    
+    def close(self):
+        """マニフェストを書き込む"""
+        if not self._opened:
+            return
+        self._opened = False
+        manifest = {
+            'createdAt': datetime.datetime.now().isoformat(),
+            'deviceId': self.device_id,
+            'format': 'npz',
+            'compressed': self.exporter.compress,
+            'dictionarySuffix': DICTIONARY_SUFFIX,
+            'extractionInfo': dict(self.extraction_info(), format=self.fmt),
+            'statistics': self.statistics,
+            'dataTypes': self.tables
+        }
+        tmp_path = f"{self.filename}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.filename)
+    
+    def size(self) -> int:
+        """全テーブルとマニフェストの合計バイト数"""
+        total = sum(os.path.getsize(self.table_path(data_type)) for data_type in self.tables)
+        return total + (os.path.getsize(self.filename) if os.path.exists(self.filename) else 0)
+
+def load_columnar(filename: str) -> Dict[str, List[Any]]:
+    """NumPy なしで .npz を読み込む (辞書エンコード列は文字列に復元)"""
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive:
+        for member in archive.namelist():
+            payload = archive.read(member)
+            header_length = struct.unpack('<H', payload[8:10])[0]
+            header = ast.literal_eval(payload[10:10 + header_length].decode('latin1'))
+            body = payload[10 + header_length:]
+            descr = header['descr']
+            if descr.startswith('<U'):
+                width = int(descr[2:]) * 4
+                values = [body[i:i + width].decode('utf-32-le').rstrip('\x00') for i in range(0, len(body), width)]
+            else:
+                typecode = {'<i8': 'q', '<i4': 'i', '<f8': 'd', '|b1': 'b'}[descr]
+                data = array(typecode)
+                data.frombytes(body)
+                if sys.byteorder == 'big':
+                    data.byteswap()
+                values = data.tolist()
+            arrays[member[:-len('.npy')]] = values
+    
+    columns = {}
+    for name, values in arrays.items():
+        if name.endswith(DICTIONARY_SUFFIX):
+            continue
+        dictionary = arrays.get(name + DICTIONARY_SUFFIX)
+        if dictionary is not None:
+            values = [dictionary[code] if code >= 0 else None for code in values]
+        columns[name] = values
+    return columns
+
+def main():
+    parser = argparse.ArgumentParser(description='Health Connect 抽出データの列指向エクスポート')
+    parser.add_argument('export_file', help='health_connect_data_extractor.py の出力 (JSON / NDJSON)')
+    parser.add_argument('--output-dir', default=None, help='出力先ディレクトリ (デフォルト: <入力ファイル名>_columnar)')
+    parser.add_argument('--no-compress', action='store_true', help='圧縮せずに保存する')
+    args = parser.parse_args()
+    
+    report = load_export(args.export_file)
+    output_dir = args.output_dir or os.path.splitext(args.export_file)[0] + '_columnar'
+    device_id = report.get('extractionInfo', {}).get('deviceId')
+    
+    exporter = ColumnarExporter(output_dir, compress=not args.no_compress)
+    if not exporter.export(report.get('rawData', {}), device_id):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,19 @@ Health Connect 生データ取得スクリプト
 Health Connectの生データを直接取得します。
 
 使用方法:
-python health_connect_data_extractor.py
+python health_connect_data_extractor.py                    (取得期間を入力して1回取得)
+python health_connect_data_extractor.py --days 7 [--all-devices] [--format ndjson]
+python health_connect_data_extractor.py --watch --interval 300   (常駐して差分を定期取得)
+コマンドライン引数と watch モードの詳細は health_connect_sync.py を参照
+
+出力形式 (--format):
+- json / ndjson            1ファイル
+- ndjson.gz / ndjson.zst   圧縮した NDJSON を一定サイズごとのファイルに分割し、各ファイルのデータタイプ・
+                           件数・期間・SHA-256 を <名前>_manifest.json に記録 (ndjson.zst は zstandard パッケージが必要)
+
+計測 (環境変数、--metrics-file / --profile でも指定可能):
+- HEALTH_CONNECT_METRICS_FILE  段階ごとのメトリクスの保存先 (.prom なら Prometheus textfile 形式、それ以外は JSON)
+- HEALTH_CONNECT_PROFILE       cProfile の結果の保存先 (python -m pstats で確認)
 
 前提条件:
 - Android端末がUSBデバッグモードで接続されている
@@ -17,13 +29,1345 @@ python health_connect_data_extractor.py
 import subprocess
 import json
 import datetime
-import sys
+import collections
+import contextlib
+import cProfile
+import gzip
+import hashlib
+import io
+import queue
 import os
-from typing import Dict, List, Any, Optional
+import re
+import shlex
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Optional, Callable, Iterable, Iterator, TextIO
 
-class HealthConnectExtractor:
+try:
+    import zstandard
+except ImportError:  # 任意 (ndjson.zst 形式の出力のみで使用)
+    zstandard = None
+
+# adb コマンド (環境変数 HEALTH_CONNECT_ADB で health_connect_fake_adb.py 等に差し替え可能)
+ADB_PATH = os.environ.get('HEALTH_CONNECT_ADB', 'adb')
+
+# チャンク出力 (ndjson.gz / ndjson.zst) の1ファイルあたりの圧縮後サイズの目安
+OUTPUT_CHUNK_BYTES = 64 * 1024 * 1024
+MANIFEST_SUFFIX = '_manifest.json'
+# 列指向形式 (health_connect_columnar_export.ColumnarReportWriter)
+COLUMNAR_FORMAT = 'npz'
+
+# アプリの測定項目コード (doc/仕様書/アプリ内部DBテーブル一覧.md)
+MEASUREMENT_CODES = {
+    'Steps': '1000',
+    'Weight': '1100',
+    'BodyFat': '1101',
+    'BloodPressure': '1200',
+    'HeartRate': '1210',
+    'RestingHeartRate': '1210',
+    'BodyTemperature': '1400'
+}
+UNKNOWN_MEASUREMENT_CODE = '9999'
+
+# value1/value2/value3 に格納する record['value'] のキー
+VITAL_VALUE_FIELDS = {
+    'Steps': ('count',),
+    'HeartRate': ('beatsPerMinute',),
+    'RestingHeartRate': ('bpm',),
+    'Weight': ('mass',),
+    'Height': ('height',),
+    'BodyFat': ('percentage',),
+    'BloodPressure': ('systolic', 'diastolic'),
+    'Distance': ('distance',),
+    'TotalCaloriesBurned': ('energy',),
+    'ActiveCaloriesBurned': ('energy',),
+    'BloodGlucose': ('level',),
+    'OxygenSaturation': ('percentage',),
+    'BodyTemperature': ('temperature',)
+}
+
+def to_epoch_millis(value: Any) -> Optional[int]:
+    """エポックミリ秒 (数値・数値文字列) または ISO 8601 文字列をミリ秒に変換"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value)
+    if text.lstrip('-').isdigit():
+        return int(text)
+    try:
+        return int(datetime.datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp() * 1000)
+    except ValueError:
+        return None
+
+def vital_values(record: Dict[str, Any]) -> List[Optional[float]]:
+    """レコードを測定値 [value1, value2, value3] に変換 (該当なしは None)"""
+    value = record.get('value')
+    values: List[Optional[float]] = [None, None, None]
+    if not isinstance(value, dict):
+        return values
+    for index, key in enumerate(VITAL_VALUE_FIELDS.get(record.get('dataType'), ())):
+        item = value.get(key)
+        if isinstance(item, dict):
+            item = item.get('value')
+        try:
+            values[index] = float(item) if item not in (None, '') else None
+        except (TypeError, ValueError):
+            values[index] = None
+    return values
+
+# 全データタイプで取得する列 (期間・重複判定・差分取得に使用)
+PROJECTION_COMMON_COLUMNS = ('start_time', 'end_time', 'data_origin', 'client_record_id', 'last_modified_time')
+
+class HealthRecord:
+    """抽出した1レコード
+    
+    レコードごとの dict を持たず、列名タプル (同じクエリ結果で共有) と値タプル、
+    型変換済みの値だけを保持する。現行のJSON形式への変換は to_dict() で
+    シリアライズ時にのみ行う。dict と同じキーでの参照 (record['timestamp'] 等) にも対応する。
+    """
+    
+    __slots__ = ('data_type', 'timestamp_ms', 'columns', 'values', 'fields', 'extracted_at')
+    
+    SOURCE = 'HEALTH_CONNECT_DIRECT'
+    METADATA = {
+        'extractionMethod': 'ADB_CONTENT_PROVIDER',
+        'isRealData': True
+    }
+    # (出力キー, 生データ列, 変換関数, 既定値) のタプル
+    # 変換関数が None の項目は生データの文字列をそのまま使う
+    VALUE_SPEC: tuple = ()
+    # value に常に付与する固定値
+    VALUE_CONSTANTS: Dict[str, Any] = {}
+    
+    def __init__(self, data_type: str, columns: tuple, values: tuple, extracted_at: str):
+        self.data_type = data_type
+        self.columns = columns
+        self.values = values
+        self.extracted_at = extracted_at
+        self._convert(conversion_plan(type(self), columns))
+    
+    def _convert(self, plan: tuple):
+        timestamp_indexes, converters = plan
+        values = self.values
+        timestamp = next((values[i] for i in timestamp_indexes if values[i]), None)
+        self.timestamp_ms = to_epoch_millis(timestamp)
+        self.fields = tuple(
+            convert((values[index] if index is not None else None) or default)
+            for index, convert, default in converters
+        )
+    
+    @classmethod
+    def from_rows(cls, data_type: str, columns: tuple, rows: Iterable[tuple],
+                  extracted_at: str) -> List['HealthRecord']:
+        """同じ列構成の値タプルをまとめてレコードに変換する (列位置の解決は1回のみ)"""
+        timestamp_indexes, converters = conversion_plan(cls, columns)
+        new = cls.__new__
+        records = []
+        append = records.append
+        for values in rows:
+            record = new(cls)
+            record.data_type = data_type
+            record.columns = columns
+            record.values = values
+            record.extracted_at = extracted_at
+            record.timestamp_ms = to_epoch_millis(next((values[i] for i in timestamp_indexes if values[i]), None))
+            record.fields = tuple([
+                convert((values[index] if index is not None else None) or default)
+                for index, convert, default in converters
+            ])
+            append(record)
+        return records
+    
+    def raw(self, column: str) -> Optional[str]:
+        index = column_index(self.columns).get(column)
+        return None if index is None else self.values[index]
+    
+    def raw_data(self) -> Dict[str, Optional[str]]:
+        return dict(zip(self.columns, self.values))
+    
+    def raw_timestamp(self) -> str:
+        return self.raw('start_time') or self.raw('time') or ''
+    
+    def value(self) -> Dict[str, Any]:
+        if not self.VALUE_SPEC:
+            # 型定義の無いデータタイプは生データをそのまま
+            return self.raw_data()
+        value = {}
+        fields = iter(self.fields)
+        for key, column, convert, default in self.VALUE_SPEC:
+            value[key] = next(fields) if convert is not None else (self.raw(column) or default)
+        value.update(self.VALUE_CONSTANTS)
+        return value
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """現行の出力形式 (format_health_record と同じ構造) に変換"""
+        return {
+            'dataType': self.data_type,
+            'timestamp': self.timestamp_ms,
+            'rawData': self.raw_data(),
+            'source': self.SOURCE,
+            'extractedAt': self.extracted_at,
+            'metadata': dict(self.METADATA),
+            'value': self.value()
+        }
+    
+    _ACCESSORS = {
+        'dataType': lambda r: r.data_type,
+        'timestamp': lambda r: r.timestamp_ms,
+        'rawData': lambda r: r.raw_data(),
+        'source': lambda r: r.SOURCE,
+        'extractedAt': lambda r: r.extracted_at,
+        'metadata': lambda r: dict(r.METADATA),
+        'value': lambda r: r.value()
+    }
+    
+    def __getitem__(self, key: str) -> Any:
+        accessor = self._ACCESSORS.get(key)
+        if accessor is None:
+            raise KeyError(key)
+        return accessor(self)
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        accessor = self._ACCESSORS.get(key)
+        return default if accessor is None else accessor(self)
+    
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.data_type}, {self.timestamp_ms}, {self.value()})"
+    
+    @classmethod
+    def projection(cls) -> Optional[tuple]:
+        """content query で取得する列 (型定義の無いデータタイプは全列を取得するため None)"""
+        if not cls.VALUE_SPEC:
+            return None
+        columns = list(PROJECTION_COMMON_COLUMNS)
+        columns += [column for _, column, _, _ in cls.VALUE_SPEC if column not in columns]
+        return tuple(columns)
+
+def parse_json_list(value: str) -> List[Any]:
+    """JSON配列の列 (睡眠ステージ等) をリストに変換 (不正な値は空リスト)"""
+    try:
+        items = json.loads(value)
+    except (TypeError, ValueError):
+        return []
+    return items if isinstance(items, list) else []
+
+def parse_sleep_stages(value: str) -> List[Dict[str, Any]]:
+    """睡眠ステージの列を [{"stage", "startTime", "endTime"}, ...] に変換"""
+    stages = []
+    for item in parse_json_list(value):
+        if not isinstance(item, dict):
+            continue
+        stages.append({
+            'stage': item.get('stage', 'STAGE_TYPE_UNKNOWN'),
+            'startTime': to_epoch_millis(item.get('start_time', item.get('startTime'))),
+            'endTime': to_epoch_millis(item.get('end_time', item.get('endTime')))
+        })
+    return stages
+
+# 期間を持つレコード共通の項目 (エポックミリ秒の整数、欠損は None)
+INTERVAL_SPEC = (
+    ('startTime', 'start_time', to_epoch_millis, ''),
+    ('endTime', 'end_time', to_epoch_millis, '')
+)
+
+class StepsRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('count', 'count', int, 0),
+    ) + INTERVAL_SPEC
+
+class HeartRateRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('beatsPerMinute', 'bpm', int, 0),
+        ('measurementMethod', 'measurement_method', None, 'UNKNOWN')
+    )
+
+class RestingHeartRateRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('bpm', 'bpm', int, 0),
+    )
+
+class BloodPressureRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('systolic', 'systolic', float, 0),
+        ('diastolic', 'diastolic', float, 0),
+        ('bodyPosition', 'body_position', None, 'BODY_POSITION_UNKNOWN'),
+        ('measurementLocation', 'measurement_location', None, 'MEASUREMENT_LOCATION_UNKNOWN')
+    )
+    VALUE_CONSTANTS = {'unit': 'MILLIMETER_OF_MERCURY'}
+
+class WeightRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('mass', 'weight', float, 0),
+    )
+    VALUE_CONSTANTS = {'unit': 'KILOGRAM'}
+
+class HeightRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('height', 'height', float, 0),
+    )
+    VALUE_CONSTANTS = {'unit': 'METER'}
+
+class BodyFatRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('percentage', 'percentage', float, 0),
+    )
+
+class SleepSessionRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = INTERVAL_SPEC + (
+        ('title', 'title', None, ''),
+        ('stages', 'stages', parse_sleep_stages, '[]')
+    )
+
+class ExerciseSessionRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('exerciseType', 'exercise_type', None, 'EXERCISE_TYPE_UNKNOWN'),
+        ('title', 'title', None, '')
+    ) + INTERVAL_SPEC
+
+class DistanceRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('distance', 'distance', float, 0),
+    ) + INTERVAL_SPEC
+    VALUE_CONSTANTS = {'unit': 'METER'}
+
+class CaloriesBurnedRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('energy', 'energy', float, 0),
+    ) + INTERVAL_SPEC
+    VALUE_CONSTANTS = {'unit': 'KILOCALORIE'}
+
+class BloodGlucoseRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('level', 'level', float, 0),
+        ('specimenSource', 'specimen_source', None, 'SPECIMEN_SOURCE_UNKNOWN'),
+        ('mealType', 'meal_type', None, 'MEAL_TYPE_UNKNOWN'),
+        ('relationToMeal', 'relation_to_meal', None, 'RELATION_TO_MEAL_UNKNOWN')
+    )
+    VALUE_CONSTANTS = {'unit': 'MILLIMOLES_PER_LITER'}
+
+class OxygenSaturationRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('percentage', 'percentage', float, 0),
+    )
+
+class BodyTemperatureRecord(HealthRecord):
+    __slots__ = ()
+    VALUE_SPEC = (
+        ('temperature', 'temperature', float, 0),
+        ('measurementLocation', 'measurement_location', None, 'MEASUREMENT_LOCATION_UNKNOWN')
+    )
+    VALUE_CONSTANTS = {'unit': 'CELSIUS'}
+
+# データタイプ → レコードクラス (VALUE_SPEC が型変換の定義表)
+RECORD_CLASSES = {
+    'Steps': StepsRecord,
+    'HeartRate': HeartRateRecord,
+    'BloodPressure': BloodPressureRecord,
+    'Weight': WeightRecord,
+    'Height': HeightRecord,
+    'BodyFat': BodyFatRecord,
+    'SleepSession': SleepSessionRecord,
+    'ExerciseSession': ExerciseSessionRecord,
+    'Distance': DistanceRecord,
+    'TotalCaloriesBurned': CaloriesBurnedRecord,
+    'ActiveCaloriesBurned': CaloriesBurnedRecord,
+    'RestingHeartRate': RestingHeartRateRecord,
+    'BloodGlucose': BloodGlucoseRecord,
+    'OxygenSaturation': OxygenSaturationRecord,
+    'BodyTemperature': BodyTemperatureRecord
+}
+
+# データタイプごとの --projection 列 (表に無いデータタイプは全列を取得)
+PROJECTIONS = {
+    data_type: record_class.projection()
+    for data_type, record_class in RECORD_CLASSES.items()
+    if record_class.projection()
+}
+
+_column_indexes: Dict[tuple, Dict[str, int]] = {}
+
+def column_index(columns: tuple) -> Dict[str, int]:
+    """列名タプルごとの {列名: 位置} (列名タプルは同じクエリ結果で共有されるためキャッシュする)"""
+    index = _column_indexes.get(columns)
+    if index is None:
+        index = _column_indexes[columns] = {name: i for i, name in enumerate(columns)}
+    return index
+
+_conversion_plans: Dict[tuple, tuple] = {}
+
+def conversion_plan(record_class: type, columns: tuple) -> tuple:
+    """列構成ごとの変換手順 (タイムスタンプ列の位置, (列位置, 変換関数, 既定値)...) を返す"""
+    key = (record_class, columns)
+    plan = _conversion_plans.get(key)
+    if plan is None:
+        index = column_index(columns)
+        timestamp_indexes = tuple(index[c] for c in ('start_time', 'time') if c in index)
+        converters = tuple(
+            (index.get(column), convert, default)
+            for _, column, convert, default in record_class.VALUE_SPEC if convert is not None
+        )
+        plan = _conversion_plans[key] = (timestamp_indexes, converters)
+    return plan
+
+def record_timestamp(record: Any) -> int:
+    """レコードのタイムスタンプ (エポックミリ秒、無い場合は -1) を返す"""
+    if isinstance(record, HealthRecord):
+        timestamp = record.timestamp_ms
+    else:
+        timestamp = to_epoch_millis(record.get('timestamp'))
+    return -1 if timestamp is None else timestamp
+
+def to_record_dict(record: Any) -> Dict[str, Any]:
+    """HealthRecord / dict のどちらでも出力形式の dict にする"""
+    return record.to_dict() if isinstance(record, HealthRecord) else record
+
+class ContentRowParser:
+    """`adb shell content query` の出力をパースする
+    
+    出力形式は1レコード1行の "Row: N key=value, key=value, ..." で、値はエスケープされない。
+    このため ", " の直後が「列名=」になっている位置だけを区切りとみなし、
+    値に含まれるカンマ (端末モデル名やJSONメタデータ等) を保持する。
+    列名が分かっている場合 (projection指定時) はその列名だけを区切りに使う。
+    ただし行に列名以外の「key=」が含まれる場合 (端末が projection を無視した、
+    _id / device_model / metadata 等の列が付いている) は、その行だけ汎用の区切りでパースする。
+    改行を含む値は次の "Row:" 行までを継続行として連結する。
+    """
+    
+    ROW_PREFIX = re.compile(r'Row: \d+ ')
+    KEY_TOKEN = re.compile(r'(?:^|, )([A-Za-z_][A-Za-z0-9_]*)=')
+    NULL_VALUE = 'NULL'
+    
+    def __init__(self, columns: Optional[Iterable[str]] = None):
+        self.columns: Optional[frozenset] = None
+        self.fallback: Optional['ContentRowParser'] = None
+        if columns:
+            self.columns = frozenset(columns)
+            self.fallback = ContentRowParser()
+            # 長い列名を先に試すことで前方一致の誤判定を防ぐ
+            names = '|'.join(re.escape(c) for c in sorted(columns, key=len, reverse=True))
+            self.separator = re.compile(f', (?=(?:{names})=)')
+        else:
+            self.separator = re.compile(r', (?=[A-Za-z_][A-Za-z0-9_]*=)')
+    
+    def iter_row_bodies(self, lines: Iterable[str]) -> Iterator[str]:
+        """"Row: N " を除いたレコード本文を1件ずつ返す"""
+        body = None
+        for line in lines:
+            line = line.rstrip('\r\n')
+            match = self.ROW_PREFIX.match(line)
+            if match:
+                if body is not None:
+                    yield body
+                body = line[match.end():]
+            elif body is not None:
+                # 改行を含む値の継続行
+                body += '\n' + line
+            # 最初の "Row:" より前の行 ("No result found." 等) は無視
+        if body is not None:
+            yield body
+    
+    def parse_row(self, body: str) -> Dict[str, Optional[str]]:
+        """レコード本文を {列名: 値} に変換 (NULL は None)"""
+        if self.columns is not None and not self.columns.issuperset(self.KEY_TOKEN.findall(body)):
+            return self.fallback.parse_row(body)
+        record = {}
+        for field in self.separator.split(body):
+            key, sep, value = field.partition('=')
+            if not sep:
+                continue
+            record[key] = None if value == self.NULL_VALUE else value
+        return record
+    
+    def parse_rows(self, lines: Iterable[str]) -> Iterator[Dict[str, Optional[str]]]:
+        for body in self.iter_row_bodies(lines):
+            yield self.parse_row(body)
+
+class StreamingReportWriter:
+    """エクスポートファイルへのストリーミング書き込み
+    
+    レコードは受け取った順に1行1件で書き出し、件数と期間 (earliest/latest) も
+    同じパスで集計する。統計情報は全レコードの書き込み後に末尾へ出力する。
+    
+    fmt='json'  : {"rawData": {"Steps": [...], ...}, "statistics": {...}, "extractionInfo": {...}}
+    fmt='ndjson': 1行1レコード、最終行が {"extractionInfo": {...}, "statistics": {...}}
+    
+    timestamp を指定した場合は extractionInfo の timestamp をその値に固定する
+    (同じ入力から同じファイルを作る場合)。
+    """
+    
+    FORMATS = ('json', 'ndjson')
+    
+    def __init__(self, filename: str, device_id: Optional[str] = None, fmt: str = 'json',
+                 timestamp: Optional[str] = None):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"未対応の出力形式です: {fmt}")
+        self.filename = filename
+        self.device_id = device_id
+        self.fmt = fmt
+        self.timestamp = timestamp
+        self.statistics: Dict[str, Dict[str, Any]] = {}
+        self._file = None
+    
+    def __enter__(self) -> 'StreamingReportWriter':
+        self.open()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _dumps(self, obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+    
+    def open(self):
+        self._file = open(self.filename, 'w', encoding='utf-8')
+        if self.fmt == 'json':
+            self._file.write('{"rawData":{')
+    
+    def write_records(self, data_type: str, records: Iterable[Dict[str, Any]], ordered: bool = False) -> int:
+        """1データタイプ分のレコードを書き込み、書き込んだ件数を返す
+        
+        ordered=True の場合、レコードは timestamp 順に並んでいるものとして
+        先頭と末尾を期間とする (比較を省略)。
+        """
+        if data_type in self.statistics:
+            raise ValueError(f"{data_type} は既に書き込み済みです")
+        
+        count = 0
+        earliest = None
+        latest = None
+        write = self._file.write
+        
+        if self.fmt == 'json':
+            if self.statistics:
+                write(',')
+            write(f"\n{self._dumps(data_type)}:[")
+        
+        try:
+            for record in records:
+                if self.fmt == 'json':
+                    write(',\n' if count else '\n')
+                    write(self._dumps(to_record_dict(record)))
+                else:
+                    write(self._dumps(to_record_dict(record)))
+                    write('\n')
+                count += 1
+                
+                timestamp = record.get('timestamp')
+                if not isinstance(timestamp, int):
+                    # 旧形式 (文字列) のエクスポートから読み込んだレコード
+                    timestamp = to_epoch_millis(timestamp)
+                    if timestamp is None:
+                        continue
+                if ordered:
+                    if earliest is None:
+                        earliest = timestamp
+                    latest = timestamp
+                    continue
+                if earliest is None or timestamp < earliest:
+                    earliest = timestamp
+                if latest is None or timestamp > latest:
+                    latest = timestamp
+        finally:
+            # 取得途中で例外が発生しても、書き込み済みのレコードでファイルを閉じられるようにする
+            if self.fmt == 'json':
+                write('\n]')
+            
+            self.statistics[data_type] = {
+                'count': count,
+                'hasData': count > 0,
+                'dateRange': {
+                    'earliest': earliest,
+                    'latest': latest
+                }
+            }
+        return count
+    
+    def write_serialized(self, data_type: str, batches: Iterable[tuple]) -> int:
+        """シリアライズ済みのレコードを書き込み、書き込んだ件数を返す (大量データ生成用)
+        
+        batches は (1件1つのJSON文字列のリスト, 最小 timestamp, 最大 timestamp) を順に返す。
+        """
+        if data_type in self.statistics:
+            raise ValueError(f"{data_type} は既に書き込み済みです")
+        
+        count = 0
+        earliest = None
+        latest = None
+        write = self._file.write
+        
+        if self.fmt == 'json':
+            if self.statistics:
+                write(',')
+            write(f"\n{self._dumps(data_type)}:[")
+        
+        try:
+            for lines, first, last in batches:
+                if not lines:
+                    continue
+                if self.fmt == 'json':
+                    write(',\n' if count else '\n')
+                    write(',\n'.join(lines))
+                else:
+                    write('\n'.join(lines))
+                    write('\n')
+                count += len(lines)
+                if first is not None and (earliest is None or first < earliest):
+                    earliest = first
+                if last is not None and (latest is None or last > latest):
+                    latest = last
+        finally:
+            if self.fmt == 'json':
+                write('\n]')
+            
+            self.statistics[data_type] = {
+                'count': count,
+                'hasData': count > 0,
+                'dateRange': {
+                    'earliest': earliest,
+                    'latest': latest
+                }
+            }
+        return count
+    
+    def extraction_info(self) -> Dict[str, Any]:
+        return {
+            'timestamp': self.timestamp or datetime.datetime.now().isoformat(),
+            'deviceId': self.device_id,
+            'extractionMethod': 'ADB_CONTENT_PROVIDER',
+            'dataTypes': list(self.statistics.keys()),
+            'totalRecords': sum(s['count'] for s in self.statistics.values())
+        }
+    
+    def close(self):
+        """統計情報を書き込んでファイルを閉じる"""
+        if self._file is None:
+            return
+        try:
+            info = self.extraction_info()
+            if self.fmt == 'json':
+                self._file.write(f"\n}},\n\"statistics\":{self._dumps(self.statistics)}")
+                self._file.write(f",\n\"extractionInfo\":{self._dumps(info)}}}\n")
+            else:
+                self._file.write(self._dumps({'extractionInfo': info, 'statistics': self.statistics}))
+                self._file.write('\n')
+        finally:
+            self._file.close()
+            self._file = None
+    
+    def size(self) -> int:
+        """出力したファイルのバイト数"""
+        return os.path.getsize(self.filename)
+
+class _HashingFile:
+    """書き込んだバイト数と SHA-256 を記録するファイル (圧縮ストリームの書き込み先)"""
+    
+    def __init__(self, path: str):
+        self._file = open(path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+    
+    def write(self, data: bytes) -> int:
+        self._file.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self.size
+    
+    def flush(self):
+        self._file.flush()
+    
+    def close(self):
+        self._file.close()
+
+class ChunkedReportWriter(StreamingReportWriter):
+    """圧縮した NDJSON を一定サイズごとのファイル (チャンク) に分けて書き込む
+    
+    filename が "<base>.ndjson.gz" の場合、レコードを <base>_00000.ndjson.gz, <base>_00001.ndjson.gz, ...
+    に順に書き出し、圧縮後のサイズが max_chunk_bytes を超えた時点で次のチャンクに切り替える
+    (圧縮ストリーム内のバッファ分だけ超えることがある)。
+    全チャンクを閉じた後で <base>_manifest.json に各チャンクのデータタイプ・件数・期間・
+    SHA-256 を書き込む。マニフェストは最後に書き込むため、存在すれば出力は完結している。
+    
+    fmt='ndjson.gz' : gzip (標準ライブラリ)
+    fmt='ndjson.zst': zstd (zstandard パッケージが必要)
+    """
+    
+    FORMATS = ('ndjson.gz', 'ndjson.zst')
+    # 圧縮ストリームへまとめて渡す単位 (バイト)
+    BUFFER_BYTES = 256 * 1024
+    
+    def __init__(self, filename: str, device_id: Optional[str] = None, fmt: str = 'ndjson.gz',
+                 max_chunk_bytes: int = OUTPUT_CHUNK_BYTES, level: Optional[int] = None,
+                 timestamp: Optional[str] = None):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"未対応の出力形式です: {fmt}")
+        if fmt == 'ndjson.zst' and zstandard is None:
+            raise ValueError("zstd 圧縮には zstandard パッケージが必要です (pip install zstandard)")
+        super().__init__(filename, device_id, fmt, timestamp)
+        self.base = filename[:-len(fmt) - 1] if filename.endswith(f".{fmt}") else filename
+        self.filename = manifest_filename(self.base)
+        self.max_chunk_bytes = max_chunk_bytes
+        self.level = level
+        self.chunks: List[Dict[str, Any]] = []
+        self._raw: Optional[_HashingFile] = None
+        self._stream = None
+        self._chunk_types: Dict[str, List[Any]] = {}
+        self._chunk_records = 0
+        self._chunk_text_bytes = 0
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._opened = False
+    
+    def open(self):
+        # チャンクは最初のレコードを書き込む時に作成する (0件の場合はマニフェストのみ)
+        self._opened = True
+    
+    def _open_chunk(self):
+        path = f"{self.base}_{len(self.chunks):05d}.{self.fmt}"
+        self._raw = _HashingFile(path)
+        if self.fmt == 'ndjson.gz':
+            # mtime=0: 同じ内容なら同じバイト列 (チェックサム) になるようにする
+            self._stream = gzip.GzipFile(filename='', mode='wb', fileobj=self._raw,
+                                         compresslevel=6 if self.level is None else self.level, mtime=0)
+        else:
+            compressor = zstandard.ZstdCompressor(level=3 if self.level is None else self.level)
+            self._stream = compressor.stream_writer(self._raw, closefd=False)
+        self.chunks.append({'file': os.path.basename(path)})
+        self._chunk_types = {}
+        self._chunk_records = 0
+        self._chunk_text_bytes = 0
+    
+    def _flush_buffer(self):
+        if self._buffer:
+            self._stream.write(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+    
+    def _close_chunk(self):
+        if self._raw is None:
+            return
+        self._flush_buffer()
+        self._stream.close()
+        self._raw.close()
+        times = [t for stats in self._chunk_types.values() for t in stats[1:] if t is not None]
+        self.chunks[-1].update({
+            'records': self._chunk_records,
+            'bytes': self._raw.size,
+            'uncompressedBytes': self._chunk_text_bytes,
+            'sha256': self._raw.sha256.hexdigest(),
+            'earliest': min(times, default=None),
+            'latest': max(times, default=None),
+            'dataTypes': {
+                data_type: {'count': count, 'earliest': earliest, 'latest': latest}
+                for data_type, (count, earliest, latest) in self._chunk_types.items()
+            }
+        })
+        self._raw = None
+        self._stream = None
+    
+    def write_records(self, data_type: str, records: Iterable[Dict[str, Any]], ordered: bool = False) -> int:
+        """1データタイプ分のレコードを書き込み、書き込んだ件数を返す
+        
+        チャンクごとの期間も求めるため、ordered に関わらず全レコードの timestamp を比較する。
+        """
+        if data_type in self.statistics:
+            raise ValueError(f"{data_type} は既に書き込み済みです")
+        
+        count = 0
+        earliest = None
+        latest = None
+        dumps = self._dumps
+        try:
+            for record in records:
+                if self._raw is None:
+                    self._open_chunk()
+                line = (dumps(to_record_dict(record)) + '\n').encode('utf-8')
+                self._buffer.append(line)
+                self._buffered += len(line)
+                self._chunk_text_bytes += len(line)
+                self._chunk_records += 1
+                count += 1
+                
+                stats = self._chunk_types.get(data_type)
+                if stats is None:
+                    stats = self._chunk_types[data_type] = [0, None, None]
+                stats[0] += 1
+                
+                timestamp = record.get('timestamp')
+                if not isinstance(timestamp, int):
+                    timestamp = to_epoch_millis(timestamp)
+                if timestamp is not None:
+                    if earliest is None or timestamp < earliest:
+                        earliest = timestamp
+                    if latest is None or timestamp > latest:
+                        latest = timestamp
+                    if stats[1] is None or timestamp < stats[1]:
+                        stats[1] = timestamp
+                    if stats[2] is None or timestamp > stats[2]:
+                        stats[2] = timestamp
+                
+                if self._buffered >= self.BUFFER_BYTES:
+                    self._flush_buffer()
+                    if self._raw.tell() >= self.max_chunk_bytes:
+                        self._close_chunk()
+        finally:
+            self.statistics[data_type] = {
+                'count': count,
+                'hasData': count > 0,
+                'dateRange': {
+                    'earliest': earliest,
+                    'latest': latest
+                }
+            }
+        return count
+    
+    def write_serialized(self, data_type: str, batches: Iterable[tuple]) -> int:
+        """シリアライズ済みのレコードを書き込み、書き込んだ件数を返す (大量データ生成用)
+        
+        バッチは分割せずに1つのチャンクに書き込む (チャンクの切り替えはバッチの間でのみ行う)。
+        """
+        if data_type in self.statistics:
+            raise ValueError(f"{data_type} は既に書き込み済みです")
+        
+        count = 0
+        earliest = None
+        latest = None
+        try:
+            for lines, first, last in batches:
+                if not lines:
+                    continue
+                if self._raw is None:
+                    self._open_chunk()
+                data = ('\n'.join(lines) + '\n').encode('utf-8')
+                self._buffer.append(data)
+                self._buffered += len(data)
+                self._chunk_text_bytes += len(data)
+                self._chunk_records += len(lines)
+                count += len(lines)
+                
+                stats = self._chunk_types.get(data_type)
+                if stats is None:
+                    stats = self._chunk_types[data_type] = [0, None, None]
+                stats[0] += len(lines)
+                if first is not None:
+                    if earliest is None or first < earliest:
+                        earliest = first
+                    if stats[1] is None or first < stats[1]:
+                        stats[1] = first
+                if last is not None:
+                    if latest is None or last > latest:
+                        latest = last
+                    if stats[2] is None or last > stats[2]:
+                        stats[2] = last
+                
+                if self._buffered >= self.BUFFER_BYTES:
+                    self._flush_buffer()
+                    if self._raw.tell() >= self.max_chunk_bytes:
+                        self._close_chunk()
+        finally:
+            self.statistics[data_type] = {
+                'count': count,
+                'hasData': count > 0,
+                'dateRange': {
+                    'earliest': earliest,
+                    'latest': latest
+                }
+            }
+        return count
+    
+    def size(self) -> int:
+        """全チャンクとマニフェストの合計バイト数"""
+        total = sum(chunk.get('bytes', 0) for chunk in self.chunks)
+        return total + (os.path.getsize(self.filename) if os.path.exists(self.filename) else 0)
+    
+    def close(self):
+        """最後のチャンクを閉じてマニフェストを書き込む"""
+        if not self._opened:
+            return
+        self._opened = False
+        try:
+            self._close_chunk()
+        finally:
+            info = self.extraction_info()
+            info['format'] = self.fmt
+            manifest = {
+                'extractionInfo': info,
+                'statistics': self.statistics,
+                'maxChunkBytes': self.max_chunk_bytes,
+                'chunks': self.chunks
+            }
+            tmp_path = f"{self.filename}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.filename)
+
+def manifest_filename(base: str) -> str:
+    """チャンク出力のマニフェストのファイル名 (<base>_manifest.json)"""
+    return f"{base}{MANIFEST_SUFFIX}"
+
+def available_formats() -> List[str]:
+    """この環境で使える出力形式 (ndjson.zst は zstandard パッケージがある場合のみ)"""
+    return list(StreamingReportWriter.FORMATS) + [
+        fmt for fmt in ChunkedReportWriter.FORMATS if fmt != 'ndjson.zst' or zstandard is not None] + [COLUMNAR_FORMAT]
+
+def open_report_writer(filename: str, device_id: Optional[str] = None, fmt: str = 'json',
+                       max_chunk_bytes: int = OUTPUT_CHUNK_BYTES,
+                       timestamp: Optional[str] = None) -> StreamingReportWriter:
+    """出力形式に応じた書き込み
+    
+    json / ndjson は1ファイル、ndjson.gz / ndjson.zst はチャンク、npz はデータタイプごとの列指向テーブル。
+    """
+    if fmt == COLUMNAR_FORMAT:
+        # health_connect_columnar_export はこのモジュールを読み込むため、使う時に読み込む
+        from health_connect_columnar_export import ColumnarReportWriter
+        return ColumnarReportWriter(filename, device_id, fmt, timestamp)
+    if fmt in ChunkedReportWriter.FORMATS:
+        return ChunkedReportWriter(filename, device_id, fmt, max_chunk_bytes, timestamp=timestamp)
+    return StreamingReportWriter(filename, device_id, fmt, timestamp)
+
+def open_chunk(path: str) -> TextIO:
+    """チャンクファイルをテキストとして開く"""
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError("zstd 圧縮のチャンクを読むには zstandard パッケージが必要です (pip install zstandard)")
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), encoding='utf-8')
+    return gzip.open(path, 'rt', encoding='utf-8')
+
+def select_chunks(manifest: Dict[str, Any], data_types: Optional[Iterable[str]] = None,
+                  start: Optional[int] = None, end: Optional[int] = None) -> List[Dict[str, Any]]:
+    """データタイプ・期間 [start, end) に該当するレコードを含む可能性のあるチャンクだけを返す"""
+    data_types = set(data_types) if data_types is not None else None
+    selected = []
+    for chunk in manifest.get('chunks', []):
+        ranges = chunk.get('dataTypes', {})
+        if data_types is not None:
+            ranges = {t: r for t, r in ranges.items() if t in data_types}
+        if not ranges:
+            continue
+        for stats in ranges.values():
+            if stats.get('earliest') is None:
+                # 時刻の無いレコードを含むチャンクは除外しない
+                selected.append(chunk)
+                break
+            if (start is None or stats['latest'] >= start) and (end is None or stats['earliest'] < end):
+                selected.append(chunk)
+                break
+    return selected
+
+def verify_chunk(path: str, chunk: Dict[str, Any]) -> bool:
+    """チャンクファイルのサイズと SHA-256 がマニフェストと一致するか確認"""
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+            size += len(block)
+    return size == chunk.get('bytes') and sha256.hexdigest() == chunk.get('sha256')
+
+def iter_chunk_records(manifest_file: str, data_types: Optional[Iterable[str]] = None,
+                       start: Optional[int] = None, end: Optional[int] = None,
+                       verify: bool = False) -> Iterator[Dict[str, Any]]:
+    """チャンク出力のレコードを順に返す
+    
+    data_types / start / end を指定した場合はマニフェストで該当しないチャンクを読まずに飛ばす
+    (該当するチャンク内のレコードは絞り込まずに全て返す)。
+    verify=True の場合は読む前にチェックサムを確認し、一致しなければ ValueError を送出する。
+    """
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(manifest_file)
+    for chunk in select_chunks(manifest, data_types, start, end):
+        path = os.path.join(directory, chunk['file'])
+        if verify and not verify_chunk(path, chunk):
+            raise ValueError(f"チャンクのチェックサムが一致しません: {path}")
+        with open_chunk(path) as lines:
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+def remove_export(filename: str):
+    """エクスポートを削除 (チャンク出力はマニフェストに記録された全チャンクも削除)"""
+    if filename.endswith(MANIFEST_SUFFIX):
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                chunks = json.load(f).get('chunks', [])
+        except (OSError, ValueError):
+            chunks = []
+        directory = os.path.dirname(filename)
+        for chunk in chunks:
+            path = os.path.join(directory, chunk['file'])
+            if os.path.exists(path):
+                os.remove(path)
+    if os.path.exists(filename):
+        os.remove(filename)
+
+def load_export(filename: str) -> Dict[str, Any]:
+    """JSON / NDJSON 形式のエクスポート (チャンク出力はマニフェスト) を読み込み、JSON形式と同じ構造で返す"""
+    if filename.endswith(MANIFEST_SUFFIX):
+        with open(filename, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        report = {'rawData': {}, 'statistics': manifest.get('statistics', {}),
+                  'extractionInfo': manifest.get('extractionInfo', {})}
+        for item in iter_chunk_records(filename):
+            report['rawData'].setdefault(item.get('dataType'), []).append(item)
+        return report
+    
+    if filename.endswith('.ndjson'):
+        report = {'rawData': {}}
+        with open(filename, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if 'extractionInfo' in item:
+                    report.update(item)
+                else:
+                    report['rawData'].setdefault(item.get('dataType'), []).append(item)
+        return report
+    
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+class ExtractionMetrics:
+    """端末・データタイプごとのカウンターとタイマー
+    
+    複数スレッド (データタイプの並列取得・フリート取得) から同時に更新できる。
+    write() で JSON、または Prometheus の textfile collector 形式 (.prom) で保存する。
+    """
+    
+    PREFIX = 'health_connect_'
+    HELP = {
+        'queries': 'content query の実行回数',
+        'query_errors': '失敗した content query の数',
+        'query_timeouts': 'タイムアウトした content query の数',
+        'session_errors': '途中で終了した adb shell セッションの数',
+        'chunk_retries': 'タイムアウト後に時間窓を再試行した回数',
+        'failed_chunks': '取得を諦めた時間窓の数',
+        'bytes_read': 'adb から読み込んだバイト数',
+        'rows_read': 'adb から読み込んだ行 (レコード) 数',
+        'duplicate_rows': '再試行で重複したため除外した行数',
+        'records_parsed': 'パース・変換したレコード数',
+        'parse_errors': 'パースに失敗した行数',
+        'records_written': 'ファイルに書き込んだレコード数',
+        'bytes_written': 'ファイルに書き込んだバイト数',
+        'query_seconds': 'content query の開始から出力の読み終わりまでの時間',
+        'adb_wait_seconds': 'adb の出力待ちの時間 (USB・端末側の処理時間)',
+        'first_row_seconds': 'content query の開始から最初の出力までの時間',
+        'write_seconds': 'ファイル保存の時間',
+        'device_seconds': '端末1台分の取得・保存の時間',
+        'sync_cycles': 'watch モードで実行した差分取得の回数',
+        'sync_errors': 'watch モードで失敗した差分取得の回数',
+        'sync_seconds': 'watch モードの差分取得1回 (取得・保存・反映) の時間'
+    }
+    
     def __init__(self):
-        self.device_id = None
+        self.started_at = datetime.datetime.now().isoformat()
+        self.counters: Dict[tuple, float] = {}
+        # (名前, 端末ID, データタイプ) -> [回数, 合計秒, 最大秒]
+        self.timers: Dict[tuple, List[float]] = {}
+        self._lock = threading.Lock()
+    
+    def add(self, name: str, value: float = 1, device_id: Optional[str] = None, data_type: Optional[str] = None):
+        key = (name, device_id, data_type)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name: str, seconds: float, device_id: Optional[str] = None, data_type: Optional[str] = None):
+        key = (name, device_id, data_type)
+        with self._lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+    
+    @contextlib.contextmanager
+    def timer(self, name: str, device_id: Optional[str] = None, data_type: Optional[str] = None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, device_id, data_type)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = sorted(self.counters.items(), key=lambda item: tuple(str(k) for k in item[0]))
+            timers = sorted(self.timers.items(), key=lambda item: tuple(str(k) for k in item[0]))
+            return {
+                'startedAt': self.started_at,
+                'generatedAt': datetime.datetime.now().isoformat(),
+                'counters': [
+                    {'name': name, 'deviceId': device_id, 'dataType': data_type, 'value': value}
+                    for (name, device_id, data_type), value in counters
+                ],
+                'timers': [
+                    {'name': name, 'deviceId': device_id, 'dataType': data_type,
+                     'count': count, 'sum': round(total, 6), 'max': round(longest, 6)}
+                    for (name, device_id, data_type), (count, total, longest) in timers
+                ]
+            }
+    
+    @staticmethod
+    def _labels(device_id: Optional[str], data_type: Optional[str]) -> str:
+        labels = []
+        for label, value in (('device', device_id), ('data_type', data_type)):
+            if value is not None:
+                escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                labels.append(f'{label}="{escaped}"')
+        return '{' + ','.join(labels) + '}' if labels else ''
+    
+    def to_prometheus(self) -> str:
+        """Prometheus のテキスト形式 (カウンターは *_total、タイマーは summary)"""
+        snapshot = self.to_dict()
+        lines = []
+        
+        def header(metric: str, name: str, kind: str):
+            lines.append(f"# HELP {metric} {self.HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} {kind}")
+        
+        previous = None
+        for item in snapshot['counters']:
+            metric = f"{self.PREFIX}{item['name']}_total"
+            if item['name'] != previous:
+                header(metric, item['name'], 'counter')
+                previous = item['name']
+            lines.append(f"{metric}{self._labels(item['deviceId'], item['dataType'])} {item['value']}")
+        
+        previous = None
+        for item in snapshot['timers']:
+            metric = f"{self.PREFIX}{item['name']}"
+            labels = self._labels(item['deviceId'], item['dataType'])
+            if item['name'] != previous:
+                header(metric, item['name'], 'summary')
+                previous = item['name']
+            lines.append(f"{metric}_sum{labels} {item['sum']}")
+            lines.append(f"{metric}_count{labels} {item['count']}")
+        return '\n'.join(lines) + '\n'
+    
+    def write(self, filename: str) -> Optional[str]:
+        """拡張子が .prom なら Prometheus 形式、それ以外は JSON で保存"""
+        try:
+            # textfile collector が書きかけのファイルを読まないよう一時ファイルから置き換える
+            tmp_path = f"{filename}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                if filename.endswith('.prom'):
+                    f.write(self.to_prometheus())
+                else:
+                    json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, filename)
+            print(f"📊 メトリクスを保存しました: {filename}")
+            return filename
+        except OSError as e:
+            print(f"❌ メトリクス保存エラー: {e}")
+            return None
+
+@contextlib.contextmanager
+def profiling(filename: Optional[str]):
+    """filename を指定した場合、ブロック内の処理を cProfile で計測して保存する
+    
+    cProfile は呼び出したスレッドのみを計測する (並列取得のワーカースレッドは含まれない)。
+    """
+    if not filename:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(filename)
+        print(f"📊 プロファイルを保存しました: {filename} (python -m pstats {filename})")
+
+class AdbSessionError(RuntimeError):
+    """adb shell セッションが途中で終了した"""
+
+class _PendingCommand:
+    __slots__ = ('marker', 'queue', 'abandoned')
+    
+    def __init__(self, marker: str):
+        self.marker = marker
+        self.queue: 'queue.Queue' = queue.Queue(maxsize=10000)
+        self.abandoned = False
+
+class AdbShellSession:
+    """端末ごとに起動したままの `adb shell` でコマンドを実行する
+    
+    コマンドごとに adb のハンドシェイクとシェル起動を行わずに済むよう、
+    1本の `adb shell` の標準入力にコマンドを順に書き込む。各コマンドの後に
+    一意の終了マーカーを echo し、読み取りスレッドが出力をマーカー単位で
+    呼び出し元へ振り分ける。セッションが終了した場合は次のコマンドで再起動する。
+    """
+    
+    MARKER_PREFIX = '__HC_EXTRACTOR_END_'
+    _END = object()
+    _DEAD = object()
+    
+    def __init__(self, device_id: str, adb_path: str = ADB_PATH):
+        self.device_id = device_id
+        self.adb_path = adb_path
+        self.process: Optional[subprocess.Popen] = None
+        # 実行中のプロセスに送信済みで、出力待ちのコマンド (送信順)
+        self._pending: 'collections.deque[_PendingCommand]' = collections.deque()
+        self._reading = False
+        self._lock = threading.Lock()
+    
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+    
+    def is_alive(self) -> bool:
+        return self.process is not None and self._reading and self.process.poll() is None
+    
+    def _start(self):
+        self.process = subprocess.Popen(
+            [self.adb_path, '-s', self.device_id, 'shell'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', errors='replace', bufsize=1
+        )
+        # 前のプロセスの読み取りスレッドが残っていても混ざらないよう待ち行列を分ける
+        self._pending = collections.deque()
+        self._reading = True
+        reader = threading.Thread(target=self._read_output, args=(self.process, self._pending), daemon=True)
+        reader.start()
+    
+    def _deliver(self, command: _PendingCommand, item: Any):
+        # 呼び出し側が読むのをやめたコマンドの出力は捨てる
+        while not command.abandoned:
+            try:
+                command.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def _read_output(self, process: subprocess.Popen, pending: 'collections.deque[_PendingCommand]'):
+        """出力を読み、先頭の実行中コマンドへ振り分ける"""
+        for line in process.stdout:
+            line = line.rstrip('\r\n')
+            if not pending:
+                continue
+            command = pending[0]
+            position = line.find(command.marker)
+            if position < 0:
+                self._deliver(command, line)
+                continue
+            # 改行で終わらない出力の直後にマーカーが続く場合がある
+            if position > 0:
+                self._deliver(command, line[:position])
+            returncode = line[position + len(command.marker):].strip()
+            with self._lock:
+                pending.popleft()
+            self._deliver(command, (self._END, int(returncode) if returncode.lstrip('-').isdigit() else -1))
+        
+        # セッション終了: 残っているコマンドは全て失敗扱い
+        with self._lock:
+            if self.process is process:
+                self._reading = False
+            remaining = list(pending)
+            pending.clear()
+        for command in remaining:
+            self._deliver(command, (self._DEAD, None))
+    
+    def _submit(self, args: List[str]) -> _PendingCommand:
+        command = _PendingCommand(f"{self.MARKER_PREFIX}{uuid.uuid4().hex}")
+        line = f"{shell_command(args)} 2>/dev/null; echo \"{command.marker} $?\"\n"
+        with self._lock:
+            if not self.is_alive():
+                self._start()
+            self._pending.append(command)
+            try:
+                self.process.stdin.write(line)
+                self.process.stdin.flush()
+            except OSError:
+                self._pending.remove(command)
+                self.kill()
+                raise AdbSessionError(f"{self.device_id}: adb shell に書き込めません")
+        return command
+    
+    def execute(self, args: List[str], timeout: float) -> Iterator[str]:
+        """コマンドを実行し、出力を1行ずつ返す
+        
+        timeout 秒以内に出力が完了しない場合はセッションを停止して TimeoutExpired、
+        終了コードが0以外の場合は CalledProcessError を送出する。
+        出力前にセッションが終了した場合は1回だけ再起動して再実行する。
+        """
+        deadline = time.monotonic() + timeout
+        command = self._submit(args)
+        yielded = False
+        retried = False
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = command.queue.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    # 実行中のコマンドを止める手段が無いためセッションごと作り直す
+                    self.kill()
+                    raise subprocess.TimeoutExpired(args, timeout)
+                
+                if isinstance(item, tuple) and item[0] is self._END:
+                    if item[1] != 0:
+                        raise subprocess.CalledProcessError(item[1], args)
+                    return
+                if isinstance(item, tuple) and item[0] is self._DEAD:
+                    if yielded or retried:
+                        raise AdbSessionError(f"{self.device_id}: adb shell が終了しました")
+                    retried = True
+                    command = self._submit(args)
+                    continue
+                yielded = True
+                yield item
+        finally:
+            command.abandoned = True
+    
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+    
+    def close(self):
+        """セッションを終了する"""
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.write('exit\n')
+                self.process.stdin.flush()
+                self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        self.process = None
+
+def shell_command(args: List[str]) -> str:
+    """端末側シェルで1つのコマンドとして解釈されるようにクォートする"""
+    return ' '.join(shlex.quote(arg) for arg in args)
+
+class HealthConnectExtractor:
+    def __init__(self, device_id: Optional[str] = None):
+        self.device_id = device_id
+        self.adb_path = ADB_PATH
+        # 計測する場合は ExtractionMetrics を設定する
+        self.metrics: Optional[ExtractionMetrics] = None
         self.supported_data_types = [
             'Steps',
             'HeartRate', 
@@ -41,21 +1385,62 @@ class HealthConnectExtractor:
             'OxygenSaturation',
             'BodyTemperature'
         ]
+        # クエリ設定: 1回のcontent queryのタイムアウト(秒)と時間窓の分割幅
+        self.query_timeout = 30
+        self.chunk_days = 7
+        self.min_chunk_minutes = 60
+        self.max_chunk_retries = 3
+        # ndjson.gz / ndjson.zst 形式で保存する場合の1ファイルあたりの圧縮後サイズの目安
+        self.output_chunk_bytes = OUTPUT_CHUNK_BYTES
+        # 期間レコードの重なりを解消する場合のデータ提供元の優先順位 (None で解消しない)
+        self.resolve_priority: Optional[List[str]] = None
+        # データタイプごとの取得失敗した時間窓 [(開始ms, 終了ms), ...]
+        self.failed_chunks: Dict[str, List[tuple]] = {}
+        self.row_parser = ContentRowParser()
+        # PROJECTIONS の列だけを取得する (False で全列を取得)
+        self.use_projection = True
+        # 端末側で並べ替える列 (None で並べ替えなし)
+        self.sort_order: Optional[str] = 'start_time'
+        # projection / sort を指定したクエリが失敗したデータタイプ (以降は指定なしで取得)
+        self.plain_query_types = set()
+        self._row_parsers: Dict[Optional[tuple], ContentRowParser] = {None: self.row_parser}
+        # 起動したままの adb shell でクエリを実行する (False でクエリごとに adb shell を起動)
+        self.use_shell_session = True
+        # 同時に使う adb shell セッションの上限
+        self.shell_session_count = 1
+        self._shell_sessions: List[AdbShellSession] = []
+        self._shell_sessions_lock = threading.Lock()
+        self._shared_columns: Dict[tuple, tuple] = {}
+    
+    def list_devices(self) -> List[str]:
+        """`adb devices` から利用可能 (device状態) な端末IDを全て取得"""
+        result = subprocess.run([self.adb_path, 'devices'],
+                                capture_output=True, text=True, check=True)
+        devices = []
+        for line in result.stdout.strip().split('\n')[1:]:  # ヘッダーを除く
+            parts = line.split('\t')
+            if len(parts) < 2:
+                continue
+            serial, state = parts[0].strip(), parts[1].strip()
+            if state == 'device':
+                devices.append(serial)
+            else:
+                # unauthorized / offline の端末は対象外
+                print(f"⚠️ デバイス {serial}: {state} のためスキップ")
+        return devices
     
     def check_adb_connection(self) -> bool:
         """ADB接続を確認"""
         try:
-            result = subprocess.run(['adb', 'devices'], 
-                                  capture_output=True, text=True, check=True)
-            devices = result.stdout.strip().split('\n')[1:]  # ヘッダーを除く
+            devices = self.list_devices()
             
-            if not devices or all(not line.strip() for line in devices):
+            if not devices:
                 print("❌ Androidデバイスが接続されていません")
                 print("USBデバッグを有効にしてデバイスを接続してください")
                 return False
             
             # 最初のデバイスを使用
-            self.device_id = devices[0].split('\t')[0]
+            self.device_id = devices[0]
             print(f"✅ デバイス接続確認: {self.device_id}")
             return True
             
@@ -71,10 +1456,10 @@ class HealthConnectExtractor:
     def check_health_connect(self) -> bool:
         """Health Connectアプリの存在確認"""
         try:
-            cmd = ['adb', '-s', self.device_id, 'shell', 'pm', 'list', 'packages', 'com.google.android.apps.healthdata']
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            args = ['pm', 'list', 'packages', 'com.google.android.apps.healthdata']
+            output = '\n'.join(self.run_shell(args, self.query_timeout))
             
-            if 'com.google.android.apps.healthdata' in result.stdout:
+            if 'com.google.android.apps.healthdata' in output:
                 print("✅ Health Connectアプリが見つかりました")
                 return True
             else:
@@ -82,128 +1467,401 @@ class HealthConnectExtractor:
                 print("Google Play StoreからHealth Connectをインストールしてください")
                 return False
                 
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, AdbSessionError) as e:
             print(f"❌ Health Connectチェックエラー: {e}")
             return False
     
-    def get_health_connect_data(self, data_type: str, days_back: int = 30) -> List[Dict[str, Any]]:
-        """指定されたデータタイプの生データを取得"""
+    def get_health_connect_data(self, data_type: str, days_back: int = 30,
+                                start_timestamp: Optional[int] = None,
+                                modified_since: Optional[int] = None) -> List[Dict[str, Any]]:
+        """指定されたデータタイプの生データを取得
+        
+        start_timestamp (ミリ秒) を指定した場合は days_back より優先して
+        取得範囲の開始とする (差分取得用)。
+        modified_since (ミリ秒) を指定した場合は開始時刻に関わらず、それ以降に
+        追加・更新されたレコードを開始時刻順で返す (差分取得用)。
+        """
         print(f"🔍 {data_type}データを取得中...")
         
+        try:
+            raw_data = list(self.iter_health_connect_data(data_type, days_back, start_timestamp, modified_since))
+            if modified_since is not None:
+                # 更新日時の時間窓ごとに取得するため、窓をまたぐと開始時刻順にならない
+                raw_data.sort(key=record_timestamp)
+        except subprocess.CalledProcessError:
+            # アクセス権限なし等はデータタイプ全体のエラー
+            print(f"⚠️ {data_type}: データなし または アクセス権限なし")
+            return []
+        
+        if raw_data:
+            print(f"✅ {data_type}: {len(raw_data)}件のデータを取得")
+        else:
+            print(f"⚠️ {data_type}: データなし または アクセス権限なし")
+        return raw_data
+    
+    def iter_health_connect_data(self, data_type: str, days_back: int = 30,
+                                 start_timestamp: Optional[int] = None,
+                                 modified_since: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """指定されたデータタイプのレコードを1件ずつ返すジェネレータ
+        
+        adbの出力を行単位で読みながらパースするため、メモリ使用量は
+        取得件数に依存しない。時間窓ごとに順番に取得し、タイムアウトした
+        窓は幅を縮めて再試行する。コマンド自体が失敗した場合は
+        CalledProcessError を送出する。
+        modified_since を指定した場合は開始時刻ではなく更新日時 (last_modified_time) の
+        時間窓で、modified_since 以降に追加・更新されたレコードを取得する。
+        """
         # 日付範囲を計算（ミリ秒）
         end_time = datetime.datetime.now()
-        start_time = end_time - datetime.timedelta(days=days_back)
-        start_timestamp = int(start_time.timestamp() * 1000)
         end_timestamp = int(end_time.timestamp() * 1000)
+        if modified_since is not None:
+            start_timestamp = modified_since
+        elif start_timestamp is None:
+            start_time = end_time - datetime.timedelta(days=days_back)
+            start_timestamp = int(start_time.timestamp() * 1000)
+        
+        failed = []
+        chunk_ms = self.chunk_days * 24 * 60 * 60 * 1000
+        min_chunk_ms = self.min_chunk_minutes * 60 * 1000
+        window = chunk_ms
+        retries = 0
+        cursor = start_timestamp
+        # タイムアウトした時間窓で既に返した行の件数 (replay_end までの再取得で読み飛ばす)
+        seen_rows = collections.Counter()
+        replay_end = cursor
         
         try:
-            # Health Connect Content Providerへのクエリ
-            uri = f"content://com.google.android.apps.healthdata.provider/records/{data_type}"
-            
-            cmd = [
-                'adb', '-s', self.device_id, 'shell', 'content', 'query',
-                '--uri', uri,
-                '--where', 'start_time >= ? AND end_time <= ?',
-                '--bind', str(start_timestamp),
-                '--bind', str(end_timestamp)
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0 and result.stdout.strip():
-                # 結果をパース
-                raw_data = self.parse_content_provider_output(result.stdout, data_type)
-                print(f"✅ {data_type}: {len(raw_data)}件のデータを取得")
-                return raw_data
-            else:
-                print(f"⚠️ {data_type}: データなし または アクセス権限なし")
-                return []
+            while cursor < end_timestamp:
+                chunk_end = min(cursor + window, end_timestamp)
+                replaying = cursor < replay_end
+                if not replaying:
+                    seen_rows.clear()
+                # この窓で返した行 (タイムアウトした場合のみ seen_rows に加える)
+                window_rows = collections.Counter()
+                try:
+                    lines = self.stream_chunk(data_type, cursor, chunk_end, end_timestamp,
+                                              modified_since is not None)
+                    if self.metrics is not None:
+                        lines = self.metered_lines(lines, data_type)
+                    yield from self.iter_parse_content_provider_lines(
+                        lines, data_type, seen_rows if replaying else None, window_rows)
+                except subprocess.CalledProcessError:
+                    if data_type in self.plain_query_types or not (self.query_projection(data_type) or self.sort_order):
+                        raise
+                    # projection / sort に対応しない端末では指定なしで同じ窓を取り直す
+                    print(f"⚠️ {data_type}: 列指定・並べ替えなしで再試行")
+                    self.plain_query_types.add(data_type)
+                    seen_rows.update(window_rows)
+                    replay_end = max(replay_end, chunk_end)
+                    continue
+                except (subprocess.TimeoutExpired, AdbSessionError):
+                    seen_rows.update(window_rows)
+                    replay_end = max(replay_end, chunk_end)
+                    if window > min_chunk_ms:
+                        window = max(window // 2, min_chunk_ms)
+                        print(f"⏰ {data_type}: タイムアウト - 時間窓を{window // 60000}分に縮小して再試行")
+                        continue
+                    retries += 1
+                    if retries <= self.max_chunk_retries:
+                        self.record_metric('chunk_retries', data_type)
+                        print(f"⏰ {data_type}: タイムアウト - 再試行 ({retries}/{self.max_chunk_retries})")
+                        continue
+                    # 諦めた窓は記録して次の窓へ進む (取得済みの窓は保持)
+                    failed_from = datetime.datetime.fromtimestamp(cursor / 1000).isoformat()
+                    failed_to = datetime.datetime.fromtimestamp(chunk_end / 1000).isoformat()
+                    print(f"❌ {data_type}: {failed_from}〜{failed_to} の取得に失敗")
+                    failed.append((cursor, chunk_end))
+                    self.record_metric('failed_chunks', data_type)
+                    cursor = chunk_end
+                    retries = 0
+                    continue
                 
+                cursor = chunk_end
+                retries = 0
+        finally:
+            if failed:
+                self.failed_chunks[data_type] = failed
+            else:
+                self.failed_chunks.pop(data_type, None)
+    
+    def record_metric(self, name: str, data_type: Optional[str] = None, value: float = 1):
+        if self.metrics is not None:
+            self.metrics.add(name, value, self.device_id, data_type)
+    
+    def metered_lines(self, lines: Iterable[str], data_type: str) -> Iterator[str]:
+        """adb の出力を計測しながら返す
+        
+        出力待ちの時間 (adb_wait_seconds) とクエリ全体の時間 (query_seconds) の差が
+        パース・変換・書き込みにかかった時間になる。
+        """
+        metrics = self.metrics
+        device_id = self.device_id
+        clock = time.perf_counter
+        started = clock()
+        waited = 0.0
+        size = 0
+        first = True
+        iterator = iter(lines)
+        metrics.add('queries', 1, device_id, data_type)
+        try:
+            while True:
+                before = clock()
+                try:
+                    line = next(iterator)
+                except StopIteration:
+                    waited += clock() - before
+                    break
+                now = clock()
+                waited += now - before
+                if first:
+                    metrics.observe('first_row_seconds', now - started, device_id, data_type)
+                    first = False
+                size += len(line) + 1
+                yield line
         except subprocess.TimeoutExpired:
-            print(f"⏰ {data_type}: タイムアウト")
-            return []
-        except subprocess.CalledProcessError as e:
-            print(f"❌ {data_type}: エラー - {e}")
-            return []
+            metrics.add('query_timeouts', 1, device_id, data_type)
+            raise
+        except subprocess.CalledProcessError:
+            metrics.add('query_errors', 1, device_id, data_type)
+            raise
+        except AdbSessionError:
+            metrics.add('session_errors', 1, device_id, data_type)
+            raise
+        finally:
+            metrics.add('bytes_read', size, device_id, data_type)
+            metrics.observe('adb_wait_seconds', waited, device_id, data_type)
+            metrics.observe('query_seconds', clock() - started, device_id, data_type)
+    
+    def stream_chunk(self, data_type: str, chunk_start: int, chunk_end: int, end_timestamp: int,
+                     modified: bool = False) -> Iterator[str]:
+        """1つの時間窓に対してcontent queryを実行し、出力を1行ずつ返す
+        
+        開始時刻が [chunk_start, chunk_end) に入り、end_timestamp までに終わるレコードを取得する。
+        modified=True の場合は更新日時が [chunk_start, chunk_end) に入るレコードを取得する
+        (最後の窓は上限なし: 端末の時計が進んでいても取りこぼさない)。
+        """
+        # Health Connect Content Providerへのクエリ
+        uri = f"content://com.google.android.apps.healthdata.provider/records/{data_type}"
+        
+        # content query は --bind に対応しないため、数値をそのまま条件に埋め込む
+        if modified:
+            where = f"last_modified_time >= {int(chunk_start)}"
+            if chunk_end < end_timestamp:
+                where += f" AND last_modified_time < {int(chunk_end)}"
+        else:
+            where = (f"start_time >= {int(chunk_start)} AND start_time < {int(chunk_end)}"
+                     f" AND end_time <= {int(end_timestamp)}")
+        args = ['content', 'query', '--uri', uri]
+        projection = self.query_projection(data_type)
+        if projection:
+            args += ['--projection', ':'.join(projection)]
+        args += ['--where', where]
+        if self.sort_order and data_type not in self.plain_query_types:
+            args += ['--sort', self.sort_order]
+        return self.run_shell(args, self.query_timeout)
+    
+    def query_projection(self, data_type: str) -> Optional[tuple]:
+        """クエリで指定する列 (全列を取得する場合は None)"""
+        if not self.use_projection or data_type in self.plain_query_types:
+            return None
+        return PROJECTIONS.get(data_type)
+    
+    def is_ordered(self, data_type: str) -> bool:
+        """取得結果が開始時刻順に並んでいるか"""
+        return self.sort_order == 'start_time' and data_type not in self.plain_query_types
+    
+    def row_parser_for(self, data_type: str) -> ContentRowParser:
+        """列名が分かっている場合はその列名だけを区切りに使うパーサーを返す"""
+        projection = self.query_projection(data_type)
+        parser = self._row_parsers.get(projection)
+        if parser is None:
+            parser = self._row_parsers.setdefault(projection, ContentRowParser(projection))
+        return parser
+    
+    def run_shell(self, args: List[str], timeout: float) -> Iterator[str]:
+        """端末上でシェルコマンドを実行し、出力を1行ずつ返す
+        
+        timeout 秒を超えた場合は TimeoutExpired、コマンドが失敗した場合は
+        CalledProcessError を送出する。
+        """
+        if self.use_shell_session:
+            return self.get_shell_session().execute(args, timeout)
+        return self._run_shell_process(args, timeout)
+    
+    def _run_shell_process(self, args: List[str], timeout: float) -> Iterator[str]:
+        """コマンドごとに adb shell を起動して実行"""
+        # adb shell は引数を空白で連結して端末側シェルに渡すため、1つの文字列にクォートして渡す
+        cmd = [self.adb_path, '-s', self.device_id, 'shell', shell_command(args)]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                   text=True, encoding='utf-8', errors='replace')
+        timed_out = threading.Event()
+        
+        def kill_on_timeout():
+            timed_out.set()
+            process.kill()
+        
+        watchdog = threading.Timer(timeout, kill_on_timeout)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            for line in process.stdout:
+                yield line.rstrip('\r\n')
+            returncode = process.wait()
+        finally:
+            watchdog.cancel()
+            if process.poll() is None:
+                # 呼び出し側が途中で読むのをやめた場合
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+    
+    def get_shell_session(self) -> AdbShellSession:
+        """待ちコマンドの最も少ないセッションを返す (必要なら作成)"""
+        with self._shell_sessions_lock:
+            idle = [s for s in self._shell_sessions if s.pending_count == 0]
+            if not idle and len(self._shell_sessions) < max(self.shell_session_count, 1):
+                session = AdbShellSession(self.device_id, self.adb_path)
+                self._shell_sessions.append(session)
+                return session
+            candidates = idle or self._shell_sessions
+            return min(candidates, key=lambda s: s.pending_count)
+    
+    def close(self):
+        """起動したままの adb shell セッションを終了する"""
+        with self._shell_sessions_lock:
+            sessions = self._shell_sessions
+            self._shell_sessions = []
+        for session in sessions:
+            session.close()
     
     def parse_content_provider_output(self, output: str, data_type: str) -> List[Dict[str, Any]]:
         """Content Providerの出力をパース"""
-        records = []
-        lines = output.strip().split('\n')
+        return list(self.iter_parse_content_provider_lines(io.StringIO(output), data_type))
+    
+    def iter_parse_content_provider_lines(self, lines: Iterable[str], data_type: str,
+                                          seen_rows: Optional[collections.Counter] = None,
+                                          yielded_rows: Optional[collections.Counter] = None
+                                          ) -> Iterator[HealthRecord]:
+        """Content Providerの出力を1行ずつパースし、レコードを順に返す
         
-        for line in lines:
-            if not line.strip() or line.startswith('Row:'):
-                continue
-                
-            try:
-                # Content Providerの出力形式をパース
-                # 例: "column1=value1, column2=value2, ..."
-                record = {}
-                parts = line.split(', ')
-                
-                for part in parts:
-                    if '=' in part:
-                        key, value = part.split('=', 1)
-                        record[key.strip()] = value.strip()
+        seen_rows (行本文の SHA-1 → 既に返した件数) を渡した場合、同じ行は記録された件数まで
+        スキップする (同じ内容の行が複数あっても、前回返した件数を超える分は返す)。
+        yielded_rows を渡した場合、返した行を同じ形式で記録する。
+        """
+        # 取得日時はバッチ単位で1つ (全レコードで同じ文字列を共有)
+        extracted_at = datetime.datetime.now().isoformat()
+        row_parser = self.row_parser_for(data_type)
+        rows = duplicates = errors = 0
+        skipped = collections.Counter()
+        try:
+            for body in row_parser.iter_row_bodies(lines):
+                rows += 1
+                if seen_rows is not None or yielded_rows is not None:
+                    # "Row: N" の番号はクエリごとに変わるため本文で判定する
+                    key = hashlib.sha1(body.encode('utf-8')).digest()
+                    if seen_rows is not None and skipped[key] < seen_rows[key]:
+                        skipped[key] += 1
+                        duplicates += 1
+                        continue
+                    if yielded_rows is not None:
+                        yielded_rows[key] += 1
                 
-                if record:
-                    # 標準形式に変換
-                    formatted_record = self.format_health_record(record, data_type)
-                    records.append(formatted_record)
-                    
-            except Exception as e:
-                print(f"⚠️ レコードパースエラー: {e}")
-                continue
+                try:
+                    record = row_parser.parse_row(body)
+                    if record:
+                        # 標準形式に変換
+                        yield self.make_record(record, data_type, extracted_at)
+                        
+                except Exception as e:
+                    errors += 1
+                    print(f"⚠️ レコードパースエラー: {e}")
+                    continue
+        finally:
+            # 計測はバッチ単位でまとめて加算する
+            if self.metrics is not None:
+                self.record_metric('rows_read', data_type, rows)
+                self.record_metric('duplicate_rows', data_type, duplicates)
+                self.record_metric('parse_errors', data_type, errors)
+                self.record_metric('records_parsed', data_type, rows - duplicates - errors)
+    
+    def make_record(self, raw_record: Dict[str, Optional[str]], data_type: str,
+                    extracted_at: Optional[str] = None) -> HealthRecord:
+        """生データをデータタイプ別のレコードに変換 (NULL列は None)"""
+        columns = tuple(raw_record)
+        # 同じ列構成のレコード間で列名タプルを共有する
+        columns = self._shared_columns.setdefault(columns, columns)
+        record_class = RECORD_CLASSES.get(data_type, HealthRecord)
+        return record_class(data_type, columns, tuple(raw_record.values()),
+                            extracted_at or datetime.datetime.now().isoformat())
+    
+    def make_records(self, raw_records: Iterable[Dict[str, Optional[str]]], data_type: str,
+                     extracted_at: Optional[str] = None) -> List[HealthRecord]:
+        """1データタイプ分の生データをまとめてレコードに変換
         
+        列構成が同じ連続した行ごとに HealthRecord.from_rows で一括変換する。
+        """
+        record_class = RECORD_CLASSES.get(data_type, HealthRecord)
+        extracted_at = extracted_at or datetime.datetime.now().isoformat()
+        records: List[HealthRecord] = []
+        columns = None
+        rows: List[tuple] = []
+        for raw_record in raw_records:
+            row_columns = tuple(raw_record)
+            if row_columns is not columns and row_columns != columns:
+                if rows:
+                    records.extend(record_class.from_rows(data_type, columns, rows, extracted_at))
+                    rows = []
+                columns = self._shared_columns.setdefault(row_columns, row_columns)
+            rows.append(tuple(raw_record.values()))
+        if rows:
+            records.extend(record_class.from_rows(data_type, columns, rows, extracted_at))
         return records
     
-    def format_health_record(self, raw_record: Dict[str, str], data_type: str) -> Dict[str, Any]:
-        """生データを標準形式にフォーマット"""
-        formatted = {
-            'dataType': data_type,
-            'timestamp': raw_record.get('start_time', raw_record.get('time', '')),
-            'rawData': raw_record,
-            'source': 'HEALTH_CONNECT_DIRECT',
-            'extractedAt': datetime.datetime.now().isoformat(),
-            'metadata': {
-                'extractionMethod': 'ADB_CONTENT_PROVIDER',
-                'isRealData': True
-            }
-        }
-        
-        # データタイプ別の値抽出
-        if data_type == 'Steps':
-            formatted['value'] = {
-                'count': int(raw_record.get('count', 0)),
-                'startTime': raw_record.get('start_time', ''),
-                'endTime': raw_record.get('end_time', '')
-            }
-        elif data_type == 'HeartRate':
-            formatted['value'] = {
-                'beatsPerMinute': int(raw_record.get('bpm', 0)),
-                'measurementMethod': raw_record.get('measurement_method', 'UNKNOWN')
-            }
-        elif data_type == 'Weight':
-            formatted['value'] = {
-                'mass': float(raw_record.get('weight', 0)),
-                'unit': 'KILOGRAM'
-            }
-        else:
-            # その他のデータタイプは生データをそのまま
-            formatted['value'] = raw_record
-        
-        return formatted
+    def format_health_record(self, raw_record: Dict[str, Optional[str]], data_type: str) -> Dict[str, Any]:
+        """生データを標準形式 (dict) にフォーマット"""
+        return self.make_record(raw_record, data_type).to_dict()
+    
+    def format_health_records(self, raw_records: Iterable[Dict[str, Optional[str]]],
+                              data_type: str) -> List[Dict[str, Any]]:
+        """1データタイプ分の生データをまとめて標準形式 (dict) にフォーマット"""
+        return [record.to_dict() for record in self.make_records(raw_records, data_type)]
     
-    def extract_all_data(self, days_back: int = 30) -> Dict[str, List[Dict[str, Any]]]:
-        """全データタイプの生データを取得"""
+    def extract_all_data(self, days_back: int = 30, max_workers: int = 1,
+                         start_timestamps: Optional[Dict[str, int]] = None,
+                         modified_since: Optional[Dict[str, int]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """全データタイプの生データを取得
+        
+        max_workers > 1 の場合はデータタイプごとのクエリを並列実行する。
+        結果の順序は supported_data_types の順序で固定。
+        start_timestamps にはデータタイプごとの取得開始時刻 (ミリ秒)、
+        modified_since にはデータタイプごとの更新日時の下限 (ミリ秒) を指定できる。
+        """
         print(f"🔥 Health Connect生データ取得開始 (過去{days_back}日間)")
         print("=" * 50)
         
         all_data = {}
         total_records = 0
+        start_timestamps = start_timestamps or {}
+        modified_since = modified_since or {}
         
-        for data_type in self.supported_data_types:
-            data = self.get_health_connect_data(data_type, days_back)
+        def fetch(data_type: str) -> List[Dict[str, Any]]:
+            return self.get_health_connect_data(data_type, days_back, start_timestamps.get(data_type),
+                                                modified_since.get(data_type))
+        
+        if max_workers > 1:
+            # adbの待ち時間が支配的なためスレッドで並列化する
+            self.shell_session_count = max(self.shell_session_count, max_workers)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(fetch, self.supported_data_types))
+        else:
+            results = [fetch(data_type) for data_type in self.supported_data_types]
+        
+        for data_type, data in zip(self.supported_data_types, results):
             all_data[data_type] = data
             total_records += len(data)
         
@@ -213,44 +1871,150 @@ class HealthConnectExtractor:
         
         return all_data
     
-    def save_data_to_file(self, data: Dict[str, List[Dict[str, Any]]], filename: Optional[str] = None):
-        """データをJSONファイルに保存"""
+    def extract_incremental(self, checkpoints: 'CheckpointStore', days_back: int = 30,
+                            max_workers: int = 1) -> Dict[str, List[Dict[str, Any]]]:
+        """チェックポイント以降の差分データのみ取得
+        
+        前回までに取得した最大の更新日時 (last_modified_time) 以降に追加・更新されたレコードを
+        開始時刻に関わらず取得する (後から同期されたウォッチのレコードも取りこぼさない)。
+        更新日時の無いチェックポイント (以前の形式) は前回の最大終了時刻以降に始まるレコード、
+        チェックポイントが無いデータタイプは days_back の範囲で取得する。
+        """
+        start_timestamps = {}
+        modified_since = {}
+        for data_type in self.supported_data_types:
+            last_modified = checkpoints.get_modified_watermark(self.device_id, data_type)
+            watermark = checkpoints.get_watermark(self.device_id, data_type)
+            if last_modified is not None:
+                modified_since[data_type] = last_modified
+            elif watermark is not None:
+                start_timestamps[data_type] = watermark
+        
+        resumed = len(modified_since) + len(start_timestamps)
+        print(f"🔁 差分取得: {resumed}/{len(self.supported_data_types)}種類はチェックポイントから再開")
+        return self.extract_all_data(days_back, max_workers, start_timestamps, modified_since)
+    
+    def resolve_overlaps(self, data: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+        """resolve_priority の優先順位で期間レコードの重なりを解消する (未指定の場合はそのまま)"""
+        if self.resolve_priority is None:
+            return data
+        # health_connect_interval_resolver はこのモジュールを読み込むため、使う時に読み込む
+        from health_connect_interval_resolver import IntervalResolver
+        return IntervalResolver(self.resolve_priority).resolve_all(data)
+    
+    @staticmethod
+    def merge_key(record: Any) -> str:
+        """マージ時のレコードの同一性 (データ提供元 + clientRecordId、無ければ生データ全体)"""
+        record = to_record_dict(record)
+        raw = record.get('rawData')
+        if raw and raw.get('client_record_id'):
+            return f"{raw.get('data_origin') or ''}:{raw['client_record_id']}"
+        return json.dumps(raw or record, sort_keys=True)
+    
+    def merge_with_previous_export(self, new_data: Dict[str, List[Dict[str, Any]]],
+                                   previous_file: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """前回のエクスポートに差分データをマージ (読み込めない場合は None)
+        
+        同一レコードは差分データの版 (更新されたレコード・境界で再取得されたレコード) に置き換え、
+        各データタイプを開始時刻順に並べる。
+        """
+        try:
+            previous = load_export(previous_file).get('rawData', {})
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 前回エクスポート読み込みエラー: {e}")
+            return None
+        
+        data_types = list(self.supported_data_types)
+        data_types += [t for t in list(previous) + list(new_data) if t not in data_types]
+        
+        merged = {}
+        for data_type in data_types:
+            records: Dict[str, Any] = {}
+            for record in previous.get(data_type, []):
+                records[self.merge_key(record)] = record
+            for record in new_data.get(data_type, []):
+                records[self.merge_key(record)] = record
+            merged[data_type] = sorted(records.values(), key=record_timestamp)
+        return merged
+    
+    def save_data_to_file(self, data: Dict[str, List[Dict[str, Any]]], filename: Optional[str] = None,
+                          fmt: str = 'json') -> Optional[str]:
+        """データをJSON / NDJSONファイルに保存し、保存先ファイル名を返す
+        
+        fmt が ndjson.gz / ndjson.zst の場合は圧縮したチャンクに分けて保存し、マニフェストのファイル名を返す。
+        fmt が npz の場合はデータタイプごとの列指向テーブルを保存し、そのマニフェストのファイル名を返す。
+        """
         if filename is None:
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"health_connect_raw_data_{timestamp}.json"
-        
-        # 統計情報を追加
-        report = {
-            'extractionInfo': {
-                'timestamp': datetime.datetime.now().isoformat(),
-                'deviceId': self.device_id,
-                'extractionMethod': 'ADB_CONTENT_PROVIDER',
-                'dataTypes': list(data.keys()),
-                'totalRecords': sum(len(records) for records in data.values())
-            },
-            'statistics': {
-                dataType: {
-                    'count': len(records),
-                    'hasData': len(records) > 0,
-                    'dateRange': {
-                        'earliest': min([r['timestamp'] for r in records]) if records else None,
-                        'latest': max([r['timestamp'] for r in records]) if records else None
-                    }
-                }
-                for dataType, records in data.items()
-            },
-            'rawData': data
-        }
+            filename = f"health_connect_raw_data_{timestamp}.{fmt}"
         
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(report, f, indent=2, ensure_ascii=False)
+            started = time.perf_counter()
+            with open_report_writer(filename, self.device_id, fmt, self.output_chunk_bytes) as writer:
+                for data_type, records in data.items():
+                    count = writer.write_records(data_type, records)
+                    self.record_metric('records_written', data_type, count)
+            filename = writer.filename
+            if self.metrics is not None:
+                self.metrics.observe('write_seconds', time.perf_counter() - started, self.device_id)
+                self.record_metric('bytes_written', None, writer.size())
             
             print(f"💾 データを保存しました: {filename}")
-            print(f"📁 ファイルサイズ: {os.path.getsize(filename)} bytes")
+            self.print_output_size(writer)
+            return filename
             
         except Exception as e:
             print(f"❌ ファイル保存エラー: {e}")
+            return None
+    
+    def stream_all_data_to_file(self, days_back: int = 30, filename: Optional[str] = None, fmt: str = 'json',
+                                start_timestamps: Optional[Dict[str, int]] = None) -> Optional[str]:
+        """全データタイプを取得しながらファイルへ直接書き出す
+        
+        レコードをメモリに保持しないため、大量データの取得に使用する。
+        fmt が ndjson.gz / ndjson.zst の場合はマニフェストのファイル名を返す。
+        """
+        if filename is None:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"health_connect_raw_data_{timestamp}.{fmt}"
+        start_timestamps = start_timestamps or {}
+        
+        print(f"🔥 Health Connect生データ取得開始 (過去{days_back}日間, ストリーミング保存)")
+        print("=" * 50)
+        
+        try:
+            with open_report_writer(filename, self.device_id, fmt, self.output_chunk_bytes) as writer:
+                for data_type in self.supported_data_types:
+                    print(f"🔍 {data_type}データを取得中...")
+                    try:
+                        records = self.iter_health_connect_data(data_type, days_back, start_timestamps.get(data_type))
+                        count = writer.write_records(data_type, records, self.is_ordered(data_type))
+                        self.record_metric('records_written', data_type, count)
+                    except subprocess.CalledProcessError:
+                        print(f"⚠️ {data_type}: データなし または アクセス権限なし")
+                        continue
+                    print(f"✅ {data_type}: {count}件のデータを書き込み")
+                total_records = sum(s['count'] for s in writer.statistics.values())
+            
+            filename = writer.filename
+            self.record_metric('bytes_written', None, writer.size())
+            print("=" * 50)
+            print(f"📊 総レコード数: {total_records}件")
+            print(f"💾 データを保存しました: {filename}")
+            self.print_output_size(writer)
+            return filename
+            
+        except OSError as e:
+            print(f"❌ ファイル保存エラー: {e}")
+            return None
+    
+    @staticmethod
+    def print_output_size(writer: StreamingReportWriter):
+        if isinstance(writer, ChunkedReportWriter):
+            print(f"🗜️ {len(writer.chunks)}チャンク ({writer.fmt}): {writer.size()} bytes "
+                  f"(圧縮前 {sum(c.get('uncompressedBytes', 0) for c in writer.chunks)} bytes)")
+        else:
+            print(f"📁 ファイルサイズ: {writer.size()} bytes")
     
     def print_summary(self, data: Dict[str, List[Dict[str, Any]]]):
         """データサマリーを表示"""
@@ -261,9 +2025,16 @@ class HealthConnectExtractor:
         for data_type, records in data.items():
             if records:
                 print(f"✅ {data_type}: {len(records)}件")
-                # 最新のレコードを1件表示
-                latest = max(records, key=lambda x: x['timestamp'])
-                print(f"   最新データ: {latest['timestamp']}")
+                # 最新のレコードを1件表示 (開始時刻順に取得した場合は末尾)
+                if self.is_ordered(data_type):
+                    latest = records[-1]
+                else:
+                    latest = max(records, key=record_timestamp)
+                latest_ms = record_timestamp(latest)
+                if latest_ms >= 0:
+                    print(f"   最新データ: {datetime.datetime.fromtimestamp(latest_ms / 1000).isoformat()} ({latest_ms})")
+                else:
+                    print(f"   最新データ: {latest['timestamp']}")
                 print(f"   値: {latest['value']}")
             else:
                 print(f"⚠️ {data_type}: データなし")
@@ -275,43 +2046,238 @@ class HealthConnectExtractor:
         print(f"📊 総計: {successful_types}/{len(data)}種類のデータタイプで{total_records}件取得")
         print("=" * 60)
 
-def main():
-    print("🔥 Health Connect 生データ抽出ツール")
-    print("=" * 50)
+class CheckpointStore:
+    """端末ID・データタイプごとの取得済み位置 (ウォーターマーク) を永続化する
     
-    extractor = HealthConnectExtractor()
+    保存形式:
+    {"devices": {"<deviceId>": {"lastExport": "...json",
+                                "dataTypes": {"Steps": {"endTime": ms, "lastModifiedTime": ms,
+                                                        "boundaryKeys": ["sha1", ...]}}}}}
     
-    # 前提条件チェック
-    if not extractor.check_adb_connection():
-        sys.exit(1)
+    差分取得は lastModifiedTime 以降に更新されたレコード (lastModifiedTime が無い場合は
+    endTime 以降に始まるレコード) を対象にする。
+    boundaryKeys はウォーターマークと同じ更新日時 (無い場合は開始時刻) のレコード
+    (次回の差分取得で再取得される) のキー。
+    """
     
-    if not extractor.check_health_connect():
-        sys.exit(1)
+    def __init__(self, path: str = 'health_connect_checkpoints.json'):
+        self.path = path
+        self.devices: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load()
     
-    # データ取得期間を指定
-    try:
-        days = int(input("取得期間を日数で入力してください (デフォルト: 30): ") or "30")
-    except ValueError:
-        days = 30
+    def load(self):
+        """チェックポイントファイルを読み込む (無い・壊れている場合は全件取得になる)"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.devices = json.load(f).get('devices', {})
+        except (OSError, ValueError) as e:
+            print(f"⚠️ チェックポイント読み込みエラー: {e}")
+            self.devices = {}
     
-    # 生データ取得実行
-    try:
-        all_data = extractor.extract_all_data(days)
+    def save(self):
+        """一時ファイル経由でアトミックに保存"""
+        with self._lock:
+            payload = {
+                'updatedAt': datetime.datetime.now().isoformat(),
+                'devices': self.devices
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+    
+    def _entry(self, device_id: str, data_type: str) -> Dict[str, Any]:
+        device = self.devices.setdefault(device_id, {'lastExport': None, 'dataTypes': {}})
+        return device['dataTypes'].setdefault(data_type, {'endTime': None, 'lastModifiedTime': None})
+    
+    def get_watermark(self, device_id: str, data_type: str) -> Optional[int]:
+        """次回取得の開始時刻 (ミリ秒) を返す"""
+        entry = self.devices.get(device_id, {}).get('dataTypes', {}).get(data_type)
+        return entry.get('endTime') if entry else None
+    
+    def get_modified_watermark(self, device_id: str, data_type: str) -> Optional[int]:
+        """取得済みレコードの最大の更新日時 (ミリ秒) を返す"""
+        entry = self.devices.get(device_id, {}).get('dataTypes', {}).get(data_type)
+        return entry.get('lastModifiedTime') if entry else None
+    
+    def get_boundary_keys(self, device_id: str, data_type: str) -> set:
+        entry = self.devices.get(device_id, {}).get('dataTypes', {}).get(data_type)
+        return set(entry.get('boundaryKeys') or []) if entry else set()
+    
+    def set_boundary_keys(self, device_id: str, data_type: str, keys: Iterable[str]):
+        with self._lock:
+            self._entry(device_id, data_type)['boundaryKeys'] = sorted(keys)
+    
+    def get_last_export(self, device_id: str) -> Optional[str]:
+        return self.devices.get(device_id, {}).get('lastExport')
+    
+    def set_last_export(self, device_id: str, filename: str):
+        with self._lock:
+            self.devices.setdefault(device_id, {'lastExport': None, 'dataTypes': {}})['lastExport'] = filename
+    
+    @staticmethod
+    def _max_timestamp(records: List[Dict[str, Any]], keys: List[str]) -> Optional[int]:
+        def first_timestamp(record: Any) -> Optional[int]:
+            # HealthRecord は rawData の dict を作らずに列を参照する
+            raw = record.raw if isinstance(record, HealthRecord) else (record.get('rawData') or {}).get
+            for key in keys:
+                value = to_epoch_millis(raw(key))
+                if value is not None:
+                    return value
+            return None
         
-        # 結果表示
-        extractor.print_summary(all_data)
+        return max((t for t in map(first_timestamp, records) if t is not None), default=None)
+    
+    def advance(self, device_id: str, data_type: str, records: List[Dict[str, Any]]):
+        """取得済みレコードの最大 end_time / last_modified_time まで位置を進める"""
+        end_time = self._max_timestamp(records, ['end_time', 'time', 'start_time'])
+        last_modified = self._max_timestamp(records, ['last_modified_time'])
         
-        # ファイル保存
-        extractor.save_data_to_file(all_data)
+        with self._lock:
+            entry = self._entry(device_id, data_type)
+            if end_time is not None and (entry['endTime'] is None or end_time > entry['endTime']):
+                entry['endTime'] = end_time
+            if last_modified is not None and (entry['lastModifiedTime'] is None or last_modified > entry['lastModifiedTime']):
+                entry['lastModifiedTime'] = last_modified
+
+class FleetExtractor:
+    """複数端末からの並列データ取得
+    
+    `adb devices` で device 状態の端末を全て検出し、端末ごとに
+    HealthConnectExtractor を割り当てて並列に取得する。
+    1台の失敗や遅延は他の端末の取得に影響しない。
+    
+    post_process を指定した場合、保存後に post_process(端末ID, データ, 保存先) を呼ぶ
+    (SQLite への保存や送信など)。False を返すとその端末は error になる。
+    """
+    
+    def __init__(self, max_devices: int = 4, max_workers: int = 1, output_dir: str = '.',
+                 metrics: Optional[ExtractionMetrics] = None, fmt: str = 'json',
+                 post_process: Optional[Callable[[str, Dict[str, List[Any]], str], bool]] = None):
+        self.max_devices = max_devices
+        self.max_workers = max_workers
+        self.output_dir = output_dir
+        # 全端末で共有する計測 (端末IDのラベルで区別する)
+        self.metrics = metrics
+        self.fmt = fmt
+        self.post_process = post_process
+        self.output_chunk_bytes = OUTPUT_CHUNK_BYTES
+        self.resolve_priority: Optional[List[str]] = None
+        self.device_ids: List[str] = []
+    
+    def discover_devices(self) -> bool:
+        """接続中の全端末を検出"""
+        try:
+            self.device_ids = HealthConnectExtractor().list_devices()
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            print("❌ ADBコマンドが見つかりません")
+            print("Android SDK Platform Toolsをインストールしてください")
+            return False
         
-        print("\n🎉 Health Connect生データ取得完了！")
+        if not self.device_ids:
+            print("❌ Androidデバイスが接続されていません")
+            return False
         
-    except KeyboardInterrupt:
-        print("\n⏹️ ユーザーによって中断されました")
-        sys.exit(1)
-    except Exception as e:
-        print(f"\n❌ 予期しないエラー: {e}")
-        sys.exit(1)
+        print(f"✅ {len(self.device_ids)}台のデバイスを検出: {', '.join(self.device_ids)}")
+        return True
+    
+    def extract_device(self, device_id: str, days_back: int, timestamp: str) -> Dict[str, Any]:
+        """1台分の取得を行い、端末ごとの結果を返す"""
+        result = {
+            'deviceId': device_id,
+            'status': 'error',
+            'outputFile': None,
+            'totalRecords': 0,
+            'recordCounts': {},
+            'error': None
+        }
+        extractor = None
+        started = time.perf_counter()
+        try:
+            extractor = HealthConnectExtractor(device_id)
+            extractor.metrics = self.metrics
+            extractor.output_chunk_bytes = self.output_chunk_bytes
+            extractor.resolve_priority = self.resolve_priority
+            if not extractor.check_health_connect():
+                result['status'] = 'no_health_connect'
+                return result
+            
+            data = extractor.resolve_overlaps(extractor.extract_all_data(days_back, self.max_workers))
+            safe_id = device_id.replace(':', '_').replace('/', '_')
+            filename = os.path.join(self.output_dir, f"health_connect_raw_data_{safe_id}_{timestamp}.{self.fmt}")
+            
+            result['outputFile'] = extractor.save_data_to_file(data, filename, self.fmt)
+            result['recordCounts'] = {data_type: len(records) for data_type, records in data.items()}
+            result['totalRecords'] = sum(result['recordCounts'].values())
+            result['status'] = 'success' if result['outputFile'] else 'error'
+            if result['outputFile'] and self.post_process is not None:
+                if not self.post_process(device_id, data, result['outputFile']):
+                    result['status'] = 'error'
+                    result['error'] = '保存後の処理に失敗しました'
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            if extractor is not None:
+                extractor.close()
+            if self.metrics is not None:
+                self.metrics.observe('device_seconds', time.perf_counter() - started, device_id)
+        return result
+    
+    def extract_all_devices(self, days_back: int = 30) -> Dict[str, Dict[str, Any]]:
+        """全端末から並列にデータを取得"""
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        results = {}
+        
+        print(f"🔥 フリート取得開始: {len(self.device_ids)}台 (同時{self.max_devices}台)")
+        with ThreadPoolExecutor(max_workers=self.max_devices) as executor:
+            futures = {
+                executor.submit(self.extract_device, device_id, days_back, timestamp): device_id
+                for device_id in self.device_ids
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['deviceId']] = result
+                if result['status'] == 'success':
+                    print(f"✅ {result['deviceId']}: {result['totalRecords']}件")
+                else:
+                    print(f"❌ {result['deviceId']}: {result['status']} {result['error'] or ''}")
+        
+        # 検出順に並べ直す
+        return {device_id: results[device_id] for device_id in self.device_ids}
+    
+    def save_fleet_report(self, results: Dict[str, Dict[str, Any]], filename: Optional[str] = None) -> Optional[str]:
+        """端末ごとの結果をまとめたレポートを保存"""
+        if filename is None:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(self.output_dir, f"health_connect_fleet_report_{timestamp}.json")
+        
+        report = {
+            'extractionInfo': {
+                'timestamp': datetime.datetime.now().isoformat(),
+                'extractionMethod': 'ADB_CONTENT_PROVIDER',
+                'deviceCount': len(results),
+                'successfulDevices': sum(1 for r in results.values() if r['status'] == 'success'),
+                'totalRecords': sum(r['totalRecords'] for r in results.values())
+            },
+            'devices': results
+        }
+        
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"💾 フリートレポートを保存しました: {filename}")
+            return filename
+        except Exception as e:
+            print(f"❌ ファイル保存エラー: {e}")
+            return None
+
+def main():
+    # コマンドライン引数の解析・watch モードは health_connect_sync.py
+    from health_connect_sync import main as sync_main
+    sync_main()
 
 if __name__ == "__main__":
     main()
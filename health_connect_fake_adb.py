@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Health Connect 抽出ツール用 adb 代替 (テスト・ベンチマーク用)
+
+実機を接続せずに health_connect_data_extractor.py を動かすための偽の adb コマンドです。
+HealthConnectScaleGenerator のデータを `adb shell content query` と同じ
+"Row: N key=value, ..." 形式で返します。
+
+対応コマンド:
+- adb devices
+- adb track-devices                 (端末の一覧と、その後の変化を adb と同じ長さ付き形式で出力し続ける)
+- adb -s <serial> shell <command>   (1コマンド実行)
+- adb -s <serial> shell             (標準入力からコマンドを順に実行)
+  端末側コマンドは content query / pm list packages / echo のみ
+
+設定 (環境変数):
+- FAKE_ADB_DEVICES         端末のシリアル (カンマ区切り、デフォルト: emulator-5554)
+- FAKE_ADB_DEVICES_FILE    端末のシリアルを書いたファイル (カンマ・改行区切り)。指定時は FAKE_ADB_DEVICES より優先し、
+                           毎回読み直すため、書き換えると端末の接続・切断を再現できる (ファイルが無い場合は0台)
+- FAKE_ADB_UNAUTHORIZED    unauthorized として表示するシリアル (カンマ区切り)
+- FAKE_ADB_TYPES           データを返すデータタイプ (カンマ区切り、デフォルト: 生成可能な全タイプ)
+- FAKE_ADB_DAYS            データの日数 (デフォルト: 30、最終日は今日)
+- FAKE_ADB_HZ              HeartRate のサンプリング周波数 (デフォルト: 0.01)
+- FAKE_ADB_ROWS            HeartRate の件数 (指定時は FAKE_ADB_HZ より優先)
+- FAKE_ADB_SEED            乱数シード (デフォルト: 0)
+- FAKE_ADB_SPAWN_LATENCY   adb コマンド起動ごとの待ち時間 秒 (デフォルト: 0)
+- FAKE_ADB_LATENCY         端末側コマンドごとの待ち時間 秒 (デフォルト: 0)
+- FAKE_ADB_FAIL_RATE       content query が失敗する確率 (デフォルト: 0)
+- FAKE_ADB_HANG_RATE       content query が出力の途中で止まる確率 (デフォルト: 0)
+- FAKE_ADB_HANG_SECONDS    止まる時間 秒 (デフォルト: 3600)
+- FAKE_ADB_NO_HEALTH_CONNECT  1 の場合 Health Connect 未インストールとして振る舞う
+
+使用方法:
+HEALTH_CONNECT_ADB=./health_connect_fake_adb.py python health_connect_data_extractor.py
+"""
+
+import os
+import random
+import re
+import shlex
+import sys
+import time
+from typing import Dict, List, Optional
+
+from health_connect_sample_generator import HealthConnectScaleGenerator
+
+HEALTH_CONNECT_PACKAGE = 'com.google.android.apps.healthdata'
+URI_PREFIX = 'content://com.google.android.apps.healthdata.provider/records/'
+# --where の条件 ("列 演算子 数値" を AND でつないだもの)
+WHERE_CONDITION = re.compile(r'(start_time|end_time|last_modified_time) (>=|<=|<|>) (\d+)')
+COMPARISONS = {
+    '>=': lambda a, b: a >= b,
+    '<=': lambda a, b: a <= b,
+    '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b
+}
+
+def env_list(name: str, default: str = '') -> List[str]:
+    return [item.strip() for item in os.environ.get(name, default).split(',') if item.strip()]
+
+def current_devices() -> List[str]:
+    """接続中として扱う端末のシリアル"""
+    path = os.environ.get('FAKE_ADB_DEVICES_FILE')
+    if not path:
+        return env_list('FAKE_ADB_DEVICES', 'emulator-5554')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [item for item in re.split(r'[,\s]+', f.read()) if item]
+    except OSError:
+        return []
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+class FakeDevice:
+    """1台分の端末側コマンドを実行する"""
+    
+    def __init__(self, serial: str, devices: List[str]):
+        self.serial = serial
+        self.user = devices.index(serial) if serial in devices else 0
+        self.latency = env_float('FAKE_ADB_LATENCY', 0)
+        self.fail_rate = env_float('FAKE_ADB_FAIL_RATE', 0)
+        self.hang_rate = env_float('FAKE_ADB_HANG_RATE', 0)
+        self.hang_seconds = env_float('FAKE_ADB_HANG_SECONDS', 3600)
+        self.health_connect = os.environ.get('FAKE_ADB_NO_HEALTH_CONNECT') != '1'
+        # 障害の発生はクエリごとに変える (同じ窓の再試行が成功できるように)
+        self.faults = random.Random()
+        
+        days = int(env_float('FAKE_ADB_DAYS', 30))
+        hz = env_float('FAKE_ADB_HZ', 0.01)
+        rows = os.environ.get('FAKE_ADB_ROWS')
+        if rows:
+            hz = int(rows) / (days * 24 * 60 * 60)
+        data_types = env_list('FAKE_ADB_TYPES') or list(HealthConnectScaleGenerator.PROFILES)
+        self.generator = HealthConnectScaleGenerator(
+            users=max(len(devices), 1), days=days, hz=hz, data_types=data_types,
+            seed=int(env_float('FAKE_ADB_SEED', 0))
+        )
+        self.out = sys.stdout
+    
+    def run_line(self, line: str, status: int = 0) -> int:
+        """1行分のシェルコマンド (";" 区切り、2>/dev/null 等のリダイレクトは無視) を実行"""
+        lexer = shlex.shlex(line, posix=True, punctuation_chars=';')
+        lexer.whitespace_split = True
+        try:
+            tokens = list(lexer)
+        except ValueError as e:
+            self.out.write(f"/system/bin/sh: syntax error: {e}\n")
+            return 1
+        
+        command: List[str] = []
+        for token in tokens + [';']:
+            if token != ';':
+                if not re.match(r'^\d*>', token):
+                    command.append(token)
+                continue
+            if command:
+                status = self.run_command(command, status)
+            command = []
+        return status
+    
+    def run_command(self, args: List[str], status: int) -> int:
+        name = args[0]
+        if name == 'echo':
+            self.out.write(' '.join(args[1:]).replace('$?', str(status)) + '\n')
+            return 0
+        if name == 'exit':
+            self.out.flush()
+            sys.exit(status)
+        
+        if self.latency:
+            time.sleep(self.latency)
+        if name == 'pm' and args[1:3] == ['list', 'packages']:
+            if self.health_connect and (len(args) < 4 or args[3] in HEALTH_CONNECT_PACKAGE):
+                self.out.write(f"package:{HEALTH_CONNECT_PACKAGE}\n")
+            return 0
+        if name == 'content' and args[1:2] == ['query']:
+            return self.content_query(self.parse_options(args[2:]))
+        self.out.write(f"/system/bin/sh: {name}: not found\n")
+        return 127
+    
+    @staticmethod
+    def parse_options(args: List[str]) -> Dict[str, str]:
+        options = {}
+        for i in range(0, len(args) - 1, 2):
+            options[args[i].lstrip('-')] = args[i + 1]
+        return options
+    
+    def content_query(self, options: Dict[str, str]) -> int:
+        uri = options.get('uri', '')
+        if not uri.startswith(URI_PREFIX) or not self.health_connect:
+            self.out.write(f"Error while accessing provider:{uri}\n")
+            return 1
+        if self.fail_rate and self.faults.random() < self.fail_rate:
+            self.out.write("Error while accessing provider: injected failure\n")
+            return 1
+        
+        data_type = uri[len(URI_PREFIX):]
+        if data_type not in self.generator.data_types:
+            self.out.write("No result found.\n")
+            return 0
+        
+        columns = self.generator.columns(data_type)
+        start_ms: Optional[int] = None
+        end_ms: Optional[int] = None
+        # 開始時刻以外の条件 (列位置, 比較, 値) は1行ずつ判定する
+        filters = []
+        if 'where' in options:
+            for condition in options['where'].strip().split(' AND '):
+                match = WHERE_CONDITION.fullmatch(condition.strip())
+                if not match:
+                    self.out.write(f"Error while accessing provider:{uri} (unsupported where)\n")
+                    return 1
+                column, operator, value = match.group(1), match.group(2), int(match.group(3))
+                if column == 'start_time' and operator == '>=':
+                    start_ms = value
+                elif column == 'start_time' and operator == '<':
+                    end_ms = value
+                else:
+                    filters.append((columns.index(column), COMPARISONS[operator], value))
+        
+        projection = columns
+        if 'projection' in options:
+            projection = tuple(options['projection'].split(':'))
+            unknown = [c for c in projection if c not in columns]
+            if unknown:
+                self.out.write(f"Error while accessing provider:{uri} (no such column: {unknown[0]})\n")
+                return 1
+        if options.get('sort', 'start_time').split()[0] not in columns:
+            self.out.write(f"Error while accessing provider:{uri} (no such column: {options['sort']})\n")
+            return 1
+        positions = [columns.index(c) for c in projection]
+        
+        # 生成データは開始時刻順のため並べ替えは不要
+        hang = self.hang_rate and self.faults.random() < self.hang_rate
+        count = 0
+        write = self.out.write
+        for rows in self.generator.iter_row_chunks(self.user, data_type, start_ms, end_ms):
+            if hang and count:
+                # 一部を出力した後で止まる
+                self.out.flush()
+                time.sleep(self.hang_seconds)
+            lines = []
+            for row in rows:
+                if filters and not all(compare(int(row[i]), value) for i, compare, value in filters):
+                    continue
+                lines.append(f"Row: {count} " + ', '.join(f"{projection[i]}={row[p]}" for i, p in enumerate(positions)))
+                count += 1
+            if lines:
+                write('\n'.join(lines))
+                write('\n')
+        if not count:
+            write("No result found.\n")
+        return 0
+    
+    def interactive(self) -> int:
+        """`adb shell` (引数なし): 標準入力の各行を順に実行"""
+        status = 0
+        for line in sys.stdin:
+            status = self.run_line(line.rstrip('\n'), status)
+            self.out.flush()
+        return status
+
+def device_states() -> List[tuple]:
+    devices = current_devices()
+    return [(device, 'device') for device in devices] + [
+        (device, 'unauthorized') for device in env_list('FAKE_ADB_UNAUTHORIZED') if device not in devices]
+
+def track_devices() -> int:
+    """`adb track-devices`: 一覧が変わるたびに「16進4桁のバイト数 + "シリアル<TAB>状態" の行」を出力"""
+    last = None
+    try:
+        while True:
+            states = device_states()
+            if states != last:
+                payload = ''.join(f"{serial}\t{state}\n" for serial, state in states)
+                sys.stdout.write(f"{len(payload.encode('utf-8')):04x}{payload}")
+                sys.stdout.flush()
+                last = states
+            time.sleep(0.2)
+    except (BrokenPipeError, KeyboardInterrupt):
+        return 0
+
+def main(argv: List[str]) -> int:
+    devices = current_devices()
+    unauthorized = env_list('FAKE_ADB_UNAUTHORIZED')
+    spawn_latency = env_float('FAKE_ADB_SPAWN_LATENCY', 0)
+    if spawn_latency:
+        time.sleep(spawn_latency)
+    
+    serial = None
+    if argv[:1] == ['-s'] and len(argv) > 1:
+        serial, argv = argv[1], argv[2:]
+    if not argv:
+        print("usage: adb [-s SERIAL] devices|track-devices|shell [COMMAND]", file=sys.stderr)
+        return 1
+    
+    if argv[0] == 'devices':
+        print("List of devices attached")
+        for device in devices:
+            print(f"{device}\tdevice")
+        for device in unauthorized:
+            print(f"{device}\tunauthorized")
+        return 0
+    
+    if argv[0] == 'track-devices':
+        return track_devices()
+    
+    if argv[0] == 'shell':
+        targets = [d for d in devices if serial in (None, d)]
+        if serial in unauthorized:
+            print("adb: device unauthorized.", file=sys.stderr)
+            return 1
+        if not targets or (serial is None and len(devices) > 1):
+            print(f"adb: device '{serial}' not found" if serial else "adb: more than one device/emulator",
+                  file=sys.stderr)
+            return 1
+        device = FakeDevice(targets[0], devices)
+        try:
+            if len(argv) == 1:
+                return device.interactive()
+            # adb shell は引数を空白で連結して端末側シェルに渡す
+            return device.run_line(' '.join(argv[1:]))
+        except BrokenPipeError:
+            # 読み取り側が途中で終了した (タイムアウト等)
+            return 1
+    
+    print(f"adb: unknown command {argv[0]}", file=sys.stderr)
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
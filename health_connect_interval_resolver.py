@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Health Connect データ 期間の重なり解消
+
+Health Connect には同じ時間帯の期間レコードが複数のアプリから記録されることがあります
+(スマートフォンの Google Fit とスマートウォッチの歩数など)。抽出結果をそのまま合計すると
+重なった時間帯が二重に数えられるため、データ提供元の優先順位で重なりを解消し、
+重ならない期間のレコードに分割します。
+
+- 対象: Steps / Distance / TotalCaloriesBurned / ActiveCaloriesBurned / SleepSession / ExerciseSession
+- 開始・終了時刻のイベントを時刻順に走査し (スイープライン)、各時間帯で優先順位が最も高い
+  レコードだけを残す。計算量は O(n log n)
+- 一部の時間帯だけが残ったレコードは、歩数・距離・消費カロリーを残った時間の割合で按分する
+  (元のレコードの値は metadata.apportioned に記録)
+- 優先順位が同じレコード同士の重なりは、開始時刻が早いレコードを残す
+- 対象外のデータタイプはそのまま出力する
+
+使用方法:
+python health_connect_interval_resolver.py health_connect_raw_data_YYYYMMDD_HHMMSS.json [--priority com.samsung.health,com.google.android.apps.fitness] [--output FILE]
+"""
+
+import argparse
+import heapq
+import os
+import sys
+from typing import Dict, List, Any, Optional, Iterable
+
+from health_connect_data_extractor import (
+    StreamingReportWriter, load_export, to_epoch_millis, to_record_dict
+)
+
+# データタイプ -> 按分する値 (value のキー, rawData の列)。None は期間のみ (按分する値なし)
+INTERVAL_TYPES = {
+    'Steps': ('count', 'count'),
+    'Distance': ('distance', 'distance'),
+    'TotalCaloriesBurned': ('energy', 'energy'),
+    'ActiveCaloriesBurned': ('energy', 'energy'),
+    'SleepSession': None,
+    'ExerciseSession': None
+}
+
+class IntervalResolver:
+    """データ提供元の優先順位で期間レコードの重なりを解消する"""
+    
+    def __init__(self, priority: Optional[List[str]] = None):
+        # 先頭ほど優先。指定外の提供元は指定したものより後 (提供元名の順)
+        self.priority = {origin: rank for rank, origin in enumerate(priority or [])}
+    
+    def rank(self, origin: Optional[str]) -> tuple:
+        rank = self.priority.get(origin)
+        return (0, rank, '') if rank is not None else (1, 0, origin or '')
+    
+    @staticmethod
+    def _origin(record: Dict[str, Any]) -> Optional[str]:
+        raw = record.get('rawData') or {}
+        return raw.get('data_origin') or (record.get('metadata') or {}).get('dataOrigin')
+    
+    @staticmethod
+    def _interval(record: Dict[str, Any]) -> tuple:
+        raw = record.get('rawData') or {}
+        value = record.get('value') if isinstance(record.get('value'), dict) else {}
+        start = to_epoch_millis(raw.get('start_time') or value.get('startTime') or record.get('startTime'))
+        end = to_epoch_millis(raw.get('end_time') or value.get('endTime') or record.get('endTime'))
+        return start, end
+    
+    def sweep(self, intervals: List[tuple]) -> List[List[tuple]]:
+        """[(開始, 終了, 優先順位), ...] を走査し、各レコードが残る時間帯の一覧を返す
+        
+        戻り値の i 番目は intervals[i] の残った時間帯 [(開始, 終了), ...] (重なりの無い時刻順)。
+        """
+        events = []
+        for index, (start, end, _) in enumerate(intervals):
+            events.append((start, 1, index))
+            events.append((end, 0, index))
+        # 同じ時刻では終了を先に処理する
+        events.sort()
+        
+        pieces: List[List[tuple]] = [[] for _ in intervals]
+        active: List[tuple] = []
+        ended = [False] * len(intervals)
+        current = None
+        current_start = None
+        position = 0
+        while position < len(events):
+            moment = events[position][0]
+            while position < len(events) and events[position][0] == moment:
+                _, kind, index = events[position]
+                if kind:
+                    start, _, rank = intervals[index]
+                    heapq.heappush(active, (rank, start, index))
+                else:
+                    ended[index] = True
+                position += 1
+            # 終了したレコードは先頭に来たときに取り除く (遅延削除)
+            while active and ended[active[0][2]]:
+                heapq.heappop(active)
+            winner = active[0][2] if active else None
+            if winner != current:
+                if current is not None and current_start < moment:
+                    pieces[current].append((current_start, moment))
+                current = winner
+                current_start = moment
+        return pieces
+    
+    @staticmethod
+    def apportion(total: Any, lengths: List[int], duration: int) -> List[Any]:
+        """値を時間の割合で按分する (整数の値は合計が保たれるよう最大剰余法で丸める)"""
+        shares = [total * length / duration for length in lengths]
+        if not isinstance(total, int) or isinstance(total, bool):
+            return shares
+        floors = [int(share) for share in shares]
+        remainder = round(sum(shares)) - sum(floors)
+        order = sorted(range(len(shares)), key=lambda i: shares[i] - floors[i], reverse=True)
+        for i in order[:remainder]:
+            floors[i] += 1
+        return floors
+    
+    def _piece(self, record: Dict[str, Any], data_type: str, start: int, end: int,
+               piece_start: int, piece_end: int, share: Any) -> Dict[str, Any]:
+        raw = dict(record.get('rawData') or {})
+        value = record.get('value')
+        value = dict(value) if isinstance(value, dict) else value
+        spec = INTERVAL_TYPES[data_type]
+        if 'start_time' in raw:
+            raw['start_time'] = str(piece_start)
+            raw['end_time'] = str(piece_end)
+        if isinstance(value, dict):
+            if 'startTime' in value:
+                value['startTime'] = piece_start
+                value['endTime'] = piece_end
+            if isinstance(value.get('stages'), list):
+                value['stages'] = [
+                    dict(stage, startTime=max(stage.get('startTime'), piece_start),
+                         endTime=min(stage.get('endTime'), piece_end))
+                    for stage in value['stages']
+                    if isinstance(stage.get('startTime'), int) and isinstance(stage.get('endTime'), int)
+                    and stage['startTime'] < piece_end and stage['endTime'] > piece_start
+                ]
+        if spec is not None:
+            key, column = spec
+            if isinstance(value, dict) and key in value:
+                value[key] = share
+            if column in raw:
+                raw[column] = str(share)
+        
+        piece = dict(record, rawData=raw, value=value, timestamp=piece_start)
+        metadata = dict(record.get('metadata') or {})
+        metadata['apportioned'] = {
+            'sourceStartTime': start,
+            'sourceEndTime': end,
+            'fraction': round((piece_end - piece_start) / (end - start), 6)
+        }
+        piece['metadata'] = metadata
+        return piece
+    
+    def resolve(self, data_type: str, records: Iterable[Any]) -> List[Dict[str, Any]]:
+        """1データタイプ分のレコードの重なりを解消し、開始時刻順に返す"""
+        records = [to_record_dict(record) for record in records]
+        if data_type not in INTERVAL_TYPES:
+            return records
+        
+        spec = INTERVAL_TYPES[data_type]
+        passthrough = []
+        candidates = []
+        intervals = []
+        for record in records:
+            start, end = self._interval(record)
+            if start is None or end is None or end <= start:
+                # 期間の無いレコードは重なりの判定対象にしない
+                passthrough.append((start if start is not None else -1, record))
+                continue
+            candidates.append(record)
+            intervals.append((start, end, self.rank(self._origin(record))))
+        
+        resolved = list(passthrough)
+        for record, (start, end, _), pieces in zip(candidates, intervals, self.sweep(intervals)):
+            if pieces == [(start, end)]:
+                resolved.append((start, record))
+                continue
+            total = None
+            if spec is not None and isinstance(record.get('value'), dict):
+                total = record['value'].get(spec[0])
+            if isinstance(total, (int, float)) and not isinstance(total, bool):
+                shares = self.apportion(total, [b - a for a, b in pieces], end - start)
+            else:
+                shares = [None] * len(pieces)
+            for (piece_start, piece_end), share in zip(pieces, shares):
+                resolved.append((piece_start, self._piece(record, data_type, start, end,
+                                                          piece_start, piece_end, share)))
+        resolved.sort(key=lambda item: item[0])
+        return [record for _, record in resolved]
+    
+    def resolve_all(self, data: Dict[str, List[Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """全データタイプを処理する (対象外のデータタイプはそのまま)"""
+        resolved = {}
+        for data_type, records in data.items():
+            if data_type not in INTERVAL_TYPES:
+                resolved[data_type] = records
+                continue
+            resolved[data_type] = self.resolve(data_type, records)
+            if len(resolved[data_type]) != len(records) or any(
+                    'apportioned' in (record.get('metadata') or {}) for record in resolved[data_type]):
+                print(f"✅ {data_type}: {len(records)}件 → {len(resolved[data_type])}件 (重なりを解消)")
+        return resolved
+
+def main():
+    parser = argparse.ArgumentParser(description='Health Connect 期間レコードの重なり解消')
+    parser.add_argument('export_file', help='health_connect_data_extractor.py の出力 (JSON / NDJSON)')
+    parser.add_argument('--priority', default='',
+                        help='データ提供元の優先順位 (カンマ区切り、先頭ほど優先)')
+    parser.add_argument('--output', default=None, help='保存先 (デフォルト: <入力ファイル名>_resolved.<拡張子>)')
+    args = parser.parse_args()
+    
+    try:
+        report = load_export(args.export_file)
+    except (OSError, ValueError) as e:
+        print(f"❌ ファイル読み込みエラー: {e}")
+        sys.exit(1)
+    
+    base, ext = os.path.splitext(args.export_file)
+    filename = args.output or f"{base}_resolved{ext}"
+    fmt = 'ndjson' if filename.endswith('.ndjson') else 'json'
+    resolver = IntervalResolver([origin for origin in args.priority.split(',') if origin])
+    data = resolver.resolve_all(report.get('rawData', {}))
+    
+    try:
+        with StreamingReportWriter(filename, report.get('extractionInfo', {}).get('deviceId'), fmt) as writer:
+            for data_type, records in data.items():
+                writer.write_records(data_type, records, ordered=data_type in INTERVAL_TYPES)
+    except OSError as e:
+        print(f"❌ 保存エラー: {e}")
+        sys.exit(1)
+    print(f"💾 データを保存しました: {filename}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Health Connect データ 重複排除ストア
+
+取得ごとに作成されるエクスポート (health_connect_raw_data_*.json) を1つのストアに
+まとめ、同じレコードは最新の版だけを残します。
+
+- レコードの同一性は (端末ID, データタイプ, データ提供元, clientRecordId) で判定する
+  (clientRecordId が無いレコードは生データのハッシュ)
+- 同一レコードは lastModifiedTime が新しい版だけを残す。内容が同じ版は追加しない
+- 同一性のインデックス (SQLite) と、レコード本体の追記専用ファイル (NDJSON) に分けて保存するため、
+  エクスポートの取り込みは新しいファイルのレコード数に比例した時間で済む
+  (過去の全レコードを読み直さない)
+- 古い版が占める割合が大きくなったら、有効なレコードだけを新しいファイルに書き直す (compact)
+
+保存形式:
+<store>/index.db                     同一性インデックス
+<store>/segments/segment_NNNNNN.ndjson  レコード本体 (1行1レコード、deviceId 付き)
+
+使用方法:
+python health_connect_merge_store.py add health_connect_raw_data_*.json [--store DIR]
+python health_connect_merge_store.py export merged.json [--store DIR] [--device-id ID] [--format json|ndjson]
+python health_connect_merge_store.py compact [--store DIR]
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from typing import Dict, List, Any, Optional, Iterator
+
+from health_connect_data_extractor import (
+    StreamingReportWriter, load_export, record_timestamp, to_epoch_millis, to_record_dict
+)
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS records (
+        device_id TEXT NOT NULL,
+        data_type TEXT NOT NULL,
+        record_key TEXT NOT NULL,
+        last_modified_time INTEGER,
+        digest TEXT NOT NULL,
+        start_time INTEGER,
+        segment INTEGER NOT NULL,
+        offset INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        PRIMARY KEY (device_id, data_type, record_key)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_records_location
+    ON records(segment, offset)
+    '''
+]
+
+def record_identity(record: Dict[str, Any]) -> tuple:
+    """レコードの (識別子, lastModifiedTime, 内容のハッシュ) を返す
+    
+    抽出ツールの形式 (rawData の client_record_id 等) と、サンプル生成ツールの形式
+    (metadata の clientRecordId 等) の両方に対応する。
+    """
+    raw = record.get('rawData')
+    metadata = record.get('metadata') or {}
+    if raw:
+        content = raw
+        client_record_id = raw.get('client_record_id')
+        origin = raw.get('data_origin')
+        last_modified = raw.get('last_modified_time')
+    else:
+        # 取得日時は取得ごとに変わるため内容の比較から除く
+        content = {k: v for k, v in record.items() if k != 'extractedAt'}
+        client_record_id = metadata.get('clientRecordId')
+        origin = metadata.get('dataOrigin')
+        last_modified = metadata.get('lastModifiedTime')
+    
+    digest = hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+    key = f"{origin or ''}:{client_record_id}" if client_record_id else digest
+    return key, to_epoch_millis(last_modified), digest
+
+class MergeStore:
+    """エクスポートを取り込み、レコードごとに最新の版だけを保持するストア"""
+    
+    def __init__(self, directory: str = 'health_connect_store', segment_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_dir = os.path.join(directory, 'segments')
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(directory, 'index.db'))
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+    
+    def __enter__(self) -> 'MergeStore':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        self.connection.close()
+    
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.segment_dir, f"segment_{segment:06d}.ndjson")
+    
+    def segments(self) -> List[int]:
+        names = glob.glob(os.path.join(self.segment_dir, 'segment_*.ndjson'))
+        return sorted(int(os.path.basename(name)[len('segment_'):-len('.ndjson')]) for name in names)
+    
+    def _open_segment(self) -> tuple:
+        """追記先のファイル (最後のファイルが上限を超えていれば新しいファイル) を開く"""
+        segments = self.segments()
+        segment = segments[-1] if segments else 1
+        path = self.segment_path(segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+            segment += 1
+            path = self.segment_path(segment)
+        return segment, open(path, 'ab')
+    
+    def add(self, data: Dict[str, List[Any]], device_id: Optional[str] = None) -> Dict[str, int]:
+        """レコードを取り込み、件数 (added / updated / duplicates / stale) を返す
+        
+        インデックスの参照・更新は主キーによる1件ずつの検索のため、
+        取り込むレコード数に比例した時間で済む。
+        """
+        device_id = device_id or ''
+        counts = {'added': 0, 'updated': 0, 'duplicates': 0, 'stale': 0}
+        lookup = self.connection.execute
+        segment, output = self._open_segment()
+        offset = output.tell()
+        try:
+            with self.connection:
+                for data_type, records in data.items():
+                    for record in records:
+                        record = to_record_dict(record)
+                        key, last_modified, digest = record_identity(record)
+                        row = lookup(
+                            'SELECT last_modified_time, digest FROM records '
+                            'WHERE device_id = ? AND data_type = ? AND record_key = ?',
+                            (device_id, data_type, key)
+                        ).fetchone()
+                        if row is not None:
+                            previous_modified, previous_digest = row
+                            if digest == previous_digest:
+                                counts['duplicates'] += 1
+                                continue
+                            if (last_modified is not None and previous_modified is not None
+                                    and last_modified <= previous_modified):
+                                # 古い版 (または更新日時が同じ別内容) は既存の版を残す
+                                counts['stale'] += 1
+                                continue
+                        
+                        line = json.dumps(dict(record, deviceId=device_id), ensure_ascii=False,
+                                          separators=(',', ':')).encode('utf-8') + b'\n'
+                        if offset and offset + len(line) > self.segment_bytes:
+                            output.flush()
+                            os.fsync(output.fileno())
+                            output.close()
+                            segment += 1
+                            output = open(self.segment_path(segment), 'ab')
+                            offset = 0
+                        output.write(line)
+                        lookup(
+                            'INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (device_id, data_type, key, last_modified, digest,
+                             record_timestamp(record), segment, offset, len(line))
+                        )
+                        offset += len(line)
+                        counts['updated' if row is not None else 'added'] += 1
+                # インデックスをコミットする前にレコード本体を書き終える
+                output.flush()
+                os.fsync(output.fileno())
+        finally:
+            output.close()
+        return counts
+    
+    def add_export(self, filename: str) -> Optional[Dict[str, int]]:
+        """エクスポートファイル (JSON / NDJSON) を取り込む"""
+        try:
+            report = load_export(filename)
+        except (OSError, ValueError) as e:
+            print(f"❌ ファイル読み込みエラー: {e}")
+            return None
+        device_id = report.get('extractionInfo', {}).get('deviceId')
+        counts = self.add(report.get('rawData', {}), device_id)
+        print(f"✅ {filename}: 追加 {counts['added']}件, 更新 {counts['updated']}件, "
+              f"重複 {counts['duplicates']}件, 古い版 {counts['stale']}件")
+        return counts
+    
+    def iter_records(self, device_id: Optional[str] = None,
+                     data_type: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """最新の版のレコードを データタイプ・開始時刻順に返す"""
+        sql = 'SELECT segment, offset, length FROM records'
+        conditions = []
+        params: List[Any] = []
+        if device_id is not None:
+            conditions.append('device_id = ?')
+            params.append(device_id)
+        if data_type is not None:
+            conditions.append('data_type = ?')
+            params.append(data_type)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY device_id, data_type, start_time'
+        
+        files: Dict[int, Any] = {}
+        try:
+            for segment, offset, length in self.connection.execute(sql, params).fetchall():
+                f = files.get(segment)
+                if f is None:
+                    f = files[segment] = open(self.segment_path(segment), 'rb')
+                f.seek(offset)
+                yield json.loads(f.read(length))
+        finally:
+            for f in files.values():
+                f.close()
+    
+    def device_ids(self) -> List[str]:
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT device_id FROM records ORDER BY device_id')]
+    
+    def data_types(self, device_id: str) -> List[str]:
+        return [row[0] for row in self.connection.execute(
+            'SELECT DISTINCT data_type FROM records WHERE device_id = ? ORDER BY data_type', (device_id,))]
+    
+    def export(self, filename: str, device_id: Optional[str] = None, fmt: str = 'json') -> Optional[str]:
+        """1台分の最新の版を抽出ツールと同じ形式で保存"""
+        if device_id is None:
+            devices = self.device_ids()
+            if len(devices) > 1:
+                print(f"❌ 端末が複数あります。--device-id を指定してください: {', '.join(devices)}")
+                return None
+            device_id = devices[0] if devices else ''
+        try:
+            with StreamingReportWriter(filename, device_id or None, fmt) as writer:
+                for data_type in self.data_types(device_id):
+                    records = ({k: v for k, v in record.items() if k != 'deviceId'}
+                               for record in self.iter_records(device_id, data_type))
+                    writer.write_records(data_type, records, ordered=True)
+            print(f"💾 データを保存しました: {filename}")
+            return filename
+        except OSError as e:
+            print(f"❌ 保存エラー: {e}")
+            return None
+    
+    def stats(self) -> Dict[str, int]:
+        records, live_bytes = self.connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(length), 0) FROM records').fetchone()
+        total_bytes = sum(os.path.getsize(self.segment_path(segment)) for segment in self.segments())
+        return {'records': records, 'liveBytes': live_bytes, 'totalBytes': total_bytes}
+    
+    def compact(self, threshold: float = 0.5) -> bool:
+        """古い版が占める割合が threshold 以上なら、有効なレコードだけのファイルに書き直す"""
+        stats = self.stats()
+        if not stats['totalBytes'] or (stats['totalBytes'] - stats['liveBytes']) / stats['totalBytes'] < threshold:
+            return False
+        
+        old_segments = self.segments()
+        segment = old_segments[-1] + 1
+        offset = 0
+        output = open(self.segment_path(segment), 'wb')
+        moved = []
+        files: Dict[int, Any] = {}
+        try:
+            # ファイル内の位置順に読むことで、読み込みを順次アクセスにする
+            rows = self.connection.execute(
+                'SELECT device_id, data_type, record_key, segment, offset, length FROM records '
+                'ORDER BY segment, offset').fetchall()
+            for device_id, data_type, key, old_segment, old_offset, length in rows:
+                f = files.get(old_segment)
+                if f is None:
+                    f = files[old_segment] = open(self.segment_path(old_segment), 'rb')
+                f.seek(old_offset)
+                line = f.read(length)
+                if offset and offset + length > self.segment_bytes:
+                    output.close()
+                    segment += 1
+                    output = open(self.segment_path(segment), 'wb')
+                    offset = 0
+                output.write(line)
+                moved.append((segment, offset, device_id, data_type, key))
+                offset += length
+            output.flush()
+            os.fsync(output.fileno())
+        finally:
+            output.close()
+            for f in files.values():
+                f.close()
+        
+        with self.connection:
+            self.connection.executemany(
+                'UPDATE records SET segment = ?, offset = ? WHERE device_id = ? AND data_type = ? AND record_key = ?',
+                moved
+            )
+        # インデックスの更新後に古いファイルを削除する (途中で失敗しても古いファイルが残るだけ)
+        for old_segment in old_segments:
+            os.remove(self.segment_path(old_segment))
+        after = self.stats()
+        print(f"🗜️ コンパクション: {stats['totalBytes']} → {after['totalBytes']} bytes ({after['records']}件)")
+        return True
+
+def main():
+    parser = argparse.ArgumentParser(description='Health Connect エクスポートの重複排除ストア')
+    parser.add_argument('command', choices=['add', 'export', 'compact', 'stats'], help='実行する操作')
+    parser.add_argument('files', nargs='*', help='add: 取り込むエクスポート / export: 保存先ファイル')
+    parser.add_argument('--store', default='health_connect_store', help='ストアのディレクトリ')
+    parser.add_argument('--device-id', default=None, help='export する端末ID')
+    parser.add_argument('--format', choices=['json', 'ndjson'], default='json', help='export の出力形式')
+    parser.add_argument('--compact-threshold', type=float, default=0.5,
+                        help='古い版の割合がこれ以上なら add の後にコンパクションする')
+    args = parser.parse_args()
+    
+    with MergeStore(args.store) as store:
+        if args.command == 'add':
+            if not args.files:
+                parser.error('取り込むファイルを指定してください')
+            failed = False
+            for filename in args.files:
+                failed = store.add_export(filename) is None or failed
+            store.compact(args.compact_threshold)
+            if failed:
+                sys.exit(1)
+        elif args.command == 'export':
+            if len(args.files) != 1:
+                parser.error('保存先ファイルを1つ指定してください')
+            if not store.export(args.files[0], args.device_id, args.format):
+                sys.exit(1)
+        elif args.command == 'compact':
+            if not store.compact(0.0):
+                print("⏭️ コンパクション不要 (保存済みのレコードがありません)")
+        else:
+            print(json.dumps(store.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Health Connect データ 時間別・日別ロールアップ
+
+抽出したレコードを端末・データタイプごとに1時間単位 (端末のローカル時刻) で集計し、
+時間別・日別のロールアップ (件数・合計・最小・最大・平均) を生データのエクスポートと
+同じ場所に保存します。歩数の日別合計や心拍数の最小・最大・平均はこのファイルだけで
+参照できるため、ダッシュボード側で生データ全件を読み込む必要はありません。
+
+- 集計値は測定値 [value1, value2, value3] (vital_values) ごとに保持する
+  (歩数は合計、心拍数・体重等は最小・最大・平均を使う)
+- 期間を持つレコード (歩数・睡眠等) は開始時刻の時間帯に集計する
+- 日別は時間別の集計値をまとめて算出する
+- 既存のロールアップファイルに差分のレコードだけを反映できる (差分更新)。
+  レコードごとの時間帯・測定値をレコードの識別子 (データ提供元 + clientRecordId) で保持し、
+  差分のレコードが入る時間帯と、更新されたレコードの前の版が入っていた時間帯だけを集計し直す。
+  境界で再取得されたレコードも、更新されたレコード (last_modified_time が新しい版) も二重に集計しない
+- NumPy がある場合は集計し直す時間帯のレコードを配列にまとめて時間帯ごとに集計する
+  (無い場合は1件ずつ集計する)
+
+使用方法:
+python health_connect_rollup.py health_connect_raw_data_YYYYMMDD_HHMMSS.json [--output FILE] [--previous FILE]
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Any, Optional, Iterable
+
+try:
+    import numpy
+except ImportError:  # 任意 (時間帯ごとの集計のみで使用、無い場合は1件ずつ集計)
+    numpy = None
+
+from health_connect_data_extractor import (
+    MANIFEST_SUFFIX, VITAL_VALUE_FIELDS, HealthRecord, load_export, record_timestamp, vital_values
+)
+
+HOUR_MS = 60 * 60 * 1000
+# 時間番号の基準 (ローカル時刻の 1970-01-01T00:00)
+LOCAL_EPOCH = datetime.datetime(1970, 1, 1)
+# 集計値1つあたりの要素: [件数, 合計, 最小, 最大]
+STAT_WIDTH = 4
+
+class VitalRollup:
+    """端末・データタイプ・時間帯ごとの集計値を保持し、差分更新する
+    
+    時間別の集計値は {ローカル時刻の時間番号: [レコード数, 件数1, 合計1, 最小1, 最大1, ...]} で保持する。
+    最小・最大は引き算で戻せないため、レコードごとの [時間番号, 測定値...] (entries) を
+    識別子をキーに保持し、レコードが追加・更新された時間帯だけを entries から集計し直す。
+    """
+    
+    def __init__(self):
+        # devices[端末ID][データタイプ] = {'fields': (...), 'hours': {...}, 'entries': {...}, 'hourKeys': {...}}
+        self.devices: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # UTC の時間番号 -> ローカル時刻とのオフセット (ミリ秒)
+        self._offsets: Dict[int, int] = {}
+    
+    def _offset(self, utc_hour: int) -> int:
+        offset = self._offsets.get(utc_hour)
+        if offset is None:
+            offset = time.localtime(utc_hour * 3600).tm_gmtoff * 1000
+            self._offsets[utc_hour] = offset
+        return offset
+    
+    def local_hour(self, millis: int) -> int:
+        """エポックミリ秒をローカル時刻の時間番号 (1970-01-01T00:00 からの時間数) に変換"""
+        return (millis + self._offset(millis // HOUR_MS)) // HOUR_MS
+    
+    def hour_start_millis(self, hour: int) -> int:
+        """ローカル時刻の時間番号の開始時刻 (エポックミリ秒)"""
+        local_ms = hour * HOUR_MS
+        return local_ms - self._offset((local_ms - self._offset(hour)) // HOUR_MS)
+    
+    @staticmethod
+    def record_key(record: Any) -> str:
+        """レコードの識別子 (データ提供元 + clientRecordId、無ければ生データのハッシュ)
+        
+        更新されたレコードも同じ識別子になるため、前の版を置き換えられる。
+        重なりの解消で分割されたレコードは同じ clientRecordId を持つため、開始時刻で区別する。
+        """
+        if isinstance(record, HealthRecord):
+            client_record_id = record.raw('client_record_id')
+            if client_record_id:
+                return f"{record.raw('data_origin') or ''}:{client_record_id}"
+            raw = record.raw_data()
+        else:
+            raw = record.get('rawData') or {}
+            client_record_id = raw.get('client_record_id')
+            if client_record_id:
+                key = f"{raw.get('data_origin') or ''}:{client_record_id}"
+                if 'apportioned' in (record.get('metadata') or {}):
+                    key += f"@{raw.get('start_time')}"
+                return key
+            raw = record.get('rawData', record)
+        return hashlib.sha1(json.dumps(raw, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def _series(self, device_id: str, data_type: str) -> Dict[str, Any]:
+        types = self.devices.setdefault(device_id, {})
+        series = types.get(data_type)
+        if series is None:
+            series = {
+                'fields': VITAL_VALUE_FIELDS.get(data_type, ()),
+                'hours': {},
+                # 識別子 -> [時間番号, 測定値1, ...] (測定値が無い場合は None)
+                'entries': {},
+                # 時間番号 -> その時間帯のレコードの識別子
+                'hourKeys': {}
+            }
+            types[data_type] = series
+        return series
+    
+    def add_records(self, device_id: str, data_type: str, records: Iterable[Any]) -> int:
+        """レコードを集計値に反映し、追加・更新したレコード数を返す
+        
+        同じ識別子のレコードは新しい版で置き換える (前の版の値は集計から外れる)。
+        時間帯・測定値が前回と同じレコード (境界で再取得されたもの) は数えない。
+        """
+        series = self._series(device_id, data_type)
+        width = len(series['fields'])
+        entries = series['entries']
+        hour_keys = series['hourKeys']
+        local_hour = self.local_hour
+        record_key = self.record_key
+        
+        changed = 0
+        touched = set()
+        for record in records:
+            timestamp = record_timestamp(record)
+            if timestamp < 0:
+                continue
+            hour = local_hour(timestamp)
+            entry = [hour] + (vital_values(record)[:width] if width else [])
+            key = record_key(record)
+            previous = entries.get(key)
+            if previous == entry:
+                continue
+            if previous is not None:
+                hour_keys[previous[0]].discard(key)
+                touched.add(previous[0])
+            entries[key] = entry
+            hour_keys.setdefault(hour, set()).add(key)
+            touched.add(hour)
+            changed += 1
+        
+        self._aggregate(series, touched)
+        return changed
+    
+    def _aggregate(self, series: Dict[str, Any], hours: Iterable[int]):
+        """指定した時間帯の集計値を entries から作り直す (レコードが無くなった時間帯は削除)"""
+        entries = series['entries']
+        hour_keys = series['hourKeys']
+        width = len(series['fields'])
+        rows = []
+        for hour in hours:
+            keys = hour_keys.get(hour)
+            if not keys:
+                hour_keys.pop(hour, None)
+                series['hours'].pop(hour, None)
+                continue
+            rows.extend(entries[key] for key in keys)
+        if not rows:
+            return
+        if numpy is not None:
+            series['hours'].update(self._group_numpy(rows, width))
+        else:
+            series['hours'].update(self._group_loop(rows, width))
+    
+    @staticmethod
+    def _group_loop(rows: List[List[Any]], width: int) -> Dict[int, List[Any]]:
+        """[時間番号, 測定値...] の一覧を時間帯ごとに集計する"""
+        grouped: Dict[int, List[Any]] = {}
+        for row in rows:
+            stats = grouped.get(row[0])
+            if stats is None:
+                stats = [0] + [0, 0.0, None, None] * width
+                grouped[row[0]] = stats
+            stats[0] += 1
+            for index in range(width):
+                value = row[1 + index]
+                if value is None:
+                    continue
+                base = 1 + index * STAT_WIDTH
+                stats[base] += 1
+                stats[base + 1] += value
+                if stats[base + 2] is None or value < stats[base + 2]:
+                    stats[base + 2] = value
+                if stats[base + 3] is None or value > stats[base + 3]:
+                    stats[base + 3] = value
+        return grouped
+    
+    @staticmethod
+    def _group_numpy(rows: List[List[Any]], width: int) -> Dict[int, List[Any]]:
+        """_group_loop と同じ集計を NumPy の配列で行う (時間番号で並べ替えて reduceat)"""
+        table = numpy.array(rows, dtype=numpy.float64).reshape(len(rows), 1 + width)
+        order = numpy.argsort(table[:, 0], kind='stable')
+        table = table[order]
+        hours, starts, counts = numpy.unique(table[:, 0], return_index=True, return_counts=True)
+        columns = []
+        for index in range(width):
+            values = table[:, 1 + index]
+            present = ~numpy.isnan(values)
+            columns.append((
+                numpy.add.reduceat(present.astype(numpy.int64), starts),
+                numpy.add.reduceat(numpy.where(present, values, 0.0), starts),
+                # fmin / fmax は NaN (測定値なし) を無視する (全て NaN の時間帯は NaN)
+                numpy.fmin.reduceat(values, starts),
+                numpy.fmax.reduceat(values, starts)
+            ))
+        grouped = {}
+        for position, hour in enumerate(hours.tolist()):
+            stats = [int(counts[position])]
+            for count, total, minimum, maximum in columns:
+                if count[position]:
+                    stats += [int(count[position]), float(total[position]),
+                              float(minimum[position]), float(maximum[position])]
+                else:
+                    stats += [0, 0.0, None, None]
+            grouped[int(hour)] = stats
+        return grouped
+    
+    def update(self, device_id: str, data: Dict[str, List[Any]]) -> int:
+        """全データタイプのレコードを反映し、追加・更新したレコード数の合計を返す"""
+        total = 0
+        for data_type, records in data.items():
+            if not records:
+                continue
+            total += self.add_records(device_id or '', data_type, records)
+        return total
+    
+    @staticmethod
+    def _merge(target: List[Any], stats: List[Any]):
+        target[0] += stats[0]
+        for base in range(1, len(stats), STAT_WIDTH):
+            if not stats[base]:
+                continue
+            target[base] += stats[base]
+            target[base + 1] += stats[base + 1]
+            if target[base + 2] is None or stats[base + 2] < target[base + 2]:
+                target[base + 2] = stats[base + 2]
+            if target[base + 3] is None or stats[base + 3] > target[base + 3]:
+                target[base + 3] = stats[base + 3]
+    
+    @staticmethod
+    def _values(fields: tuple, stats: List[Any]) -> Dict[str, Dict[str, Any]]:
+        values = {}
+        for index, field in enumerate(fields):
+            count, total, minimum, maximum = stats[1 + index * STAT_WIDTH:1 + (index + 1) * STAT_WIDTH]
+            if not count:
+                continue
+            values[field] = {
+                'count': count,
+                'sum': round(total, 6),
+                'min': minimum,
+                'max': maximum,
+                'mean': round(total / count, 6)
+            }
+        return values
+    
+    def hourly(self, device_id: str, data_type: str) -> List[Dict[str, Any]]:
+        """時間別ロールアップ (時刻順)"""
+        series = self.devices[device_id][data_type]
+        rollups = []
+        for hour in sorted(series['hours']):
+            stats = series['hours'][hour]
+            rollups.append({
+                'start': (LOCAL_EPOCH + datetime.timedelta(hours=hour)).strftime('%Y-%m-%dT%H:00'),
+                'startTime': self.hour_start_millis(hour),
+                'records': stats[0],
+                'values': self._values(series['fields'], stats)
+            })
+        return rollups
+    
+    def daily(self, device_id: str, data_type: str) -> List[Dict[str, Any]]:
+        """日別ロールアップ (時間別の集計値をローカル日付ごとにまとめる)"""
+        series = self.devices[device_id][data_type]
+        days: Dict[int, List[Any]] = {}
+        for hour, stats in series['hours'].items():
+            day = days.get(hour // 24)
+            if day is None:
+                days[hour // 24] = list(stats)
+            else:
+                self._merge(day, stats)
+        rollups = []
+        for day in sorted(days):
+            stats = days[day]
+            rollups.append({
+                'date': (LOCAL_EPOCH + datetime.timedelta(days=day)).date().isoformat(),
+                'startTime': self.hour_start_millis(day * 24),
+                'records': stats[0],
+                'values': self._values(series['fields'], stats)
+            })
+        return rollups
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """ロールアップファイルの内容 (差分更新用の状態を含む)"""
+        devices = {}
+        for device_id, types in self.devices.items():
+            devices[device_id] = {}
+            for data_type, series in types.items():
+                devices[device_id][data_type] = {
+                    'fields': list(series['fields']),
+                    'hourly': self.hourly(device_id, data_type),
+                    'daily': self.daily(device_id, data_type),
+                    # 差分更新用のレコードごとの [時間番号, 測定値...]
+                    'entries': series['entries']
+                }
+        return {
+            'updatedAt': datetime.datetime.now().isoformat(),
+            'timezoneOffsetMinutes': time.localtime().tm_gmtoff // 60,
+            'devices': devices
+        }
+    
+    def load(self, filename: str) -> bool:
+        """保存済みのロールアップファイルから集計値を復元する (時間別の値から再構築)
+        
+        レコードごとの値 (entries) を持たない古い形式のファイルは差分更新できないため False を返す。
+        """
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ ロールアップ読み込みエラー: {e}")
+            return False
+        
+        self.devices = {}
+        for device_id, types in payload.get('devices', {}).items():
+            for data_type, saved in types.items():
+                if 'entries' not in saved:
+                    print(f"⚠️ 差分更新に必要な情報が無いロールアップです: {filename}")
+                    self.devices = {}
+                    return False
+                series = self._series(device_id, data_type)
+                series['fields'] = tuple(saved.get('fields', series['fields']))
+                for item in saved.get('hourly', []):
+                    hour = (datetime.datetime.fromisoformat(item['start']) - LOCAL_EPOCH) // datetime.timedelta(hours=1)
+                    stats = [item['records']]
+                    for field in series['fields']:
+                        value = item['values'].get(field)
+                        if value:
+                            stats += [value['count'], value['sum'], value['min'], value['max']]
+                        else:
+                            stats += [0, 0.0, None, None]
+                    series['hours'][hour] = stats
+                series['entries'] = saved['entries']
+                for key, entry in series['entries'].items():
+                    series['hourKeys'].setdefault(entry[0], set()).add(key)
+        return True
+    
+    def save(self, filename: str) -> Optional[str]:
+        """一時ファイル経由でアトミックに保存"""
+        try:
+            tmp_path = f"{filename}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, filename)
+            print(f"💾 ロールアップを保存しました: {filename}")
+            return filename
+        except OSError as e:
+            print(f"❌ ロールアップ保存エラー: {e}")
+            return None
+
+def rollup_filename(export_file: str) -> str:
+    """エクスポートと同じ場所のロールアップファイル名 (<エクスポート名>_rollups.json)"""
+    if export_file.endswith(MANIFEST_SUFFIX):
+        # チャンク出力はマニフェストを除いた名前
+        return export_file[:-len(MANIFEST_SUFFIX)] + '_rollups.json'
+    return os.path.splitext(export_file)[0] + '_rollups.json'
+
+def write_rollups(data: Dict[str, List[Any]], device_id: Optional[str], filename: str,
+                  previous_file: Optional[str] = None,
+                  full_data: Optional[Dict[str, List[Any]]] = None) -> Optional[str]:
+    """レコードを集計して保存する
+    
+    previous_file を指定した場合はそのロールアップに data を反映する (差分更新)。
+    data には前回以降の差分 (extract_incremental の結果) を渡すこと。
+    previous_file が無い・読み込めない場合、full_data (差分を含む全期間のレコード) を
+    指定していればそこから作り直す。
+    """
+    rollup = VitalRollup()
+    if previous_file and os.path.exists(previous_file) and rollup.load(previous_file):
+        pass
+    elif full_data is not None:
+        rollup = VitalRollup()
+        data = full_data
+    added = rollup.update(device_id or '', data)
+    print(f"📊 ロールアップ: {added}件を集計")
+    return rollup.save(filename)
+
+def main():
+    parser = argparse.ArgumentParser(description='Health Connect 抽出データの時間別・日別ロールアップ')
+    parser.add_argument('export_file', help='health_connect_data_extractor.py の出力 (JSON / NDJSON)')
+    parser.add_argument('--output', default=None,
+                        help='ロールアップの保存先 (デフォルト: <入力ファイル名>_rollups.json)')
+    parser.add_argument('--previous', default=None,
+                        help='加算先のロールアップファイル (入力ファイルが前回以降の差分のみの場合)')
+    args = parser.parse_args()
+    
+    try:
+        report = load_export(args.export_file)
+    except (OSError, ValueError) as e:
+        print(f"❌ ファイル読み込みエラー: {e}")
+        sys.exit(1)
+    
+    filename = args.output or rollup_filename(args.export_file)
+    device_id = report.get('extractionInfo', {}).get('deviceId')
+    if not write_rollups(report.get('rawData', {}), device_id, filename, args.previous):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,24 @@ Health Connect データ構造サンプル生成スクリプト
 これは実データではなく、Health Connect APIの仕様に基づいたサンプルデータです。
 """
 
+import argparse
 import json
 import datetime
+import hashlib
+import os
 import random
-from typing import Dict, List, Any
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+
+try:
+    import numpy
+except ImportError:  # 任意 (大量データ生成モードの値の一括生成のみで使用、無い場合は1件ずつ生成)
+    numpy = None
+
+# 大量データ生成モードは抽出ツールの出力形式・型変換をそのまま使う
+from health_connect_data_extractor import RECORD_CLASSES, HealthRecord, StreamingReportWriter
 
 class HealthConnectSampleGenerator:
     def __init__(self):
@@ -295,7 +309,451 @@ class HealthConnectSampleGenerator:
             }
         }
 
+def derive_seed(master_seed: int, *parts: Any) -> int:
+    """マスターシードと識別子 (ユーザー番号・データタイプ等) から64bitのシードを導出"""
+    key = ':'.join(str(p) for p in (master_seed,) + parts)
+    return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big')
+
+class HealthConnectScaleGenerator:
+    """大量データ生成 (ユーザー数 × 日数 × サンプリング周波数)
+    
+    Content Providerの生データ列と同じ形式の行を、固定長のチャンク単位でまとめて
+    生成してはファイルへ書き出す。値は NumPy (numpy.random.Generator) で列ごとに一括生成し
+    (NumPy が無い場合・vectorized=False の場合は random.Random で1件ずつ生成)、
+    出力行は文字列の書式でまとめて組み立てる。
+    乱数系列は (シード, ユーザー, データタイプ, 日) ごとに derive_seed で分けるため、
+    同じシード・同じ生成方法からは、ユーザーの分け方 (シャード数) に関わらず常に同じデータが生成される。
+    出力は health_connect_data_extractor.py のエクスポート形式
+    (1ユーザー1ファイル) で、load_export() や SQLite出力でそのまま読み込める。
+    """
+    
+    # データタイプ → (記録間隔 秒, データ提供元)
+    # HeartRate の間隔は hz で指定する
+    PROFILES = {
+        'Steps': (15 * 60, 'com.google.android.apps.fitness'),
+        'HeartRate': (1, 'com.samsung.health'),
+        'BloodPressure': (12 * 60 * 60, 'com.omron.connect'),
+        'Weight': (24 * 60 * 60, 'com.withings.wiscale2'),
+        'BodyTemperature': (24 * 60 * 60, 'com.healthcare.thermometer'),
+        'OxygenSaturation': (60 * 60, 'com.samsung.health')
+    }
+    
+    def __init__(self, users: int = 10, days: int = 7, hz: float = 1.0,
+                 data_types: Optional[List[str]] = None, seed: int = 0,
+                 chunk_size: int = 100000, end_date: Optional[datetime.date] = None,
+                 vectorized: Optional[bool] = None):
+        if hz <= 0:
+            raise ValueError("hz は正の値を指定してください")
+        self.users = users
+        self.days = days
+        self.hz = hz
+        self.data_types = list(data_types or self.PROFILES)
+        unknown = [t for t in self.data_types if t not in self.PROFILES]
+        if unknown:
+            raise ValueError(f"未対応のデータタイプです: {', '.join(unknown)}")
+        self.seed = seed
+        self.chunk_size = chunk_size
+        end_date = end_date or datetime.date.today()
+        end = datetime.datetime.combine(end_date, datetime.time())
+        self.end_ms = int(end.timestamp() * 1000)
+        self.start_ms = self.end_ms - days * 24 * 60 * 60 * 1000
+        # 生成結果を再現できるよう取得日時も期間の終わりに固定する
+        self.extracted_at = end.isoformat()
+        if vectorized and numpy is None:
+            raise ValueError("NumPy での一括生成には numpy パッケージが必要です (pip install numpy)")
+        self.vectorized = numpy is not None if vectorized is None else vectorized
+    
+    def interval_ms(self, data_type: str) -> int:
+        if data_type == 'HeartRate':
+            return max(int(1000 / self.hz), 1)
+        return self.PROFILES[data_type][0] * 1000
+    
+    def count_records(self, data_type: str) -> int:
+        """1ユーザーあたりの生成件数"""
+        return -(-(self.end_ms - self.start_ms) // self.interval_ms(data_type))
+    
+    def columns(self, data_type: str) -> tuple:
+        value_columns = {
+            'Steps': ('count',),
+            'HeartRate': ('bpm', 'measurement_method'),
+            'BloodPressure': ('systolic', 'diastolic', 'body_position', 'measurement_location'),
+            'Weight': ('weight',),
+            'BodyTemperature': ('temperature', 'measurement_location'),
+            'OxygenSaturation': ('percentage',)
+        }[data_type]
+        return ('start_time', 'end_time', 'data_origin', 'client_record_id', 'last_modified_time') + value_columns
+    
+    def baseline(self, user: int, data_type: str) -> float:
+        """ユーザーごとの基準値"""
+        rng = random.Random(derive_seed(self.seed, user, data_type))
+        return {
+            'Steps': lambda: rng.randint(100, 600),
+            'HeartRate': lambda: rng.randint(55, 80),
+            'BloodPressure': lambda: rng.randint(105, 140),
+            'Weight': lambda: rng.uniform(45.0, 95.0),
+            'BodyTemperature': lambda: rng.uniform(36.2, 36.8),
+            'OxygenSaturation': lambda: rng.randint(95, 99)
+        }[data_type]()
+    
+    def generate_values(self, rng: random.Random, data_type: str, baseline: float,
+                        state: Any, size: int) -> tuple:
+        """size 件分の値列 (columns() の値の列ごとの文字列リスト) と、次のチャンクに引き継ぐ状態を返す
+        
+        state は日の最初のチャンクでは None。
+        """
+        if data_type == 'HeartRate':
+            # 基準値に引き戻されるランダムウォーク
+            level = baseline if state is None else state
+            levels = []
+            for step in rng.choices((-2, -1, -1, 0, 0, 0, 1, 1, 2), k=size):
+                level += step + (1 if level < baseline - 10 else -1 if level > baseline + 25 else 0)
+                levels.append(str(level))
+            return [levels, ['MEASUREMENT_METHOD_AUTOMATIC'] * size], level
+        if data_type == 'Steps':
+            return [[str(int(baseline * r)) for r in rng.choices((0.0, 0.1, 0.5, 1.0, 2.0), k=size)]], state
+        if data_type == 'BloodPressure':
+            systolic = [baseline + rng.randint(-8, 8) for _ in range(size)]
+            diastolic = [s - rng.randint(35, 50) for s in systolic]
+            return [list(map(str, systolic)), list(map(str, diastolic)),
+                    ['BODY_POSITION_SITTING_DOWN'] * size, ['MEASUREMENT_LOCATION_LEFT_UPPER_ARM'] * size], state
+        if data_type == 'Weight':
+            return [[f"{baseline + rng.uniform(-0.6, 0.6):.1f}" for _ in range(size)]], state
+        if data_type == 'BodyTemperature':
+            return [[f"{baseline + rng.uniform(-0.3, 0.5):.1f}" for _ in range(size)],
+                    ['MEASUREMENT_LOCATION_ARMPIT'] * size], state
+        return [[str(min(100, baseline + rng.randint(-2, 1))) for _ in range(size)]], state
+    
+    # HeartRate のランダムウォークの1歩 (一括生成)
+    HEART_RATE_STEPS = (-2, -1, -1, 0, 0, 0, 1, 1, 2)
+    # Steps の基準値に掛ける倍率 (一括生成)
+    STEP_RATIOS = (0.0, 0.1, 0.5, 1.0, 2.0)
+    
+    def generate_values_vectorized(self, rng: Any, data_type: str, baseline: float,
+                                   state: Any, size: int) -> tuple:
+        """generate_values の NumPy 版 (rng は numpy.random.Generator)
+        
+        一様乱数 (rng.random) だけを使うため、チャンクの大きさに関わらず同じ値列になる。
+        """
+        uniform = rng.random(size)
+        if data_type == 'HeartRate':
+            # [基準値 - 10, 基準値 + 25] で折り返すランダムウォーク (state は折り返す前の位置)
+            width = 35
+            steps = numpy.asarray(self.HEART_RATE_STEPS)[(uniform * len(self.HEART_RATE_STEPS)).astype(numpy.int64)]
+            position = (10 if state is None else state) + numpy.cumsum(steps)
+            folded = numpy.mod(position, 2 * width)
+            levels = baseline - 10 + numpy.where(folded <= width, folded, 2 * width - folded)
+            return [list(map(str, levels.tolist())), ['MEASUREMENT_METHOD_AUTOMATIC'] * size], int(position[-1])
+        if data_type == 'Steps':
+            ratios = numpy.asarray(self.STEP_RATIOS)[(uniform * len(self.STEP_RATIOS)).astype(numpy.int64)]
+            return [list(map(str, (baseline * ratios).astype(numpy.int64).tolist()))], state
+        if data_type == 'BloodPressure':
+            systolic = baseline - 8 + (uniform * 17).astype(numpy.int64)
+            diastolic = systolic - 35 - (rng.random(size) * 16).astype(numpy.int64)
+            return [list(map(str, systolic.tolist())), list(map(str, diastolic.tolist())),
+                    ['BODY_POSITION_SITTING_DOWN'] * size, ['MEASUREMENT_LOCATION_LEFT_UPPER_ARM'] * size], state
+        if data_type == 'Weight':
+            return [[f"{v:.1f}" for v in (baseline - 0.6 + uniform * 1.2).tolist()]], state
+        if data_type == 'BodyTemperature':
+            return [[f"{v:.1f}" for v in (baseline - 0.3 + uniform * 0.8).tolist()],
+                    ['MEASUREMENT_LOCATION_ARMPIT'] * size], state
+        saturation = numpy.minimum(100, baseline - 2 + (uniform * 4).astype(numpy.int64))
+        return [list(map(str, saturation.tolist()))], state
+    
+    def iter_column_chunks(self, user: int, data_type: str, start_ms: Optional[int] = None,
+                           end_ms: Optional[int] = None) -> Iterator[List[List[str]]]:
+        """1ユーザー・1データタイプ分の列 (columns() の順の文字列リスト) をチャンクごとに返す
+        
+        start_ms / end_ms を指定した場合は、開始時刻が [start_ms, end_ms) の行だけを返す。
+        乱数系列は日ごとに derive_seed で分けているため、期間の途中からでも
+        全期間を生成した場合と同じ値になる。
+        """
+        interval = self.interval_ms(data_type)
+        origin = self.PROFILES[data_type][1]
+        total = self.count_records(data_type)
+        day_ms = 24 * 60 * 60 * 1000
+        
+        def index_at(millis: int) -> int:
+            # millis 以降で最初の行の番号
+            return min(max(-(-(millis - self.start_ms) // interval), 0), total)
+        
+        first = 0 if start_ms is None else index_at(start_ms)
+        last = total if end_ms is None else index_at(end_ms)
+        if first >= last:
+            return
+        baseline = self.baseline(user, data_type)
+        prefix = f"{data_type}_{user}_"
+        # 期間を持つレコードは次の記録の直前まで
+        duration = interval - 1 if data_type == 'Steps' else 0
+        generate = self.generate_values_vectorized if self.vectorized else self.generate_values
+        
+        day = first * interval // day_ms
+        while True:
+            day_first = index_at(self.start_ms + day * day_ms)
+            day_last = index_at(self.start_ms + (day + 1) * day_ms)
+            if day_first >= last:
+                break
+            day_seed = derive_seed(self.seed, user, data_type, day)
+            if self.vectorized:
+                rng = numpy.random.Generator(numpy.random.PCG64(day_seed))
+            else:
+                rng = random.Random(day_seed)
+            state = None
+            position = day_first
+            while position < min(day_last, last):
+                size = min(self.chunk_size, day_last - position)
+                values, state = generate(rng, data_type, baseline, state, size)
+                low = max(position, first)
+                high = min(position + size, last)
+                if low < high:
+                    start = self.start_ms + low * interval
+                    stop = self.start_ms + high * interval
+                    starts = list(map(str, range(start, stop, interval)))
+                    ends = starts if not duration else list(map(str, range(start + duration, stop + duration, interval)))
+                    modified = list(map(str, range(start + duration + 1000, stop + duration + 1000, interval)))
+                    ids = list(map(prefix.__add__, map(str, range(low, high))))
+                    offset = low - position
+                    yield [starts, ends, [origin] * (high - low), ids, modified] + [
+                        column[offset:offset + high - low] for column in values]
+                position += size
+            day += 1
+    
+    def iter_row_chunks(self, user: int, data_type: str, start_ms: Optional[int] = None,
+                        end_ms: Optional[int] = None) -> Iterator[List[tuple]]:
+        """1ユーザー・1データタイプ分の行 (columns() の順の文字列タプル) をチャンクごとに返す"""
+        for columns in self.iter_column_chunks(user, data_type, start_ms, end_ms):
+            yield list(zip(*columns))
+    
+    def line_template(self, data_type: str, device_id: Optional[str] = None) -> tuple:
+        """1レコード分の JSON (HealthRecord.to_dict() を json.dumps した文字列と同じ) の書式を返す
+        
+        戻り値は (書式, [(列の位置, 小数に変換するか), ...])。書式の %s に順に列の値を入れる。
+        生成する値は数字・ID・定数名だけでエスケープが不要なため、レコードごとに
+        dict を作って json.dumps する代わりに文字列の書式で組み立てられる。
+        """
+        record_class = RECORD_CLASSES.get(data_type, HealthRecord)
+        columns = self.columns(data_type)
+        index = {column: i for i, column in enumerate(columns)}
+        value = {}
+        for key, column, convert, _ in record_class.VALUE_SPEC:
+            kind = 'r' if convert is None else 'f' if convert is float else 'n'
+            value[key] = f"@@{kind}{index[column]}@@"
+        value.update(record_class.VALUE_CONSTANTS)
+        item = {'deviceId': device_id} if device_id else {}
+        item.update({
+            'dataType': data_type,
+            'timestamp': f"@@n{index['start_time']}@@",
+            'rawData': {column: f"@@r{i}@@" for i, column in enumerate(columns)},
+            'source': record_class.SOURCE,
+            'extractedAt': self.extracted_at,
+            'metadata': dict(record_class.METADATA),
+            'value': value
+        })
+        text = json.dumps(item, ensure_ascii=False, separators=(',', ':')).replace('%', '%%')
+        slots = []
+        
+        def to_slot(match) -> str:
+            slots.append((int(match.group(2)), match.group(1) == 'f'))
+            # 文字列の列は引用符を残し、数値に変換する列は引用符を外す
+            return '"%s"' if match.group(1) == 'r' else '%s'
+        
+        return re.sub(r'"@@([rnf])(\d+)@@"', to_slot, text), slots
+    
+    def iter_line_chunks(self, user: int, data_type: str, device_id: Optional[str] = None) -> Iterator[tuple]:
+        """1ユーザー・1データタイプ分のレコードを JSON 文字列にして、
+        (文字列のリスト, 最初の timestamp, 最後の timestamp) をチャンクごとに返す"""
+        template, slots = self.line_template(data_type, device_id)
+        for columns in self.iter_column_chunks(user, data_type):
+            float_columns = {}
+            arguments = []
+            for position, as_float in slots:
+                if as_float:
+                    if position not in float_columns:
+                        float_columns[position] = list(map(repr, map(float, columns[position])))
+                    arguments.append(float_columns[position])
+                else:
+                    arguments.append(columns[position])
+            starts = columns[0]
+            yield list(map(template.__mod__, zip(*arguments))), int(starts[0]), int(starts[-1])
+    
+    @staticmethod
+    def device_id(user: int) -> str:
+        return f"user-{user:05d}"
+    
+    def iter_user_records(self, user: int, data_type: str) -> Iterator[HealthRecord]:
+        """1ユーザー・1データタイプ分のレコードを開始時刻順に返す"""
+        record_class = RECORD_CLASSES.get(data_type, HealthRecord)
+        columns = self.columns(data_type)
+        for rows in self.iter_row_chunks(user, data_type):
+            yield from record_class.from_rows(data_type, columns, rows, self.extracted_at)
+    
+    def write_user(self, user: int, filename: str, fmt: str = 'ndjson') -> Dict[str, Any]:
+        """1ユーザー分をエクスポート形式で書き出し、統計情報を返す"""
+        with StreamingReportWriter(filename, self.device_id(user), fmt, self.extracted_at) as writer:
+            for data_type in self.data_types:
+                writer.write_serialized(data_type, self.iter_line_chunks(user, data_type))
+        return writer.statistics
+    
+    def write_shard(self, users: Iterable[int], filename: str, fmt: str = 'ndjson') -> Dict[str, Any]:
+        """複数ユーザー分を1ファイルに書き出し、統計情報を返す
+        
+        データタイプごとにユーザー順で書き出し、各レコードに deviceId を付与する。
+        """
+        users = list(users)
+        
+        def iter_batches(data_type: str):
+            for user in users:
+                yield from self.iter_line_chunks(user, data_type, self.device_id(user))
+        
+        with StreamingReportWriter(filename, None, fmt, self.extracted_at) as writer:
+            for data_type in self.data_types:
+                writer.write_serialized(data_type, iter_batches(data_type))
+        return writer.statistics
+    
+    def generate(self, output_dir: str = '.', fmt: str = 'ndjson',
+                 users: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+        """ユーザーごとにファイルを書き出し、件数をまとめて返す"""
+        os.makedirs(output_dir, exist_ok=True)
+        summary = {'files': [], 'totalRecords': 0}
+        for user in (range(self.users) if users is None else users):
+            filename = os.path.join(output_dir, f"health_connect_scale_user_{user:05d}.{fmt}")
+            statistics = self.write_user(user, filename, fmt)
+            count = sum(s['count'] for s in statistics.values())
+            summary['files'].append({'file': os.path.basename(filename), 'user': user, 'records': count})
+            summary['totalRecords'] += count
+        return summary
+
+def generate_shard(task: Dict[str, Any]) -> Dict[str, Any]:
+    """1シャード分を生成する (プロセスプールから呼ぶため引数・戻り値は dict)"""
+    started = time.perf_counter()
+    generator = HealthConnectScaleGenerator(seed=task['seed'], **task['options'])
+    statistics = generator.write_shard(range(*task['users']), task['filename'], task['format'])
+    
+    ranges = [s['dateRange'] for s in statistics.values() if s['hasData']]
+    return {
+        'shard': task['shard'],
+        'file': os.path.basename(task['filename']),
+        'users': list(task['users']),
+        'records': sum(s['count'] for s in statistics.values()),
+        'recordCounts': {data_type: s['count'] for data_type, s in statistics.items()},
+        'timeRange': {
+            'earliest': min((r['earliest'] for r in ranges), default=None),
+            'latest': max((r['latest'] for r in ranges), default=None)
+        },
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+def generate_sharded(options: Dict[str, Any], master_seed: int, shards: int, processes: Optional[int] = None,
+                     output_dir: str = '.', fmt: str = 'ndjson') -> str:
+    """ユーザーをシャードに分けてプロセスプールで並列生成し、マニフェストのパスを返す
+    
+    各ユーザーのデータはマスターシードとユーザー番号から決まるため、シャード数を変えても
+    同じユーザーには同じデータが生成される (シャードはユーザーの分け方とファイル数だけを決める)。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    users = options['users']
+    shards = max(1, min(shards, users))
+    tasks = []
+    for shard in range(shards):
+        tasks.append({
+            'shard': shard,
+            'seed': master_seed,
+            'users': (shard * users // shards, (shard + 1) * users // shards),
+            'filename': os.path.join(output_dir, f"health_connect_scale_shard_{shard:04d}.{fmt}"),
+            'format': fmt,
+            'options': options
+        })
+    
+    results = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(generate_shard, task) for task in tasks]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"✅ シャード{result['shard']}: {result['records']:,}件 ({result['seconds']}秒)")
+    results.sort(key=lambda r: r['shard'])
+    
+    end_date = options.get('end_date')
+    manifest = {
+        'createdAt': datetime.datetime.now().isoformat(),
+        'masterSeed': master_seed,
+        'parameters': {
+            'users': users,
+            'days': options.get('days'),
+            'hz': options.get('hz'),
+            'dataTypes': options.get('data_types') or list(HealthConnectScaleGenerator.PROFILES),
+            'endDate': end_date.isoformat() if end_date else None,
+            'chunkSize': options.get('chunk_size'),
+            'vectorized': options.get('vectorized', numpy is not None),
+            'format': fmt
+        },
+        'shardCount': len(results),
+        'totalRecords': sum(r['records'] for r in results),
+        'timeRange': {
+            'earliest': min((r['timeRange']['earliest'] for r in results if r['records']), default=None),
+            'latest': max((r['timeRange']['latest'] for r in results if r['records']), default=None)
+        },
+        'shards': results
+    }
+    manifest_path = os.path.join(output_dir, 'health_connect_scale_manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest_path
+
+def run_scale_mode(args: argparse.Namespace):
+    # 再現性のため、最終日を省略した場合も今日の日付に固定してマニフェストに残す
+    end_date = datetime.date.fromisoformat(args.end_date) if args.end_date else datetime.date.today()
+    options = {
+        'users': args.users, 'days': args.days, 'hz': args.hz, 'data_types': args.types,
+        'chunk_size': args.chunk_size, 'end_date': end_date,
+        # NumPy の有無で生成される値が変わるため、マニフェストに残す
+        'vectorized': numpy is not None and not args.no_numpy
+    }
+    generator = HealthConnectScaleGenerator(seed=args.seed, **options)
+    per_user = sum(generator.count_records(t) for t in generator.data_types)
+    print(f"🔬 大量データ生成: {args.users}ユーザー × {args.days}日 (HeartRate {args.hz}Hz, "
+          f"{'NumPy で一括生成' if generator.vectorized else '1件ずつ生成'})")
+    print(f"📊 予定件数: {per_user * args.users:,}件 (1ユーザーあたり{per_user:,}件)")
+    print("=" * 50)
+    
+    started = time.perf_counter()
+    if args.shards:
+        manifest_path = generate_sharded(options, args.seed, args.shards, args.processes,
+                                         args.output_dir, args.format)
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        file_count = summary['shardCount']
+    else:
+        summary = generator.generate(args.output_dir, args.format)
+        file_count = len(summary['files'])
+    elapsed = time.perf_counter() - started
+    
+    print(f"✅ {file_count}ファイル / {summary['totalRecords']:,}件を生成しました: {args.output_dir}")
+    print(f"⏱️ {elapsed:.1f}秒 ({summary['totalRecords'] / elapsed if elapsed else 0:,.0f} records/s)")
+
 def main():
+    parser = argparse.ArgumentParser(description='Health Connect サンプルデータ生成')
+    parser.add_argument('--scale', action='store_true', help='大量データ生成モード')
+    parser.add_argument('--users', type=int, default=10, help='ユーザー数 (大量データ生成モード)')
+    parser.add_argument('--days', type=int, default=7, help='日数 (大量データ生成モード)')
+    parser.add_argument('--hz', type=float, default=1.0, help='HeartRate のサンプリング周波数')
+    parser.add_argument('--types', nargs='+', default=None,
+                        help=f"データタイプ (デフォルト: {' '.join(HealthConnectScaleGenerator.PROFILES)})")
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='一度に生成する行数')
+    parser.add_argument('--no-numpy', action='store_true',
+                        help='NumPy を使わずに1件ずつ生成する (NumPy で生成した場合とは値が異なる)')
+    parser.add_argument('--end-date', default=None, help='期間の最終日 YYYY-MM-DD (デフォルト: 今日)')
+    parser.add_argument('--format', choices=['ndjson', 'json'], default='ndjson', help='出力形式')
+    parser.add_argument('--output-dir', default='health_connect_scale_data', help='出力先ディレクトリ')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='ユーザーをN個のシャードに分けて並列生成 (シャードごとに1ファイル + マニフェスト)')
+    parser.add_argument('--processes', type=int, default=None, help='並列生成のプロセス数 (デフォルト: CPU数)')
+    args = parser.parse_args()
+    
+    if args.scale:
+        run_scale_mode(args)
+        return
+    
     print("🔬 Health Connect データ構造サンプル生成")
     print("=" * 50)
     
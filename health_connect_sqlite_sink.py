@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Health Connect データ SQLite 出力
+
+抽出したレコードを、アプリ内部DBの統合バイタルデータテーブル (vital_data) と
+互換のスキーマで SQLite に保存します。
+(doc/仕様書/アプリ内部DBテーブル一覧.md の vital_data / 測定項目コード仕様を参照)
+
+- WALモード + バッチ単位のトランザクションで一括書き込み
+- clientRecordId (無い場合は生データのハッシュ) で UPSERT するため、同じ期間を
+  繰り返し取得しても重複しない
+- (data_type, start_time) のインデックスで期間指定の検索が可能
+
+使用方法:
+python health_connect_sqlite_sink.py health_connect_raw_data_YYYYMMDD_HHMMSS.json [--db health_connect.db]
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import sqlite3
+import sys
+from typing import Dict, List, Any, Optional, Iterable
+
+from health_connect_data_extractor import (
+    MEASUREMENT_CODES, UNKNOWN_MEASUREMENT_CODE, load_export, to_epoch_millis, vital_values
+)
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS vital_data (
+        vital_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        data_source_id INTEGER,
+        measurement_code TEXT NOT NULL,
+        measured_start_at TEXT,
+        measured_end_at TEXT,
+        value1 REAL,
+        value2 REAL,
+        value3 REAL,
+        is_manual INTEGER DEFAULT 0,
+        sync_status TEXT DEFAULT 'pending',
+        device_id TEXT NOT NULL DEFAULT '',
+        data_type TEXT NOT NULL,
+        start_time INTEGER,
+        end_time INTEGER,
+        record_key TEXT NOT NULL,
+        client_record_id TEXT,
+        data_origin TEXT,
+        last_modified_time INTEGER,
+        raw_data TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_vital_data_record
+    ON vital_data(device_id, data_type, record_key)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_vital_data_type_start
+    ON vital_data(data_type, start_time)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_vital_data_code_start
+    ON vital_data(measurement_code, measured_start_at)
+    '''
+]
+
+COLUMNS = (
+    'measurement_code', 'measured_start_at', 'measured_end_at', 'value1', 'value2', 'value3',
+    'device_id', 'data_type', 'start_time', 'end_time', 'record_key', 'client_record_id',
+    'data_origin', 'last_modified_time', 'raw_data'
+)
+
+# 同じレコードは更新日時が新しい (または同じ) 場合のみ上書きする
+UPSERT_SQL = f'''
+    INSERT INTO vital_data ({', '.join(COLUMNS)})
+    VALUES ({', '.join('?' for _ in COLUMNS)})
+    ON CONFLICT(device_id, data_type, record_key) DO UPDATE SET
+        {', '.join(f'{c} = excluded.{c}' for c in COLUMNS if c not in ('device_id', 'data_type', 'record_key'))},
+        sync_status = 'pending',
+        updated_at = CURRENT_TIMESTAMP
+    WHERE excluded.last_modified_time IS NULL
+       OR vital_data.last_modified_time IS NULL
+       OR excluded.last_modified_time >= vital_data.last_modified_time
+'''
+
+class SQLiteVitalSink:
+    """抽出データを vital_data 互換テーブルへ書き込む"""
+    
+    def __init__(self, db_path: str = 'health_connect.db', batch_size: int = 5000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # WALでは NORMAL でもコミット済みデータの整合性は保たれる
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+    
+    def __enter__(self) -> 'SQLiteVitalSink':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        self.connection.close()
+    
+    @staticmethod
+    def _iso(millis: Optional[int]) -> Optional[str]:
+        if millis is None:
+            return None
+        return datetime.datetime.fromtimestamp(millis / 1000).isoformat()
+    
+    @staticmethod
+    def record_key(record: Dict[str, Any]) -> str:
+        """clientRecordId があればそれを、無ければ生データのハッシュをレコードの識別子とする"""
+        raw = record.get('rawData') or {}
+        client_record_id = raw.get('client_record_id')
+        if client_record_id:
+            return f"{raw.get('data_origin') or ''}:{client_record_id}"
+        payload = json.dumps(raw, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    
+    def to_row(self, device_id: str, data_type: str, record: Dict[str, Any]) -> tuple:
+        raw = record.get('rawData') or {}
+        start_time = to_epoch_millis(raw.get('start_time') or raw.get('time') or record.get('timestamp'))
+        end_time = to_epoch_millis(raw.get('end_time') or raw.get('time')) or start_time
+        value1, value2, value3 = vital_values(record)
+        return (
+            MEASUREMENT_CODES.get(data_type, UNKNOWN_MEASUREMENT_CODE),
+            self._iso(start_time),
+            self._iso(end_time),
+            value1,
+            value2,
+            value3,
+            device_id or '',
+            data_type,
+            start_time,
+            end_time,
+            self.record_key(record),
+            raw.get('client_record_id'),
+            raw.get('data_origin'),
+            to_epoch_millis(raw.get('last_modified_time')),
+            json.dumps(raw, ensure_ascii=False, separators=(',', ':'))
+        )
+    
+    def write_records(self, device_id: str, data_type: str, records: Iterable[Dict[str, Any]]) -> int:
+        """レコードを batch_size 件ずつのトランザクションで UPSERT し、処理件数を返す"""
+        count = 0
+        batch = []
+        for record in records:
+            batch.append(self.to_row(device_id, data_type, record))
+            if len(batch) >= self.batch_size:
+                count += self._flush(batch)
+                batch = []
+        if batch:
+            count += self._flush(batch)
+        return count
+    
+    def _flush(self, batch: List[tuple]) -> int:
+        with self.connection:
+            self.connection.executemany(UPSERT_SQL, batch)
+        return len(batch)
+    
+    def write_all(self, device_id: str, data: Dict[str, List[Dict[str, Any]]]) -> int:
+        """全データタイプを書き込む"""
+        total = 0
+        for data_type, records in data.items():
+            count = self.write_records(device_id, data_type, records)
+            if count:
+                print(f"✅ {data_type}: {count}件をSQLiteに保存")
+            total += count
+        return total
+    
+    def query_range(self, data_type: str, start_time: int, end_time: int,
+                    device_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """開始時刻 (ミリ秒) が [start_time, end_time) のレコードを取得"""
+        sql = 'SELECT * FROM vital_data WHERE data_type = ? AND start_time >= ? AND start_time < ?'
+        params: List[Any] = [data_type, start_time, end_time]
+        if device_id is not None:
+            sql += ' AND device_id = ?'
+            params.append(device_id)
+        sql += ' ORDER BY start_time'
+        
+        cursor = self.connection.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+def main():
+    parser = argparse.ArgumentParser(description='Health Connect 抽出データを SQLite に保存')
+    parser.add_argument('export_file', help='health_connect_data_extractor.py の出力 (JSON / NDJSON)')
+    parser.add_argument('--db', default='health_connect.db', help='SQLiteデータベースファイル')
+    parser.add_argument('--batch-size', type=int, default=5000, help='1トランザクションあたりの件数')
+    args = parser.parse_args()
+    
+    try:
+        report = load_export(args.export_file)
+    except (OSError, ValueError) as e:
+        print(f"❌ ファイル読み込みエラー: {e}")
+        sys.exit(1)
+    
+    device_id = report.get('extractionInfo', {}).get('deviceId') or ''
+    with SQLiteVitalSink(args.db, args.batch_size) as sink:
+        total = sink.write_all(device_id, report.get('rawData', {}))
+    print(f"💾 {total}件を保存しました: {args.db}")
+
+if __name__ == "__main__":
+    main()
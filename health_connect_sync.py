@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+"""
+Health Connect データ取得 コマンドライン / 常駐同期 (watch モード)
+
+health_connect_data_extractor.py の main() から呼ばれます。対話入力なしで実行できるため、
+cron・タスクスケジューラ・systemd などから定期実行・常駐させられます。
+
+- 1回実行: 指定した端末 (デフォルト: 最初の端末、--all-devices で全端末) から取得して保存
+- --incremental: チェックポイント以降の差分のみ取得し、前回のエクスポートにマージして保存 (1回実行)
+  (マージ後のエクスポートには前回の全レコードが含まれるため、前回のエクスポートは削除する)
+- --watch: 常駐し、--interval 秒ごとに各端末の差分を取得する
+  - `adb track-devices` で端末の接続・切断を監視し、接続された端末はすぐに取得する
+  - 同じ端末の取得は重ならない (前回の取得が終わってから次回を予約する)
+  - 失敗した端末は短い間隔から再試行する (最大 --interval)
+  - --incremental と同じく差分を前回のエクスポートにマージして保存する
+  - 差分は保存・反映 (--sqlite / --rollup / --upload-url) が全て成功してからチェックポイントを進める
+  - SIGTERM / Ctrl+C で実行中の取得の完了を待って終了する。2回目で即時終了する
+    (中断した取得はチェックポイントを進めていないため、次回の起動時にやり直される)
+- 引数なしで端末から実行した場合は、従来どおり取得期間を入力して1回取得する
+
+使用方法:
+python health_connect_data_extractor.py --days 7 [--device SERIAL | --all-devices] [--format ndjson | ndjson.gz [--chunk-mb 64]] [--output-dir DIR]
+python health_connect_data_extractor.py --incremental [--checkpoints FILE] [--sqlite health_connect.db]
+python health_connect_data_extractor.py --watch --interval 300 --output-dir exports --upload-url https://api.example.com --upload-token TOKEN
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Callable
+
+from health_connect_data_extractor import (
+    ADB_PATH, COLUMNAR_FORMAT, OUTPUT_CHUNK_BYTES, ChunkedReportWriter, CheckpointStore, ExtractionMetrics, FleetExtractor,
+    HealthConnectExtractor, HealthRecord, StreamingReportWriter, available_formats, profiling,
+    remove_export, to_epoch_millis, to_record_dict
+)
+from health_connect_rollup import rollup_filename, write_rollups
+from health_connect_sqlite_sink import SQLiteVitalSink
+from health_connect_uploader import VitalsUploader, iter_vital_payloads
+
+def safe_device_id(device_id: str) -> str:
+    """ファイル名に使える端末ID (emulator-5554 / 192.168.0.2:5555 など)"""
+    return device_id.replace(':', '_').replace('/', '_')
+
+def parse_track_devices(payload: str) -> Dict[str, str]:
+    """track-devices の1メッセージ ("シリアル<TAB>状態" の行) を {シリアル: 状態} にする"""
+    states = {}
+    for line in payload.splitlines():
+        parts = line.split('\t')
+        if len(parts) >= 2 and parts[0].strip():
+            states[parts[0].strip()] = parts[1].strip()
+    return states
+
+class DeviceTracker:
+    """`adb track-devices` で端末の接続・切断を監視する
+    
+    一覧が変わるたびに on_change({シリアル: 状態}) を呼ぶ (接続中の全端末の一覧)。
+    adb サーバーの再起動などで track-devices が終了した場合は、待ち時間を伸ばしながら起動し直す。
+    """
+    
+    def __init__(self, on_change: Callable[[Dict[str, str]], None], adb_path: str = ADB_PATH,
+                 max_backoff: float = 30):
+        self.on_change = on_change
+        self.adb_path = adb_path
+        self.max_backoff = max_backoff
+        self.process: Optional[subprocess.Popen] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        backoff = 1.0
+        while not self._stopped.is_set():
+            try:
+                self.process = subprocess.Popen([self.adb_path, 'track-devices'],
+                                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            except OSError as e:
+                print(f"❌ adb track-devices を起動できません: {e}")
+            else:
+                # stop() が起動と入れ違いになった場合
+                if self._stopped.is_set():
+                    self.process.terminate()
+                if self._read(self.process.stdout):
+                    backoff = 1.0
+                self.process.wait()
+            if self._stopped.wait(backoff):
+                break
+            print("🔁 adb track-devices を再起動します")
+            backoff = min(backoff * 2, self.max_backoff)
+    
+    def _read(self, stream) -> bool:
+        """プロセスが終了するまで「16進4桁のバイト数 + 本文」のメッセージを読む。1件以上読めた場合は True"""
+        received = False
+        while True:
+            header = stream.read(4)
+            if len(header) < 4:
+                return received
+            try:
+                length = int(header, 16)
+            except ValueError:
+                return received
+            payload = stream.read(length) if length else b''
+            if len(payload) < length:
+                return received
+            received = True
+            self.on_change(parse_track_devices(payload.decode('utf-8', errors='replace')))
+    
+    def stop(self):
+        self._stopped.set()
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.terminate()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+class SyncSinks:
+    """取得したデータの反映先 (SQLite / ロールアップ / バイタル送信 API)"""
+    
+    def __init__(self, sqlite_path: Optional[str] = None, rollup: bool = False,
+                 uploader: Optional[VitalsUploader] = None):
+        self.sqlite_path = sqlite_path
+        self.rollup = rollup
+        self.uploader = uploader
+        # SQLite の書き込みは端末間で直列化する (同時に書くとロック待ちになるため)
+        self._sqlite_lock = threading.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sqlite_path or self.rollup or self.uploader is not None)
+    
+    def apply(self, device_id: str, data: Dict[str, List[Any]]) -> bool:
+        """SQLite への保存と API への送信 (どちらも同じレコードを再度反映しても重複しない)
+        
+        1つでも失敗した場合は False を返す。
+        """
+        ok = True
+        if self.sqlite_path:
+            try:
+                with self._sqlite_lock, SQLiteVitalSink(self.sqlite_path) as sink:
+                    total = sink.write_all(device_id, data)
+                print(f"💾 {device_id}: {total}件を保存しました: {self.sqlite_path}")
+            except sqlite3.Error as e:
+                print(f"❌ {device_id}: SQLite保存エラー: {e}")
+                ok = False
+        if self.uploader is not None:
+            summary = self.uploader.upload(iter_vital_payloads(device_id, data))
+            ok = ok and not summary['failed']
+        return ok
+    
+    def write_rollup(self, device_id: str, data: Dict[str, List[Any]], filename: str,
+                     previous_file: Optional[str] = None,
+                     full_data: Optional[Dict[str, List[Any]]] = None) -> bool:
+        """ロールアップを保存する
+        
+        previous_file を指定した場合はそのロールアップに差分 data を反映する。previous_file が無い・
+        読み込めない場合は full_data (マージ後のエクスポート全体) から作り直す。
+        """
+        if not self.rollup:
+            return True
+        return write_rollups(data, device_id, filename, previous_file, full_data) is not None
+    
+    def post_process(self, device_id: str, data: Dict[str, List[Any]], export_file: str) -> bool:
+        """1回取得 (全期間) の保存後の反映"""
+        ok = self.apply(device_id, data)
+        return self.write_rollup(device_id, data, rollup_filename(export_file)) and ok
+
+class SyncDaemon:
+    """端末ごとの差分取得を定期実行する (watch モード)
+    
+    端末ごとに次回の取得時刻を管理し、前回の取得が終わってから次回を予約するため
+    同じ端末に対する取得は重ならない。端末ごとの HealthConnectExtractor (adb shell セッション) は
+    切断されるまで使い回す。
+    """
+    
+    def __init__(self, checkpoints: CheckpointStore, sinks: SyncSinks, interval: float = 300,
+                 days_back: int = 30, max_devices: int = 4, max_workers: int = 1,
+                 output_dir: str = '.', fmt: str = 'json', devices: Optional[List[str]] = None,
+                 metrics: Optional[ExtractionMetrics] = None, metrics_file: Optional[str] = None):
+        self.checkpoints = checkpoints
+        self.sinks = sinks
+        self.interval = interval
+        # 失敗した端末の再試行間隔 (失敗が続くと interval まで倍に伸ばす)
+        self.retry_delay = min(30.0, interval)
+        self.days_back = days_back
+        self.max_devices = max_devices
+        self.max_workers = max_workers
+        self.output_dir = output_dir
+        self.fmt = fmt
+        # 対象の端末 (None は接続された全端末)
+        self.allowed = set(devices) if devices else None
+        self.metrics = metrics
+        self.metrics_file = metrics_file
+        self.output_chunk_bytes = OUTPUT_CHUNK_BYTES
+        # ロールアップを作る前に期間レコードの重なりを解消する優先順位 (None で解消しない)
+        self.resolve_priority: Optional[List[str]] = None
+        
+        self.connected: Dict[str, str] = {}
+        self.next_due: Dict[str, float] = {}
+        self.failures: Dict[str, int] = {}
+        self.running: Dict[str, Future] = {}
+        self.extractors: Dict[str, HealthConnectExtractor] = {}
+        self.stop_event = threading.Event()
+        self.wake = threading.Event()
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+    
+    def _position(self, device_id: str, data_type: str) -> tuple:
+        """差分取得の基準 (列名, ウォーターマーク): 更新日時、無い場合 (以前の形式) は開始時刻"""
+        last_modified = self.checkpoints.get_modified_watermark(device_id, data_type)
+        if last_modified is not None:
+            return 'last_modified_time', last_modified
+        return 'start_time', self.checkpoints.get_watermark(device_id, data_type)
+    
+    @staticmethod
+    def _column_time(record: Any, column: str) -> Optional[int]:
+        raw = record.raw if isinstance(record, HealthRecord) else (record.get('rawData') or {}).get
+        if column == 'start_time':
+            return to_epoch_millis(raw('start_time') or raw('time'))
+        return to_epoch_millis(raw(column))
+    
+    @staticmethod
+    def _key(record: Any) -> str:
+        record = to_record_dict(record)
+        return hashlib.sha1(json.dumps(record.get('rawData', record), sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def drop_seen(self, device_id: str, data: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+        """前回の取得の最後のレコード (ウォーターマークと同じ更新日時) を除く
+        
+        差分取得は last_modified_time >= ウォーターマーク (前回の最大更新日時) の範囲を取得するため、
+        その時刻に更新されたレコードは次の取得で再取得される。
+        """
+        result = {}
+        for data_type, records in data.items():
+            keys = self.checkpoints.get_boundary_keys(device_id, data_type)
+            if keys:
+                column, watermark = self._position(device_id, data_type)
+                records = [record for record in records
+                           if self._column_time(record, column) != watermark or self._key(record) not in keys]
+            result[data_type] = records
+        return result
+    
+    def advance_checkpoints(self, device_id: str, data: Dict[str, List[Any]], failed: set,
+                            export_file: Optional[str] = None):
+        """ウォーターマークを進め、次回再取得されるレコードのキーと最新のエクスポートを記録して保存する"""
+        for data_type, records in data.items():
+            if data_type in failed or not records:
+                continue
+            previous = self._position(device_id, data_type)
+            self.checkpoints.advance(device_id, data_type, records)
+            column, watermark = self._position(device_id, data_type)
+            keys = {self._key(record) for record in records if self._column_time(record, column) == watermark}
+            if (column, watermark) == previous:
+                keys |= self.checkpoints.get_boundary_keys(device_id, data_type)
+            self.checkpoints.set_boundary_keys(device_id, data_type, keys)
+        if export_file:
+            self.checkpoints.set_last_export(device_id, export_file)
+        self.checkpoints.save()
+    
+    def _extractor(self, device_id: str) -> Optional[HealthConnectExtractor]:
+        with self._lock:
+            extractor = self.extractors.get(device_id)
+        if extractor is not None:
+            return extractor
+        extractor = HealthConnectExtractor(device_id)
+        extractor.metrics = self.metrics
+        extractor.output_chunk_bytes = self.output_chunk_bytes
+        extractor.resolve_priority = self.resolve_priority
+        if not extractor.check_health_connect():
+            extractor.close()
+            return None
+        with self._lock:
+            self.extractors[device_id] = extractor
+        return extractor
+    
+    def _discard_extractor(self, device_id: str):
+        with self._lock:
+            extractor = self.extractors.pop(device_id, None)
+        if extractor is not None:
+            extractor.close()
+    
+    def write_metrics(self):
+        if self.metrics is not None and self.metrics_file:
+            with self._metrics_lock:
+                self.metrics.write(self.metrics_file)
+    
+    def sync_device(self, device_id: str) -> bool:
+        """1台分の差分取得 → 前回のエクスポートへのマージ → 保存 → 反映 → チェックポイント更新
+        
+        SQLite・API・ロールアップには差分だけを反映する (ロールアップは前回のロールアップファイルに
+        差分を反映し、無い場合のみマージ後のエクスポート全体から作る)。
+        重なりの解消を指定した場合もエクスポートは次回のマージの元になるため取得したままで保存し、
+        ロールアップだけを重なりを解消したデータから作る (重なりは全期間で判定するため毎回作り直す)。
+        保存・反映に失敗した場合は保存したエクスポートを削除する (次回同じ差分を取り直す)。
+        
+        取得を諦めた時間窓があった場合も False を返す (そのデータタイプは次回同じ位置から再取得)。
+        """
+        started = time.perf_counter()
+        extractor = self._extractor(device_id)
+        if extractor is None:
+            return False
+        
+        data = extractor.extract_incremental(self.checkpoints, self.days_back, self.max_workers)
+        data = self.drop_seen(device_id, data)
+        failed = set(extractor.failed_chunks)
+        total = sum(len(records) for records in data.values())
+        if total:
+            export = data
+            previous_file = self.checkpoints.get_last_export(device_id)
+            if previous_file and os.path.exists(previous_file):
+                export = extractor.merge_with_previous_export(data, previous_file)
+                if export is None:
+                    # 読み込めない前回のエクスポートは残し、差分だけを保存する
+                    export = data
+                    previous_file = None
+            else:
+                previous_file = None
+            
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(self.output_dir,
+                                    f"health_connect_raw_data_{safe_device_id(device_id)}_{timestamp}.{self.fmt}")
+            saved = extractor.save_data_to_file(export, filename, self.fmt)
+            if not saved:
+                return False
+            rollup_file = os.path.join(self.output_dir, f"health_connect_rollups_{safe_device_id(device_id)}.json")
+            if self.resolve_priority is not None and self.sinks.rollup:
+                rollup_args = (extractor.resolve_overlaps(export), rollup_file)
+            else:
+                rollup_args = (data, rollup_file, rollup_file, export)
+            if not (self.sinks.apply(device_id, data) and self.sinks.write_rollup(device_id, *rollup_args)):
+                if saved != previous_file:
+                    remove_export(saved)
+                return False
+            
+            # 保存・反映に成功した場合のみウォーターマークを進める
+            self.advance_checkpoints(device_id, data, failed, saved)
+            if previous_file and previous_file != saved:
+                # マージ後のエクスポートに全て含まれている
+                remove_export(previous_file)
+        
+        elapsed = time.perf_counter() - started
+        if self.metrics is not None:
+            self.metrics.observe('sync_seconds', elapsed, device_id)
+        print(f"⏱️ {device_id}: 差分 {total}件 ({elapsed:.1f}秒)"
+              + (f", 取得失敗: {', '.join(sorted(failed))}" if failed else ''))
+        return not failed
+    
+    def _sync_safely(self, device_id: str) -> bool:
+        try:
+            ok = self.sync_device(device_id)
+        except Exception as e:
+            print(f"❌ {device_id}: 同期エラー: {e}")
+            ok = False
+        if self.metrics is not None:
+            self.metrics.add('sync_cycles', 1, device_id)
+            if not ok:
+                self.metrics.add('sync_errors', 1, device_id)
+        if not ok:
+            # セッションが壊れている可能性があるため次回は作り直す
+            self._discard_extractor(device_id)
+        self.write_metrics()
+        return ok
+    
+    def run_once(self, device_ids: List[str]) -> bool:
+        """指定した端末の差分取得を1回ずつ行う (並列)"""
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_devices) as executor:
+                results = list(executor.map(self._sync_safely, device_ids))
+        finally:
+            for device_id in list(self.extractors):
+                self._discard_extractor(device_id)
+        return all(results)
+    
+    def on_devices_changed(self, states: Dict[str, str]):
+        """DeviceTracker から接続中の端末一覧を受け取る"""
+        now = time.monotonic()
+        with self._lock:
+            for serial, state in states.items():
+                if self.allowed is not None and serial not in self.allowed:
+                    continue
+                if self.connected.get(serial) == state:
+                    continue
+                self.connected[serial] = state
+                if state == 'device':
+                    # 接続された端末はすぐに取得する
+                    print(f"🔌 {serial}: 接続されました")
+                    self.next_due[serial] = now
+                    self.failures.pop(serial, None)
+                else:
+                    print(f"⚠️ デバイス {serial}: {state} のため待機")
+            for serial in [s for s in self.connected if s not in states]:
+                print(f"🔌 {serial}: 切断されました")
+                del self.connected[serial]
+                self.next_due.pop(serial, None)
+        self.wake.set()
+    
+    def _reap(self):
+        """終わった取得の結果から次回の取得時刻を決める"""
+        for serial, future in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[serial]
+            ok = future.result()
+            with self._lock:
+                if ok:
+                    self.failures.pop(serial, None)
+                    delay = self.interval
+                else:
+                    self.failures[serial] = self.failures.get(serial, 0) + 1
+                    delay = min(self.retry_delay * 2 ** (self.failures[serial] - 1), self.interval)
+                if serial in self.next_due:
+                    self.next_due[serial] = time.monotonic() + delay
+    
+    def _dispatch(self, executor: ThreadPoolExecutor) -> float:
+        """取得時刻になった端末の取得を開始し、次に確認するまでの秒数を返す"""
+        now = time.monotonic()
+        timeout = self.interval
+        with self._lock:
+            idle = [s for s in self.extractors if s not in self.connected and s not in self.running]
+            due = sorted(self.next_due.items(), key=lambda item: item[1])
+        # 切断された端末のセッションを閉じる
+        for serial in idle:
+            self._discard_extractor(serial)
+        
+        for serial, due_at in due:
+            if self.connected.get(serial) != 'device' or serial in self.running:
+                continue
+            if due_at > now:
+                timeout = min(timeout, due_at - now)
+                continue
+            if len(self.running) >= self.max_devices:
+                # 実行中の取得が終わると wake で起こされる
+                break
+            future = executor.submit(self._sync_safely, serial)
+            future.add_done_callback(lambda _: self.wake.set())
+            self.running[serial] = future
+        return max(timeout, 0)
+    
+    def _handle_signal(self, signum, frame):
+        if self.stop_event.is_set():
+            # 2回目: 取得の完了を待たずに終了する (adb shell は標準入力が閉じられて終了する)
+            print("\n⚠️ 実行中の取得を中断して終了します")
+            sys.stdout.flush()
+            os._exit(1)
+        print(f"\n⏹️ {signal.Signals(signum).name} を受信しました。実行中の取得の完了を待って終了します")
+        self.stop_event.set()
+        self.wake.set()
+    
+    def run(self) -> int:
+        """停止 (SIGTERM / SIGINT) されるまで差分取得を繰り返す"""
+        signals = [signal.SIGINT] + ([signal.SIGTERM] if hasattr(signal, 'SIGTERM') else [])
+        handlers = {signum: signal.signal(signum, self._handle_signal) for signum in signals}
+        tracker = DeviceTracker(self.on_devices_changed)
+        executor = ThreadPoolExecutor(max_workers=self.max_devices)
+        print(f"👀 watch モード開始: {self.interval:g}秒ごとに差分を取得 (同時{self.max_devices}台)")
+        tracker.start()
+        try:
+            while not self.stop_event.is_set():
+                self.wake.clear()
+                self._reap()
+                self.wake.wait(self._dispatch(executor))
+        finally:
+            tracker.stop()
+            executor.shutdown(wait=True)
+            self._reap()
+            for device_id in list(self.extractors):
+                self._discard_extractor(device_id)
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            self.write_metrics()
+        print("👋 watch モードを終了しました")
+        return 0
+
+def prompt_days() -> int:
+    """取得期間を対話入力で指定 (従来の実行方法)"""
+    try:
+        return int(input("取得期間を日数で入力してください (デフォルト: 30): ") or "30")
+    except ValueError:
+        return 30
+
+def select_devices(args: argparse.Namespace) -> Optional[List[str]]:
+    """対象の端末 (見つからない場合は None)"""
+    extractor = HealthConnectExtractor()
+    if not args.device and not args.all_devices:
+        if not extractor.check_adb_connection():
+            return None
+        return [extractor.device_id]
+    try:
+        connected = extractor.list_devices()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        print("❌ ADBコマンドが見つかりません")
+        print("Android SDK Platform Toolsをインストールしてください")
+        return None
+    if args.all_devices:
+        device_ids = connected
+    else:
+        for device_id in args.device:
+            if device_id not in connected:
+                print(f"❌ デバイス {device_id} が接続されていません")
+        device_ids = [device_id for device_id in args.device if device_id in connected]
+    if not device_ids:
+        print("❌ Androidデバイスが接続されていません")
+        return None
+    print(f"✅ デバイス接続確認: {', '.join(device_ids)}")
+    return device_ids
+
+def run_single(args: argparse.Namespace, device_id: str, sinks: SyncSinks,
+               metrics: Optional[ExtractionMetrics]) -> bool:
+    """1台から全期間を取得して保存"""
+    extractor = HealthConnectExtractor(device_id)
+    extractor.metrics = metrics
+    extractor.output_chunk_bytes = args.chunk_mb * 1024 * 1024
+    extractor.resolve_priority = resolve_priority(args)
+    try:
+        if not extractor.check_health_connect():
+            return False
+        filename = args.output
+        if filename is None:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(args.output_dir, f"health_connect_raw_data_{timestamp}.{args.format}")
+        if args.stream:
+            return extractor.stream_all_data_to_file(args.days, filename, args.format) is not None
+        
+        data = extractor.extract_all_data(args.days, args.workers)
+        extractor.print_summary(data)
+        data = extractor.resolve_overlaps(data)
+        saved = extractor.save_data_to_file(data, filename, args.format)
+        if not saved:
+            return False
+        return sinks.post_process(device_id, data, saved) if sinks.enabled else True
+    finally:
+        extractor.close()
+
+def run_fleet(args: argparse.Namespace, device_ids: List[str], sinks: SyncSinks,
+              metrics: Optional[ExtractionMetrics]) -> bool:
+    """複数端末から全期間を並列に取得して保存"""
+    fleet = FleetExtractor(args.max_devices, args.workers, args.output_dir, metrics, args.format,
+                           sinks.post_process if sinks.enabled else None)
+    fleet.device_ids = device_ids
+    fleet.output_chunk_bytes = args.chunk_mb * 1024 * 1024
+    fleet.resolve_priority = resolve_priority(args)
+    results = fleet.extract_all_devices(args.days)
+    fleet.save_fleet_report(results)
+    return all(result['status'] == 'success' for result in results.values())
+
+def resolve_priority(args: argparse.Namespace) -> Optional[List[str]]:
+    """--resolve-overlaps のデータ提供元の優先順位 (未指定は None)"""
+    if args.resolve_overlaps is None:
+        return None
+    return [origin for origin in args.resolve_overlaps.split(',') if origin]
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Health Connect 生データ抽出ツール')
+    target = parser.add_argument_group('取得対象')
+    target.add_argument('--days', type=int, default=None, help='取得期間 (日数、デフォルト: 30)')
+    target.add_argument('--device', action='append', default=[], metavar='SERIAL',
+                        help='取得する端末 (複数指定可、デフォルト: 最初の端末)')
+    target.add_argument('--all-devices', action='store_true', help='接続中の全端末から取得')
+    target.add_argument('--max-devices', type=int, default=4, help='同時に取得する端末数')
+    target.add_argument('--workers', type=int, default=1, help='1台あたりの並列クエリ数')
+    
+    output = parser.add_argument_group('保存')
+    output.add_argument('--format', choices=StreamingReportWriter.FORMATS + ChunkedReportWriter.FORMATS + (COLUMNAR_FORMAT,),
+                        default='json', help='保存形式 (ndjson.gz / ndjson.zst は圧縮して分割し、マニフェストを作成。'
+                                             'npz はデータタイプごとの列指向テーブル)')
+    output.add_argument('--chunk-mb', type=int, default=OUTPUT_CHUNK_BYTES // (1024 * 1024),
+                        help='ndjson.gz / ndjson.zst の1ファイルあたりの圧縮後サイズの目安 (MB)')
+    output.add_argument('--output', default=None, help='保存先ファイル (1台・1回実行時)')
+    output.add_argument('--output-dir', default='.', help='保存先ディレクトリ')
+    output.add_argument('--stream', action='store_true',
+                        help='取得しながらファイルへ直接書き出す (大量データ用、1台・1回実行時)')
+    output.add_argument('--sqlite', default=None, metavar='DB', help='取得したデータを SQLite にも保存')
+    output.add_argument('--rollup', action='store_true', help='時間別・日別ロールアップも保存')
+    output.add_argument('--resolve-overlaps', nargs='?', const='', default=None, metavar='PRIORITY',
+                        help='保存前に期間レコード (歩数・睡眠等) の重なりを解消する。値はデータ提供元の優先順位 '
+                             '(カンマ区切り、先頭ほど優先)。差分取得・watch モードではロールアップにのみ適用')
+    output.add_argument('--upload-url', default=None, help='バイタル一括登録APIのベースURL (指定時は送信する)')
+    output.add_argument('--upload-token', default=os.environ.get('HEALTH_CONNECT_UPLOAD_TOKEN'),
+                        help='APIの認証トークン (デフォルト: 環境変数 HEALTH_CONNECT_UPLOAD_TOKEN)')
+    
+    sync = parser.add_argument_group('差分取得・watch モード')
+    sync.add_argument('--incremental', action='store_true', help='チェックポイント以降の差分のみ取得')
+    sync.add_argument('--checkpoints', default='health_connect_checkpoints.json', help='チェックポイントファイル')
+    sync.add_argument('--watch', action='store_true', help='常駐して差分を定期取得する (--incremental を含む)')
+    sync.add_argument('--interval', type=float, default=300, help='watch モードの取得間隔 (秒)')
+    
+    measure = parser.add_argument_group('計測')
+    measure.add_argument('--metrics-file', default=os.environ.get('HEALTH_CONNECT_METRICS_FILE'),
+                         help='メトリクスの保存先 (.prom なら Prometheus textfile 形式)')
+    measure.add_argument('--profile', default=os.environ.get('HEALTH_CONNECT_PROFILE'),
+                         help='cProfile の結果の保存先')
+    return parser
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.format not in available_formats():
+        parser.error(f"{args.format} 形式には zstandard パッケージが必要です (pip install zstandard)")
+    if args.chunk_mb < 1:
+        parser.error('--chunk-mb は1以上を指定してください')
+    if args.watch and args.interval < 1:
+        parser.error('--interval は1秒以上を指定してください')
+    if (args.stream or args.output) and (args.watch or args.incremental or args.all_devices or len(args.device) > 1):
+        parser.error('--stream / --output は1台の1回実行でのみ指定できます')
+    if args.stream and (args.sqlite or args.rollup or args.upload_url):
+        parser.error('--stream と --sqlite / --rollup / --upload-url は同時に指定できません')
+    if args.format == COLUMNAR_FORMAT and (args.watch or args.incremental):
+        # 差分取得は前回のエクスポートを読み込んでマージするため、レコードに戻せる形式が必要
+        parser.error('npz 形式は差分取得・watch モードでは指定できません')
+    if args.stream and args.resolve_overlaps is not None:
+        parser.error('--stream と --resolve-overlaps は同時に指定できません')
+    
+    print("🔥 Health Connect 生データ抽出ツール")
+    print("=" * 50)
+    
+    metrics = ExtractionMetrics() if args.metrics_file else None
+    uploader = None
+    if args.upload_url:
+        try:
+            uploader = VitalsUploader(args.upload_url, args.upload_token, metrics=metrics)
+        except ValueError as e:
+            parser.error(str(e))
+    sinks = SyncSinks(args.sqlite, args.rollup, uploader)
+    os.makedirs(args.output_dir, exist_ok=True)
+    
+    ok = False
+    try:
+        with profiling(args.profile):
+            if args.watch:
+                daemon = SyncDaemon(CheckpointStore(args.checkpoints), sinks, args.interval, args.days or 30,
+                                    args.max_devices, args.workers, args.output_dir, args.format,
+                                    args.device, metrics, args.metrics_file)
+                daemon.output_chunk_bytes = args.chunk_mb * 1024 * 1024
+                daemon.resolve_priority = resolve_priority(args)
+                ok = daemon.run() == 0
+            else:
+                device_ids = select_devices(args)
+                if device_ids is None:
+                    sys.exit(1)
+                if args.days is None:
+                    # 引数なしで端末から実行した場合のみ入力を求める (従来の実行方法)
+                    args.days = prompt_days() if not argv and sys.stdin.isatty() else 30
+                
+                if args.incremental:
+                    daemon = SyncDaemon(CheckpointStore(args.checkpoints), sinks, days_back=args.days,
+                                        max_devices=args.max_devices, max_workers=args.workers,
+                                        output_dir=args.output_dir, fmt=args.format, metrics=metrics)
+                    daemon.output_chunk_bytes = args.chunk_mb * 1024 * 1024
+                    daemon.resolve_priority = resolve_priority(args)
+                    ok = daemon.run_once(device_ids)
+                elif len(device_ids) > 1:
+                    ok = run_fleet(args, device_ids, sinks, metrics)
+                else:
+                    ok = run_single(args, device_ids[0], sinks, metrics)
+        
+        if not args.watch:
+            # watch モードは取得ごとに保存済み
+            if metrics is not None:
+                metrics.write(args.metrics_file)
+            if ok:
+                print("\n🎉 Health Connect生データ取得完了！")
+    except KeyboardInterrupt:
+        print("\n⏹️ ユーザーによって中断されました")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ 予期しないエラー: {e}")
+        sys.exit(1)
+    finally:
+        if uploader is not None:
+            uploader.close()
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
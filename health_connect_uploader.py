@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Health Connect データ アップロード
+
+抽出したレコードをアプリと同じバイタル一括登録API (POST /api/vitals/batch、
+HDBApp/src/services/api/apiClient.ts の uploadVitalsBatch) の形式に変換して送信します。
+送信データの各項目はアプリが送信する形式 (VitalDataService.ts の uploadToVitalAWS:
+type, value, value2, unit, measuredAt, source, localId) に合わせています。
+サーバー側 (mockApi.ts の uploadVitalsBatch) で type から測定項目コード、
+value / systolic から value1、localId から id が決まります。
+
+- 件数・サイズの上限でバッチに分割し、複数スレッドで並列送信
+- スレッドごとに keep-alive の HTTP 接続を使い回す (接続プール)
+- 接続エラー・429・5xx は指数バックオフで再試行
+- バッチ内のレコードIDから決まる Idempotency-Key を付与するため、
+  再試行・再実行で同じバッチが二重に登録されない
+- --serve で動作確認用の代替サーバー (同じAPIを受け付けるローカルHTTPサーバー) を起動
+
+使用方法:
+python health_connect_uploader.py health_connect_raw_data_YYYYMMDD_HHMMSS.json --url http://localhost:8080 [--token TOKEN]
+python health_connect_uploader.py --serve 8080
+"""
+
+import argparse
+import datetime
+import hashlib
+import http.client
+import http.server
+import json
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Any, Optional, Iterable, Iterator
+
+from health_connect_data_extractor import (
+    MEASUREMENT_CODES, UNKNOWN_MEASUREMENT_CODE, ExtractionMetrics,
+    load_export, to_epoch_millis, to_record_dict, vital_values
+)
+from health_connect_sqlite_sink import SQLiteVitalSink
+
+BATCH_ENDPOINT = '/api/vitals/batch'
+SOURCE = 'health_connect'
+# 再試行するHTTPステータス
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# データタイプごとの API の type (VitalDataService.ts の convertTypeToApiFormat と同じ名前)
+VITAL_API_TYPES = {
+    'Steps': 'steps',
+    'Weight': 'weight',
+    'BodyFat': 'bodyFat',
+    'BloodPressure': 'bloodPressure',
+    'HeartRate': 'heartRate',
+    'RestingHeartRate': 'heartRate',
+    'BodyTemperature': 'temperature'
+}
+# type ごとの測定項目コード (代替サーバーで使用、mockApi.ts の convertTypeToMeasurementCode と同じ)
+API_MEASUREMENT_CODES = {VITAL_API_TYPES[data_type]: code for data_type, code in MEASUREMENT_CODES.items()}
+API_MEASUREMENT_CODES['pulse'] = MEASUREMENT_CODES['HeartRate']
+
+def iso_utc(millis: Optional[int]) -> Optional[str]:
+    """エポックミリ秒をアプリと同じ ISO 8601 (UTC, toISOString 形式) に変換"""
+    if millis is None:
+        return None
+    moment = datetime.datetime.fromtimestamp(millis / 1000, datetime.timezone.utc)
+    return moment.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+def api_type(data_type: str) -> str:
+    """データタイプを API の type に変換 (対応表に無いものは先頭を小文字にした名前)"""
+    return VITAL_API_TYPES.get(data_type) or data_type[:1].lower() + data_type[1:]
+
+def to_vital_payload(device_id: str, data_type: str, record: Any) -> Dict[str, Any]:
+    """レコードを uploadVitalsBatch の送信形式に変換
+    
+    localId は端末ID・データタイプ・レコードの識別子 (SQLite 出力と同じ) から決まるため、
+    同じレコードは何度送信しても同じ id で登録される。
+    """
+    record = to_record_dict(record)
+    raw = record.get('rawData') or {}
+    measured_at = to_epoch_millis(raw.get('start_time') or raw.get('time') or record.get('timestamp'))
+    value1, value2, value3 = vital_values(record)
+    value = record.get('value')
+    key = f"{device_id}:{data_type}:{SQLiteVitalSink.record_key(record)}"
+    payload = {
+        'type': api_type(data_type),
+        'value': value1,
+        'value2': value2,
+        'value3': value3,
+        'unit': value.get('unit') if isinstance(value, dict) else None,
+        'measuredAt': iso_utc(measured_at),
+        'source': SOURCE,
+        'device': device_id or 'smartphone',
+        'localId': 'hc-' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+    }
+    if data_type == 'BloodPressure':
+        payload['systolic'] = value1
+        payload['diastolic'] = value2
+    return payload
+
+def iter_vital_payloads(device_id: str, data: Dict[str, List[Any]]) -> Iterator[Dict[str, Any]]:
+    """全データタイプのレコードを送信形式に変換して返す"""
+    for data_type, records in data.items():
+        for record in records:
+            yield to_vital_payload(device_id, data_type, record)
+
+def validate_vital(vital: Any) -> Optional[str]:
+    """送信形式の1件を検証し、不正な場合は理由を返す"""
+    if not isinstance(vital, dict):
+        return 'オブジェクトではありません'
+    if not isinstance(vital.get('type'), str) or not vital['type']:
+        return 'type がありません'
+    if not isinstance(vital.get('localId'), str) or not vital['localId']:
+        return 'localId がありません'
+    primary = vital.get('systolic') if vital['type'] == 'bloodPressure' else None
+    if primary is None:
+        primary = vital.get('value')
+    for name, item in (('value', primary), ('value2', vital.get('value2')), ('value3', vital.get('value3'))):
+        if item is not None and (isinstance(item, bool) or not isinstance(item, (int, float))):
+            return f"{name} が数値ではありません"
+    if not isinstance(vital.get('measuredAt'), str) or to_epoch_millis(vital['measuredAt']) is None:
+        return 'measuredAt が日時ではありません'
+    return None
+
+class UploadError(Exception):
+    """再試行しても送信できなかったバッチ"""
+
+class VitalsUploader:
+    """バイタル一括登録APIへのバッチ送信 (keep-alive 接続の使い回し・並列送信・再試行)"""
+    
+    def __init__(self, base_url: str, token: Optional[str] = None, batch_size: int = 500,
+                 max_batch_bytes: int = 1024 * 1024, workers: int = 4, max_retries: int = 5,
+                 backoff: float = 0.5, timeout: float = 30,
+                 metrics: Optional[ExtractionMetrics] = None):
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise ValueError(f"未対応のURLです: {base_url}")
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.path = url.path.rstrip('/') + BATCH_ENDPOINT
+        self.token = token
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.metrics = metrics
+        # 空いている接続 (送信中でない keep-alive 接続)
+        self._connections: queue.LifoQueue = queue.LifoQueue()
+    
+    def __enter__(self) -> 'VitalsUploader':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                break
+    
+    def _acquire(self) -> http.client.HTTPConnection:
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            if self.scheme == 'https':
+                return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+    
+    def _release(self, connection: http.client.HTTPConnection):
+        self._connections.put(connection)
+    
+    def iter_batches(self, payloads: Iterable[Dict[str, Any]]) -> Iterator[List[tuple]]:
+        """件数 (batch_size) とリクエストサイズ (max_batch_bytes) の上限でバッチに分割
+        
+        各要素は (id, エンコード済みのJSON) で返す (送信時に再エンコードしない)。
+        """
+        batch: List[tuple] = []
+        size = 0
+        for payload in payloads:
+            item = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            if batch and (len(batch) >= self.batch_size or size + len(item) + 1 > self.max_batch_bytes):
+                yield batch
+                batch = []
+                size = 0
+            batch.append((payload['localId'], item))
+            size += len(item) + 1
+        if batch:
+            yield batch
+    
+    @staticmethod
+    def idempotency_key(ids: List[str]) -> str:
+        """バッチ内のレコードIDから決まる冪等キー (同じバッチの再送信は同じキーになる)"""
+        return hashlib.sha256('\n'.join(ids).encode('utf-8')).hexdigest()
+    
+    def _record_metric(self, name: str, value: float = 1):
+        if self.metrics is not None:
+            self.metrics.add(name, value)
+    
+    def send_batch(self, batch: List[tuple]) -> Dict[str, Any]:
+        """1バッチを送信し、APIのレスポンスを返す (失敗時は UploadError)"""
+        body = b'{"vitals":[' + b','.join(item for _, item in batch) + b']}'
+        ids = [vital_id for vital_id, _ in batch]
+        headers = {
+            'Content-Type': 'application/json',
+            'Idempotency-Key': self.idempotency_key(ids),
+            'Connection': 'keep-alive'
+        }
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._record_metric('upload_retries')
+                # 指数バックオフ (同時に再試行が集中しないよう揺らぎを加える)
+                delay = self.backoff * (2 ** (attempt - 1))
+                retry_after = getattr(error, 'retry_after', None)
+                time.sleep(max(delay * random.uniform(0.5, 1.5), retry_after or 0))
+            
+            connection = self._acquire()
+            started = time.perf_counter()
+            try:
+                connection.request('POST', self.path, body=body, headers=headers)
+                response = connection.getresponse()
+                payload = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                # 切断された keep-alive 接続は作り直す
+                connection.close()
+                error = UploadError(f"接続エラー: {e}")
+                continue
+            finally:
+                if self.metrics is not None:
+                    self.metrics.observe('upload_seconds', time.perf_counter() - started)
+            
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            
+            if response.status in RETRY_STATUSES:
+                error = UploadError(f"HTTP {response.status}")
+                try:
+                    error.retry_after = float(response.getheader('Retry-After') or 0)
+                except ValueError:
+                    error.retry_after = None
+                continue
+            try:
+                result = json.loads(payload or b'{}')
+            except ValueError:
+                result = {}
+            if response.status >= 400 or result.get('success') is False:
+                # 認証エラー・不正なデータ等は再試行しても成功しない
+                raise UploadError(f"HTTP {response.status}: {result.get('error') or result.get('message') or ''}")
+            self._record_metric('upload_batches')
+            self._record_metric('records_uploaded', len(batch))
+            self._record_metric('bytes_uploaded', len(body))
+            return result
+        
+        raise UploadError(f"{self.max_retries}回再試行しましたが送信できませんでした ({error})")
+    
+    def upload(self, payloads: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """全レコードをバッチに分けて並列送信し、結果の集計を返す
+        
+        送信待ちのバッチは workers の2倍までに抑えるため、大量のレコードでも
+        全バッチをメモリに保持しない。
+        """
+        summary = {'batches': 0, 'uploaded': 0, 'failed': 0, 'failedBatches': []}
+        started = time.perf_counter()
+        
+        def collect(future, size):
+            summary['batches'] += 1
+            try:
+                future.result()
+                summary['uploaded'] += size
+            except UploadError as e:
+                summary['failed'] += size
+                summary['failedBatches'].append({'records': size, 'error': str(e)})
+                print(f"❌ バッチ送信エラー: {e}")
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+            for batch in self.iter_batches(payloads):
+                if len(pending) >= self.workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future, pending.pop(future))
+                pending[executor.submit(self.send_batch, batch)] = len(batch)
+            for future in list(pending):
+                collect(future, pending.pop(future))
+        
+        elapsed = time.perf_counter() - started
+        summary['seconds'] = round(elapsed, 3)
+        print(f"📤 {summary['uploaded']}件を送信 ({summary['batches']}バッチ, {elapsed:.2f}秒)"
+              + (f", 失敗 {summary['failed']}件" if summary['failed'] else ''))
+        return summary
+
+class StandInVitalsServer(http.server.ThreadingHTTPServer):
+    """動作確認用の代替サーバー (POST /api/vitals/batch のみ)
+    
+    受け付けたレコードは送信形式を検証し、mockApi.ts と同じ登録形式 (code / value1〜3 等) に
+    変換して id (= localId) ごとに保持する (同じ id は上書き)。不正なレコードを含むリクエストは 400 を返す。
+    同じ Idempotency-Key のリクエストには最初のレスポンスをそのまま返す。
+    fail_rate を指定すると、その確率で 503 を返す (再試行の確認用)。
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, address: tuple, fail_rate: float = 0.0):
+        super().__init__(address, StandInVitalsHandler)
+        self.fail_rate = fail_rate
+        self.vitals: Dict[str, Dict[str, Any]] = {}
+        self.responses: Dict[str, bytes] = {}
+        self.requests = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+
+class StandInVitalsHandler(http.server.BaseHTTPRequestHandler):
+    # keep-alive に対応する
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    @staticmethod
+    def to_stored_vital(vital: Dict[str, Any], synced_at: str) -> Dict[str, Any]:
+        """送信形式を mockApi.ts の uploadVitalsBatch と同じ登録形式に変換"""
+        is_manual = vital.get('source') in ('manual', 'user_input')
+        vital_type = vital['type']
+        code = API_MEASUREMENT_CODES.get(vital_type, UNKNOWN_MEASUREMENT_CODE)
+        if vital_type == 'steps' and is_manual:
+            code = '1001'
+        blood_pressure = vital_type == 'bloodPressure'
+        value1 = vital.get('systolic') if blood_pressure else None
+        value2 = vital.get('diastolic') if blood_pressure else None
+        return {
+            'id': vital['localId'],
+            'code': code,
+            'start_time': vital['measuredAt'],
+            'end_time': vital['measuredAt'],
+            'value1': value1 if value1 is not None else vital.get('value') or 0,
+            'value2': value2 if value2 is not None else vital.get('value2'),
+            'value3': vital.get('value3'),
+            'intraday': vital.get('intraday') or False,
+            'source': vital.get('source') or 'manual',
+            'device': vital.get('device') or 'smartphone',
+            'deleted': vital.get('deleted') or False,
+            'unit': vital.get('unit'),
+            'syncedAt': synced_at,
+            'syncStatus': 'synced'
+        }
+    
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+        if urllib.parse.urlsplit(self.path).path != BATCH_ENDPOINT:
+            self._send(404, b'{"success":false,"error":"Not Found"}')
+            return
+        if server.fail_rate and random.random() < server.fail_rate:
+            self._send(503, b'{"success":false,"error":"Service Unavailable"}', {'Retry-After': '0'})
+            return
+        
+        key = self.headers.get('Idempotency-Key')
+        with server.lock:
+            if key and key in server.responses:
+                self._send(200, server.responses[key], {'Idempotent-Replayed': 'true'})
+                return
+        try:
+            vitals = json.loads(body)['vitals']
+        except (ValueError, KeyError, TypeError):
+            self._send(400, b'{"success":false,"error":"Invalid payload"}')
+            return
+        if not isinstance(vitals, list):
+            self._send(400, b'{"success":false,"error":"Invalid payload"}')
+            return
+        for index, vital in enumerate(vitals):
+            reason = validate_vital(vital)
+            if reason:
+                error = json.dumps({'success': False, 'error': f"vitals[{index}]: {reason}"}, ensure_ascii=False)
+                self._send(400, error.encode('utf-8'))
+                return
+        
+        synced_at = iso_utc(int(time.time() * 1000))
+        stored = [self.to_stored_vital(vital, synced_at) for vital in vitals]
+        with server.lock:
+            for vital in stored:
+                server.vitals[vital['id']] = vital
+            response = json.dumps({
+                'success': True,
+                'data': {
+                    'uploadedCount': len(stored),
+                    'failedCount': 0,
+                    'syncedAt': synced_at,
+                    'processedIds': [vital['id'] for vital in stored],
+                    'specification': 'v2.0'
+                }
+            }).encode('utf-8')
+            if key:
+                server.responses[key] = response
+        self._send(200, response)
+
+def upload_export(filename: str, base_url: str, token: Optional[str] = None, **options) -> Optional[Dict[str, Any]]:
+    """エクスポートファイル (JSON / NDJSON) の全レコードを送信"""
+    try:
+        report = load_export(filename)
+    except (OSError, ValueError) as e:
+        print(f"❌ ファイル読み込みエラー: {e}")
+        return None
+    device_id = report.get('extractionInfo', {}).get('deviceId') or ''
+    with VitalsUploader(base_url, token, **options) as uploader:
+        return uploader.upload(iter_vital_payloads(device_id, report.get('rawData', {})))
+
+def main():
+    parser = argparse.ArgumentParser(description='Health Connect 抽出データをバイタル一括登録APIへ送信')
+    parser.add_argument('export_files', nargs='*', help='health_connect_data_extractor.py の出力 (JSON / NDJSON)')
+    parser.add_argument('--url', default='http://localhost:8080', help='APIのベースURL')
+    parser.add_argument('--token', default=None, help='認証トークン (Authorization: Bearer)')
+    parser.add_argument('--batch-size', type=int, default=500, help='1リクエストあたりの最大件数')
+    parser.add_argument('--max-batch-bytes', type=int, default=1024 * 1024, help='1リクエストあたりの最大バイト数')
+    parser.add_argument('--workers', type=int, default=4, help='並列送信数 (同時接続数)')
+    parser.add_argument('--max-retries', type=int, default=5, help='1バッチあたりの最大再試行回数')
+    parser.add_argument('--serve', type=int, default=None, metavar='PORT',
+                        help='代替サーバーを起動する (送信は行わない)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='代替サーバーが 503 を返す確率')
+    args = parser.parse_args()
+    
+    if args.serve is not None:
+        server = StandInVitalsServer(('127.0.0.1', args.serve), args.fail_rate)
+        print(f"🔥 代替サーバーを起動しました: http://127.0.0.1:{args.serve}{BATCH_ENDPOINT}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print(f"\n⏹️ 停止しました (受信 {len(server.vitals)}件, {server.requests}リクエスト)")
+        return
+    
+    if not args.export_files:
+        parser.error('送信するファイルを指定してください')
+    failed = False
+    for filename in args.export_files:
+        summary = upload_export(
+            filename, args.url, args.token,
+            batch_size=args.batch_size, max_batch_bytes=args.max_batch_bytes,
+            workers=args.workers, max_retries=args.max_retries
+        )
+        failed = failed or summary is None or summary['failed'] > 0
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()